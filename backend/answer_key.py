@@ -0,0 +1,98 @@
+from typing import Optional
+
+from response_cache import ResponseCache, cache_key
+
+# ==========================================
+# SERVER-SIDE ANSWER KEYS (LOCAL GRADING)
+# ==========================================
+# Role: Grades multiple-choice answers without an auditor round trip.
+# Logic: The Instructional Architect now also returns the index of the
+# correct option, the source sentence that supports it and a one-line
+# explanation. Those fields are stripped from the scenario before it is
+# sent to the client and stored here under a quiz_id (a hash of the chunk,
+# question and options), in the same two-tier store the response cache
+# uses, so keys survive restarts. /evaluate_answer with a quiz_id and one
+# of the listed options is graded by comparison. The Compliance Auditor
+# is only called for rich feedback, free-text answers, or scenarios
+# without a usable key (placeholders, older cached scenarios). The source
+# sentence is only used as the citation when it really occurs in the chunk
+# (whitespace-normalised substring match); otherwise the verdict carries
+# no citation rather than a made-up quote.
+# ------------------------------------------------------------------
+ANSWER_KEY_FIELDS = ("correct_option", "source_span", "explanation")
+
+def _norm(text) -> str:
+    return " ".join(str(text).split()).casefold()
+
+def supported_span(span, context_text: str) -> Optional[str]:
+    """`span` (whitespace-normalised) if it occurs in `context_text`, else None."""
+    span = " ".join(str(span or "").split())
+    if not span or span not in " ".join(context_text.split()):
+        return None
+    return span
+
+def correct_index(quiz_data: dict) -> Optional[int]:
+    # The model usually returns the index, but sometimes repeats the option text instead
+    options = quiz_data.get("options") or []
+    correct = quiz_data.get("correct_option")
+    if isinstance(correct, int) and not isinstance(correct, bool):
+        return correct if 0 <= correct < len(options) else None
+    if isinstance(correct, str):
+        matches = [i for i, option in enumerate(options) if _norm(option) == _norm(correct)]
+        if matches:
+            return matches[0]
+        if correct.strip().isdigit() and int(correct) < len(options):
+            return int(correct)
+    return None
+
+class AnswerKeyStore:
+    def __init__(self, name: str):
+        self._keys = ResponseCache(name)
+        self.counters = {"registered": 0, "local_grades": 0, "ungradable": 0, "unsupported_spans": 0}
+
+    def register(self, quiz_data: dict, context_text: str):
+        """
+        Splits a generated scenario into (public scenario, quiz_id).
+        quiz_id is None when the scenario carries no usable answer key.
+        """
+        public = {k: v for k, v in quiz_data.items() if k not in ANSWER_KEY_FIELDS}
+        correct = correct_index(quiz_data)
+        if correct is None:
+            return public, None
+        options = quiz_data["options"]
+        quiz_id = cache_key(context_text, quiz_data.get("question", ""), options)
+        # Cached and pooled scenarios come through here again; only the first sighting is written
+        if self._keys.get(quiz_id) is None:
+            citation = supported_span(quiz_data.get("source_span"), context_text)
+            if citation is None and quiz_data.get("source_span"):
+                self.counters["unsupported_spans"] += 1
+            self._keys.put(quiz_id, {
+                "options": options,
+                "correct_option": correct,
+                # Verified against the chunk; None when the model's quote isn't in it
+                "citation": citation,
+                "explanation": str(quiz_data.get("explanation") or ""),
+            })
+            self.counters["registered"] += 1
+        return public, quiz_id
+
+    def grade(self, quiz_id: Optional[str], selected_option: str) -> Optional[dict]:
+        """Verdict in the auditor's shape, or None when the answer can't be graded locally."""
+        key = self._keys.get(quiz_id) if quiz_id else None
+        chosen = [i for i, option in enumerate(key["options"]) if _norm(option) == _norm(selected_option)] if key else []
+        if not chosen:
+            # Unknown / expired quiz, or a free-text answer that isn't one of the options
+            self.counters["ungradable"] += 1
+            return None
+        self.counters["local_grades"] += 1
+        return {
+            "is_correct": key["correct_option"] in chosen,
+            "feedback": key["explanation"],
+            # Keys stored before spans were checked have no "citation" and cite nothing
+            "citation": key.get("citation"),
+            "correct_option": key["options"][key["correct_option"]],
+            "graded_by": "answer_key",
+        }
+
+    def stats(self) -> dict:
+        return {**self.counters, "store": self._keys.stats()}
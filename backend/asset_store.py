@@ -0,0 +1,211 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from typing import Optional
+
+from generated_images import GENERATED_SUBDIR
+from ingest_cache import INGEST_CACHE_DIR
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# SIZE-BUDGETED STATIC ASSET STORE
+# ==========================================
+# Role: Keeps static_images under a disk budget without wiping it on restart.
+# Logic: An asset is a document folder (<document_id>/: extracted images
+# and their variants, evicted as a unit) or one generated diagram
+# (generated/<xx>/<key>.png). A compact index keeps [size, last access,
+# mtime] per asset; /static hits, cache hits and new writes refresh the
+# last access. When the total goes over STATIC_DISK_BUDGET_MB the least
+# recently used assets are deleted, except folders of documents that are
+# live (loaded in the corpus or still ingesting). An evicted diagram is
+# simply drawn again; an evicted document is re-extracted on re-upload.
+# The index is saved next to the ingestion cache (ASSET_INDEX_PATH), never
+# under the served root: it is mutable and lists every document ID. At startup it is
+# reconciled with a single scandir pass: a folder whose mtime hasn't
+# changed keeps its recorded size instead of being walked again.
+# ------------------------------------------------------------------
+STATIC_DISK_BUDGET_MB = int(os.getenv("STATIC_DISK_BUDGET_MB", "2048"))
+ASSET_INDEX_PATH = os.getenv("ASSET_INDEX_PATH", os.path.join(INGEST_CACHE_DIR, "asset_index.json"))
+# Where earlier versions kept the index (inside the served root); removed at startup
+LEGACY_INDEX_FILE = ".asset_index.json"
+INDEX_FLUSH_SECONDS = 30
+
+SIZE, LAST_ACCESS, MTIME = 0, 1, 2
+
+def _tree_size(path: str) -> int:
+    total = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                total += _tree_size(entry.path)
+            else:
+                total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+class AssetStore:
+    def __init__(self, root: str, budget_bytes: int = STATIC_DISK_BUDGET_MB * 1024 * 1024, pinned=None,
+                 index_path: str = ASSET_INDEX_PATH):
+        """`pinned()` returns the asset keys (document IDs) that must never be evicted."""
+        self.root = root
+        self.index_path = index_path
+        self.budget_bytes = budget_bytes
+        self.pinned = pinned or (lambda: set())
+        self._assets = {}  # { key: [size, last_access, mtime_ns] }
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+        self._dirty = False
+        self.counters = {"evicted": 0, "evicted_bytes": 0, "rebuild_ms": 0}
+        os.makedirs(root, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        try:
+            os.remove(os.path.join(root, LEGACY_INDEX_FILE))
+        except OSError:
+            pass
+        self.rebuild()
+
+    def asset_key(self, relpath: str) -> Optional[str]:
+        """Asset a file under the root belongs to, or None (index file, temp files...)."""
+        parts = relpath.replace(os.sep, "/").strip("/").split("/")
+        if not parts[0] or parts[0].startswith(".") or parts[-1].endswith(".tmp"):
+            return None
+        if parts[0] == GENERATED_SUBDIR:
+            return "/".join(parts) if len(parts) == 3 else None
+        return parts[0]
+
+    def rebuild(self):
+        """Reconciles the saved index with what is actually on disk."""
+        started = time.perf_counter()
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                previous = json.load(f).get("assets", {})
+        except (OSError, ValueError):
+            previous = {}
+
+        assets = {}
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False) or entry.name.startswith("."):
+                    continue
+                if entry.name == GENERATED_SUBDIR:
+                    for shard in os.scandir(entry.path):
+                        if not shard.is_dir(follow_symlinks=False):
+                            continue
+                        for image in os.scandir(shard.path):
+                            key = self.asset_key(f"{GENERATED_SUBDIR}/{shard.name}/{image.name}")
+                            if key is None:
+                                continue
+                            st = image.stat(follow_symlinks=False)
+                            last_access = previous.get(key, [0, st.st_mtime])[LAST_ACCESS]
+                            assets[key] = [st.st_size, last_access, st.st_mtime_ns]
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                old = previous.get(entry.name)
+                # Files are only ever added / removed (never rewritten in place), so an
+                # unchanged folder mtime means an unchanged size
+                size = old[SIZE] if old and old[MTIME] == st.st_mtime_ns else _tree_size(entry.path)
+                assets[entry.name] = [size, old[LAST_ACCESS] if old else st.st_mtime, st.st_mtime_ns]
+
+        with self._lock:
+            self._assets = assets
+            self._dirty = True
+            self.counters["rebuild_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"🗄️ [ASSETS] Indexed {len(assets)} assets ({self.total_bytes() / 2**20:.1f} MB) "
+                    f"in {self.counters['rebuild_ms']} ms")
+        self.flush(force=True)
+
+    def touch(self, key: Optional[str]):
+        with self._lock:
+            entry = self._assets.get(key)
+            if entry is None:
+                return
+            entry[LAST_ACCESS] = time.time()
+            self._dirty = True
+        self.flush()
+
+    def touch_path(self, full_path):
+        """Marks the asset a served file belongs to as just used (StaticFiles hook)."""
+        self.touch(self.asset_key(os.path.relpath(full_path, self.root)))
+
+    def record(self, key: str):
+        """(Re)measures an asset after it was written, then enforces the budget around it."""
+        path = os.path.join(self.root, key)
+        try:
+            st = os.stat(path)
+            size = _tree_size(path) if os.path.isdir(path) else st.st_size
+        except OSError:
+            return
+        with self._lock:
+            self._assets[key] = [size, time.time(), st.st_mtime_ns]
+            self._dirty = True
+        self.enforce(protect=key)
+
+    def enforce(self, protect: Optional[str] = None) -> int:
+        """Evicts least recently used, unpinned assets until the store fits its budget. Returns bytes freed."""
+        pinned = set(self.pinned())
+        if protect:
+            pinned.add(protect)
+        victims = []
+        with self._lock:
+            total = sum(entry[SIZE] for entry in self._assets.values())
+            if total <= self.budget_bytes:
+                return 0
+            for key, entry in sorted(self._assets.items(), key=lambda item: item[1][LAST_ACCESS]):
+                if total <= self.budget_bytes:
+                    break
+                if key in pinned:
+                    continue
+                del self._assets[key]
+                total -= entry[SIZE]
+                victims.append((key, entry[SIZE]))
+            self._dirty = True
+
+        freed = 0
+        for key, size in victims:
+            path = os.path.join(self.root, key)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                logger.warning(f"Asset eviction failed for {key}: {e}")
+                continue
+            freed += size
+            logger.info(f"🧹 [ASSETS] Evicted {key} ({size / 2**20:.1f} MB)")
+        with self._lock:
+            self.counters["evicted"] += len(victims)
+            self.counters["evicted_bytes"] += freed
+        if total > self.budget_bytes:
+            logger.warning(f"⚠️ [ASSETS] Still {total / 2**20:.1f} MB after eviction: the rest is pinned")
+        self.flush(force=True)
+        return freed
+
+    def flush(self, force: bool = False):
+        """Saves the index (at most every INDEX_FLUSH_SECONDS unless forced)."""
+        with self._lock:
+            if not self._dirty or (not force and time.time() - self._last_flush < INDEX_FLUSH_SECONDS):
+                return
+            data = json.dumps({"assets": self._assets}, separators=(",", ":"))
+            self._dirty = False
+            self._last_flush = time.time()
+            tmp_path = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.index_path)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(entry[SIZE] for entry in self._assets.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "assets": len(self._assets),
+                "bytes": sum(entry[SIZE] for entry in self._assets.values()),
+                "budget_bytes": self.budget_bytes,
+                **self.counters,
+            }
@@ -0,0 +1,73 @@
+import os
+import json
+import random
+
+# ==========================================
+# BATCH SCENARIO GENERATION
+# ==========================================
+# Role: Builds exams without one upstream call per question.
+# Logic: Chunks are sampled for the requested count and grouped, several
+# per prompt; the Instructional Architect writes one scenario per numbered
+# source segment and returns them as a single JSON array. Role, schema and
+# instructions are paid for once per group instead of once per question,
+# and groups run concurrently. Parsed scenarios are fanned back out to the
+# chunk they came from.
+# ------------------------------------------------------------------
+BATCH_MAX_COUNT = int(os.getenv("BATCH_MAX_COUNT", "100"))
+# Source segments per upstream call; bounded by the model's context window
+BATCH_CHUNKS_PER_CALL = int(os.getenv("BATCH_CHUNKS_PER_CALL", "5"))
+
+SCENARIO_KEYS = ("scenario", "question", "options", "visual_query")
+
+def sample_chunks(chunks: list[dict], count: int) -> list[dict]:
+    """`count` chunks, all distinct while the document has enough of them."""
+    if count <= len(chunks):
+        return random.sample(chunks, count)
+    return random.sample(chunks, len(chunks)) + random.choices(chunks, k=count - len(chunks))
+
+def group(items: list, size: int = BATCH_CHUNKS_PER_CALL) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def build_batch_prompt(chunks: list[dict], target_language: str) -> str:
+    segments = "\n\n".join(f"[{i}] {chunk['text']}" for i, chunk in enumerate(chunks))
+    return f"""
+    TASK: Create one technical multiple-choice scenario for EACH numbered source segment below.
+    TARGET LANGUAGE: {target_language}
+
+    Exactly one option is correct; "correct_option" is its index in "options".
+
+    OUTPUT: a JSON array with exactly {len(chunks)} objects, in segment order:
+    [
+        {{
+            "source": 0,
+            "scenario": "Scenario description in {target_language}...",
+            "question": "Question in {target_language}...",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "correct_option": 0,
+            "source_span": "The sentence of the segment that proves the answer, copied verbatim",
+            "explanation": "Why that option is correct, in {target_language}",
+            "visual_query": "3 keywords in ENGLISH for a diagram"
+        }}
+    ]
+
+    SOURCE SEGMENTS:
+    {segments}
+    """
+
+def parse_batch_response(raw_text: str, n_sources: int) -> dict:
+    """{ source_index: scenario } for every well-formed scenario in the reply."""
+    start, end = raw_text.find("["), raw_text.rfind("]")
+    if start < 0 or end <= start:
+        return {}
+    try:
+        items = json.loads(raw_text[start:end + 1])
+    except ValueError:
+        return {}
+    scenarios = {}
+    for position, item in enumerate(items if isinstance(items, list) else []):
+        if not isinstance(item, dict) or not all(k in item for k in SCENARIO_KEYS):
+            continue
+        source = item.pop("source", position)
+        if isinstance(source, int) and 0 <= source < n_sources and source not in scenarios:
+            scenarios[source] = item
+    return scenarios
@@ -0,0 +1,72 @@
+import os
+import re
+
+# ==========================================
+# SUB-PAGE SEMANTIC CHUNKING
+# ==========================================
+# Role: Turns whole pages into prompt-sized, citable windows.
+# Logic: A page is split into sentences, sentences are packed greedily into
+# windows of at most CHUNK_MAX_CHARS, and each new window re-starts a few
+# sentences back so consecutive windows overlap by ~CHUNK_OVERLAP_CHARS.
+# Every chunk records its page and [start, end) character offsets into the
+# page text, so citations can point at an exact span.
+# ------------------------------------------------------------------
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1200"))
+CHUNK_OVERLAP_CHARS = int(os.getenv("CHUNK_OVERLAP_CHARS", "200"))
+
+# Sentence ends: Latin punctuation followed by whitespace, or CJK full stops
+SENTENCE_END = re.compile(r'(?<=[.!?;])\s+|(?<=[。！？；])')
+
+def sentence_spans(text: str) -> list[tuple[int, int]]:
+    """[start, end) spans of the sentences in `text` (blank spans dropped)."""
+    spans = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+    return [(s, e) for s, e in spans if text[s:e].strip()]
+
+def _split_long(text: str, start: int, end: int, max_chars: int) -> list[tuple[int, int]]:
+    # A single "sentence" longer than the window (tables, run-on OCR text) is cut at whitespace
+    pieces = []
+    while end - start > max_chars:
+        cut = text.rfind(" ", start, start + max_chars)
+        if cut <= start:
+            cut = start + max_chars
+        pieces.append((start, cut))
+        start = cut
+        while start < end and text[start] == " ":
+            start += 1
+    if start < end:
+        pieces.append((start, end))
+    return pieces
+
+def chunk_page(text: str, page: int, max_chars: int = CHUNK_MAX_CHARS,
+               overlap: int = CHUNK_OVERLAP_CHARS) -> list[dict]:
+    """
+    Splits one page into overlapping, sentence-aligned windows:
+    [{"text": ..., "page": page, "start": offset, "end": offset}, ...]
+    """
+    spans = []
+    for s, e in sentence_spans(text):
+        spans.extend(_split_long(text, s, e, max_chars))
+    if not spans:
+        return []
+
+    chunks = []
+    i = 0
+    while i < len(spans):
+        j = i
+        while j + 1 < len(spans) and spans[j + 1][1] - spans[i][0] <= max_chars:
+            j += 1
+        start, end = spans[i][0], spans[j][1]
+        chunks.append({"text": text[start:end], "page": page, "start": start, "end": end})
+        if j + 1 >= len(spans):
+            break
+        # Step back over whole sentences that fit inside the overlap budget
+        nxt = j + 1
+        while nxt - 1 > i and end - spans[nxt - 1][0] <= overlap:
+            nxt -= 1
+        i = nxt
+    return chunks
@@ -0,0 +1,119 @@
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("SkillSync")
+
+DEFAULT_TENANT = "public"
+
+# ==========================================
+# CORPUS STORE (MULTI-DOCUMENT, MULTI-TENANT)
+# ==========================================
+# Role: Keeps many ingested manuals hot side by side.
+# Logic: Each (tenant, document) pair owns its own RAG engine (chunks,
+# image manifest, vector index). Cold documents are evicted LRU-first
+# once the estimated memory footprint exceeds the configured budget.
+# ------------------------------------------------------------------
+class CorpusStore:
+    """
+    Registry of ingested documents keyed by (tenant_id, document_id).
+    Engines must expose `memory_bytes()`; an optional `on_evict(engine)`
+    callback lets the app release on-disk resources for evicted documents.
+    """
+    def __init__(self, memory_budget_bytes: int, on_evict=None):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.on_evict = on_evict
+        self._docs = OrderedDict()  # { (tenant, doc_id): engine }, oldest first
+        self._latest = {}           # { tenant: doc_id } most recent upload
+        self._lock = threading.RLock()
+
+    def put(self, tenant_id: str, document_id: str, engine):
+        key = (tenant_id, document_id)
+        with self._lock:
+            self._docs[key] = engine
+            self._docs.move_to_end(key)
+            self._latest[tenant_id] = document_id
+            evicted = self._evict_over_budget(protect=key)
+        self._release(evicted)
+
+    def get(self, tenant_id: str, document_id: str = None):
+        """Returns the engine (marking it hot) or None. Falls back to the tenant's latest upload."""
+        with self._lock:
+            if document_id is None:
+                document_id = self._latest.get(tenant_id)
+                if document_id is None:
+                    return None
+            key = (tenant_id, document_id)
+            engine = self._docs.get(key)
+            if engine is not None:
+                self._docs.move_to_end(key)
+            return engine
+
+    def latest(self, tenant_id: str):
+        """ID of the tenant's most recent upload (even if it has since been evicted), or None."""
+        with self._lock:
+            return self._latest.get(tenant_id)
+
+    def peek(self, tenant_id: str, document_id: str):
+        """Like get(), but leaves the LRU order alone (for background work)."""
+        with self._lock:
+            return self._docs.get((tenant_id, document_id))
+
+    def drop(self, tenant_id: str, document_id: str) -> bool:
+        with self._lock:
+            engine = self._docs.pop((tenant_id, document_id), None)
+            if self._latest.get(tenant_id) == document_id:
+                del self._latest[tenant_id]
+        if engine is None:
+            return False
+        self._release([engine])
+        return True
+
+    def list_documents(self, tenant_id: str) -> list:
+        with self._lock:
+            return [doc_id for (tenant, doc_id) in self._docs if tenant == tenant_id]
+
+    def document_ids(self) -> set:
+        """IDs of every loaded document, across tenants."""
+        with self._lock:
+            return {doc_id for (_, doc_id) in self._docs}
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(engine.memory_bytes() for engine in self._docs.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "tenants": len({tenant for tenant, _ in self._docs}),
+                "memory_bytes": sum(e.memory_bytes() for e in self._docs.values()),
+                "memory_budget_bytes": self.memory_budget_bytes,
+            }
+
+    def _evict_over_budget(self, protect=None) -> list:
+        # Caller holds the lock. The document just inserted is never evicted,
+        # even if it alone exceeds the budget.
+        evicted = []
+        total = sum(e.memory_bytes() for e in self._docs.values())
+        for key in list(self._docs.keys()):
+            if total <= self.memory_budget_bytes:
+                break
+            if key == protect:
+                continue
+            engine = self._docs.pop(key)
+            total -= engine.memory_bytes()
+            # _latest keeps pointing at an evicted upload: the app reloads it or reports it missing
+            tenant_id, document_id = key
+            logger.info(f"🧊 [CORPUS] Evicted cold document {tenant_id}/{document_id}")
+            evicted.append(engine)
+        return evicted
+
+    def _release(self, engines: list):
+        if not self.on_evict:
+            return
+        for engine in engines:
+            try:
+                self.on_evict(engine)
+            except Exception as e:
+                logger.error(f"Corpus eviction cleanup failed: {e}")
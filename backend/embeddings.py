@@ -0,0 +1,142 @@
+import os
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# INCREMENTAL, CACHED EMBEDDING PIPELINE
+# ==========================================
+# Role: Only pays for chunks the embedder has never seen.
+# Logic: Vectors are cached by SHA-256 of the chunk text in an append-only
+# float32 matrix (vectors.f32, read through np.memmap) plus a keys file
+# whose line N names row N. Revised manuals and boilerplate shared across
+# vendors hit the cache; only new text is encoded, in fixed-size batches
+# as pages stream out of extraction.
+# ------------------------------------------------------------------
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "embed_cache")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, model_name: str, dim: int, root: str = EMBED_CACHE_DIR):
+        self.dim = dim
+        self.dir = os.path.join(root, model_name.replace("/", "_"))
+        os.makedirs(self.dir, exist_ok=True)
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.keys_path = os.path.join(self.dir, "keys.txt")
+        self._lock = threading.Lock()
+        self._rows = {}     # { key: row }
+        self._count = 0     # rows in both files (duplicate keys included)
+        self._matrix = None
+        self._load()
+
+    def _load(self):
+        row_bytes = self.dim * 4
+        n_vectors = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        keys = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "r", encoding="ascii") as f:
+                # The last element is a half-written line (or "" when the file ends cleanly)
+                keys = f.read().split("\n")[:-1]
+        # A crash between (or during) the two appends can leave the files at different
+        # lengths: cut both back to the rows they share, so later appends stay aligned
+        self._count = min(n_vectors, len(keys))
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(self._count * row_bytes)
+        with open(self.keys_path, "ab") as f:
+            f.truncate(sum(len(key) + 1 for key in keys[:self._count]))
+        for row, key in enumerate(keys[:self._count]):
+            self._rows[key] = row
+        logger.info(f"🧮 [EMBED CACHE] {len(self._rows)} cached vectors ({self.dir})")
+
+    def _view(self):
+        # Caller holds the lock. Re-map only when rows were appended since the last map.
+        n = self._count
+        if n == 0:
+            return None
+        if self._matrix is None or self._matrix.shape[0] < n:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+        return self._matrix
+
+    def __len__(self):
+        return len(self._rows)
+
+    def get(self, keys: list[str]) -> dict:
+        """{ key: vector } for the keys that are cached."""
+        with self._lock:
+            hits = [(k, self._rows[k]) for k in keys if k in self._rows]
+            if not hits:
+                return {}
+            matrix = self._view()
+            return {k: np.array(matrix[row]) for k, row in hits}
+
+    def put(self, keys: list[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(keys), self.dim)
+        with self._lock:
+            fresh = [i for i, k in enumerate(keys) if k not in self._rows]
+            if not fresh:
+                return
+            with open(self.vectors_path, "ab") as f:
+                f.write(vectors[fresh].tobytes())
+            with open(self.keys_path, "a", encoding="ascii") as f:
+                f.write("".join(f"{keys[i]}\n" for i in fresh))
+            for i in fresh:
+                self._rows[keys[i]] = self._count
+                self._count += 1
+
+class EmbeddingPipeline:
+    """
+    Per-ingestion helper: `submit()` chunk texts as they become available,
+    then `finish()` returns the (n, dim) matrix for the final chunk order.
+    """
+    def __init__(self, encode, cache: EmbeddingCache, batch_size: int = EMBED_BATCH_SIZE):
+        self.encode = encode
+        self.cache = cache
+        self.batch_size = batch_size
+        self._vectors = {}   # { key: vector } resolved for this ingestion
+        self._pending = {}   # { key: text } waiting for a full batch
+        self.encoded = 0
+        self.reused = 0
+
+    def submit(self, texts: list[str]):
+        keys = {}
+        for text in texts:
+            key = text_key(text)
+            if key not in self._vectors and key not in self._pending:
+                keys[key] = text
+        if not keys:
+            return
+        cached = self.cache.get(list(keys))
+        self._vectors.update(cached)
+        self.reused += len(cached)
+        for key, text in keys.items():
+            if key not in cached:
+                self._pending[key] = text
+        while len(self._pending) >= self.batch_size:
+            self._flush(self.batch_size)
+
+    def _flush(self, limit: int = None):
+        items = list(self._pending.items())[:limit]
+        if not items:
+            return
+        keys = [k for k, _ in items]
+        vectors = np.asarray(self.encode([t for _, t in items]), dtype=np.float32)
+        self.cache.put(keys, vectors)
+        for key, vec in zip(keys, vectors):
+            self._vectors[key] = vec
+            del self._pending[key]
+        self.encoded += len(items)
+
+    def finish(self, texts: list[str]) -> np.ndarray:
+        self.submit(texts)
+        while self._pending:
+            self._flush(self.batch_size)
+        if not texts:
+            return np.zeros((0, self.cache.dim), dtype=np.float32)
+        return np.stack([self._vectors[text_key(t)] for t in texts]).astype(np.float32)
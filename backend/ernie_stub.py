@@ -0,0 +1,93 @@
+import os
+import re
+import json
+import time
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# ==========================================
+# LOCAL ERNIE STUB (LOAD / OFFLINE TESTING)
+# ==========================================
+# Role: Stands in for the AI Studio chat endpoint.
+# Usage:
+#   uvicorn ernie_stub:app --port 8900
+#   ERNIE_API_BASE=http://127.0.0.1:8900 uvicorn main:app
+# Answers POST /chat/completions in AI Studio's envelope after a fixed
+# delay (ERNIE_STUB_LATENCY_MS) with a canned reply that parses as both a
+# scenario and an audit, so the quiz and audit endpoints work end to end.
+# Batch prompts ("a JSON array with exactly N objects") get N of them.
+# Translation prompts get every segment back tagged with the target language.
+# ERNIE_STUB_MALFORMED_EVERY=N makes every Nth reply prose instead of JSON.
+# ------------------------------------------------------------------
+STUB_LATENCY_MS = int(os.getenv("ERNIE_STUB_LATENCY_MS", "300"))
+STUB_MALFORMED_EVERY = int(os.getenv("ERNIE_STUB_MALFORMED_EVERY", "0"))
+STUB_MALFORMED_REPLY = "Sure! Here is a realistic training scenario about machine guards. " * 20
+
+STUB_REPLY = {
+    "scenario": "A technician finds the machine guard removed during routine maintenance.",
+    "question": "What should the technician do first?",
+    "options": ["Isolate power", "Continue working", "Call a colleague", "Ignore it"],
+    "correct_option": 0,
+    "source_span": "Isolate power before removing any guard.",
+    "explanation": "Guards may only be handled once the machine is isolated.",
+    "visual_query": "machine guard lockout",
+    "is_correct": True,
+    "feedback": "Isolating power is required before any guard work.",
+    "citation": "Stub citation.",
+}
+
+app = FastAPI(title="ERNIE stub")
+replies = {"count": 0}
+
+def _envelope(text: str, is_end: bool = True, prompt_tokens: int = 0, completion_tokens: int = None) -> dict:
+    completion_tokens = len(text) // 4 if completion_tokens is None else completion_tokens
+    return {
+        "errorCode": 0,
+        "errorMsg": "success",
+        "result": {
+            "id": f"stub-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "result": text,
+            "is_end": is_end,
+            "need_clear_history": False,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        },
+    }
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(STUB_LATENCY_MS / 1000)
+    prompt = body["messages"][-1]["content"]
+    prompt_tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+    batch = re.search(r"JSON array with exactly (\d+) objects", prompt)
+    segments = re.search(r"SEGMENTS:\s*(\[.*\])\s*OUTPUT JSON", prompt, re.DOTALL)
+    if segments:
+        language = re.search(r"SEGMENTS from .+? to (.+?)\.", prompt).group(1)
+        reply = {"translations": [f"[{language}] {s}" for s in json.loads(segments.group(1))]}
+    elif batch:
+        reply = [{"source": i, **STUB_REPLY} for i in range(int(batch.group(1)))]
+    else:
+        reply = STUB_REPLY
+    text = json.dumps(reply, ensure_ascii=False)
+    replies["count"] += 1
+    if STUB_MALFORMED_EVERY and replies["count"] % STUB_MALFORMED_EVERY == 0:
+        text = STUB_MALFORMED_REPLY
+    if not body.get("stream"):
+        return JSONResponse(_envelope(text, prompt_tokens=prompt_tokens))
+
+    async def events():
+        pieces = [text[i:i + 16] for i in range(0, len(text), 16)]
+        for i, piece in enumerate(pieces):
+            # Usage is cumulative, as in ERNIE's own stream chunks
+            envelope = _envelope(piece, i == len(pieces) - 1, prompt_tokens, len(text[:(i + 1) * 16]) // 4)
+            yield f"data: {json.dumps(envelope, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(0.01)
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,102 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+
+from fastapi import HTTPException
+from fastapi.staticfiles import StaticFiles
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# GENERATED DIAGRAM CACHE (SERVED FROM /static)
+# ==========================================
+# Role: SDXL runs once per distinct diagram, not once per request.
+# Logic: A diagram is keyed by the image model plus the normalised
+# visual_query (case, punctuation and spacing don't change the picture).
+# The first request renders it and writes a PNG under
+# static_images/generated/; every later request, in this process or after
+# a restart, just gets its /static URL. Nothing under /static ever changes
+# once written (document folders are named by PDF hash, extracted images
+# by content hash, diagrams by this key), so the mount sends long-lived,
+# immutable cache headers and browsers never re-download an image.
+# ------------------------------------------------------------------
+GENERATED_SUBDIR = "generated"
+STATIC_MAX_AGE_SECONDS = int(os.getenv("STATIC_MAX_AGE_SECONDS", str(365 * 24 * 3600)))
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles with far-future Cache-Control: every path under it is content-addressed.
+    Dotfiles and in-progress *.tmp writes are never served (404).
+    `on_access(full_path)` is called for every file served (asset store LRU).
+    """
+    def __init__(self, *args, on_access=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_access = on_access
+
+    async def get_response(self, path: str, scope):
+        parts = path.replace(os.sep, "/").split("/")
+        if any(part.startswith(".") for part in parts) or path.endswith(".tmp"):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, *args, **kwargs):
+        response = super().file_response(full_path, *args, **kwargs)
+        response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE_SECONDS}, immutable"
+        if self.on_access is not None:
+            self.on_access(full_path)
+        return response
+
+def normalize_visual_query(query: str) -> str:
+    return " ".join(re.sub(r"[^\w\s-]", " ", query.casefold()).split())
+
+class GeneratedImageCache:
+    def __init__(self, static_dir: str, model: str, url_prefix: str = "/static", assets=None):
+        """`assets` (an AssetStore over `static_dir`) is told about every hit and write."""
+        self.model = model
+        self.assets = assets
+        self.dir = os.path.join(static_dir, GENERATED_SUBDIR)
+        self.url_prefix = f"{url_prefix}/{GENERATED_SUBDIR}"
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "writes": 0}
+        os.makedirs(self.dir, exist_ok=True)
+
+    def key(self, visual_query: str) -> str:
+        return hashlib.sha256(f"{self.model}\n{normalize_visual_query(visual_query)}".encode("utf-8")).hexdigest()[:32]
+
+    def _relpath(self, key: str) -> str:
+        return f"{key[:2]}/{key}.png"
+
+    def lookup(self, visual_query: str):
+        """/static URL of an already generated diagram, or None."""
+        key = self.key(visual_query)
+        url = self.url_for(key)
+        with self._lock:
+            self.counters["hits" if url else "misses"] += 1
+        if url and self.assets is not None:
+            self.assets.touch(f"{GENERATED_SUBDIR}/{self._relpath(key)}")
+        return url
+
+    def url_for(self, key: str):
+        """/static URL of the diagram stored under `key` (see key()), or None if it isn't on disk."""
+        relpath = self._relpath(key)
+        return f"{self.url_prefix}/{relpath}" if os.path.exists(os.path.join(self.dir, relpath)) else None
+
+    def store(self, visual_query: str, image) -> str:
+        """Saves a PIL image for `visual_query` and returns its /static URL."""
+        relpath = self._relpath(self.key(visual_query))
+        path = os.path.join(self.dir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, format="PNG", optimize=True)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.counters["writes"] += 1
+        if self.assets is not None:
+            self.assets.record(f"{GENERATED_SUBDIR}/{relpath}")
+        return f"{self.url_prefix}/{relpath}"
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
@@ -0,0 +1,128 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+
+from generated_images import GeneratedImageCache
+from singleflight import SingleFlight
+from sse_stream import sse_event
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# DEFERRED IMAGE RESOLUTION
+# ==========================================
+# Role: Keeps SDXL off the /generate_quiz response time.
+# Logic: A scenario without a manual image is returned as soon as its text
+# is ready, with an image handle (the diagram's cache key) and status
+# "pending". The Artist renders in a background task, single-flighted per
+# handle, so the same diagram is never drawn twice concurrently. Clients
+# resolve the handle by long-polling GET /images/{handle}?wait=N or by
+# subscribing to GET /images/{handle}/events (one final `ready` / `error`
+# event). A handle whose diagram is already on disk is "ready" straight
+# away, including after a restart; failures are remembered for a while so
+# pollers get an answer, and the next request for the diagram tries again.
+# ------------------------------------------------------------------
+IMAGE_HANDLE_PATTERN = r"^[0-9a-f]{32}$"
+IMAGE_LONG_POLL_SECONDS = float(os.getenv("IMAGE_LONG_POLL_SECONDS", "25"))
+IMAGE_RENDER_TTL_SECONDS = int(os.getenv("IMAGE_RENDER_TTL_SECONDS", "900"))
+SSE_KEEPALIVE_SECONDS = 15
+
+class ImageRenders:
+    def __init__(self, images: GeneratedImageCache, flights: SingleFlight, fallback_url: str):
+        self.images = images
+        self.flights = flights
+        self.fallback_url = fallback_url
+        self._renders = {}   # { handle: asyncio.Task }
+        self._failed = {}    # { handle: failed_at }
+        self.counters = {"already_rendered": 0, "started": 0, "rendered": 0, "failed": 0}
+
+    def _state(self, handle: str, status: str, url: Optional[str] = None) -> dict:
+        return {"handle": handle, "status": status, "url": url}
+
+    def request(self, visual_query: str, render) -> dict:
+        """
+        Image state for `visual_query`. Starts `render()` (a coroutine function returning
+        the image URL, or None on failure) in the background unless it is drawn or drawing.
+        """
+        handle = self.images.key(visual_query)
+        url = self.images.lookup(visual_query)
+        if url:
+            self.counters["already_rendered"] += 1
+            return self._state(handle, "ready", url)
+        task = self._renders.get(handle)
+        if task is None or task.done():
+            self._prune()
+            self._failed.pop(handle, None)
+            task = asyncio.ensure_future(self.flights.run(handle, render))
+            self._renders[handle] = task
+            task.add_done_callback(lambda t: self._settle(handle, t))
+            self.counters["started"] += 1
+        return self._state(handle, "pending")
+
+    def status(self, handle: str) -> Optional[dict]:
+        """Current state of a handle, or None if it is unknown (never requested, or expired)."""
+        url = self.images.url_for(handle)
+        if url:
+            return self._state(handle, "ready", url)
+        task = self._renders.get(handle)
+        if task is not None and not task.done():
+            return self._state(handle, "pending")
+        if handle in self._failed:
+            return self._state(handle, "error", self.fallback_url)
+        return None
+
+    async def wait(self, handle: str, timeout: float) -> Optional[dict]:
+        """Long-poll: the handle's state once it settles, or after `timeout` seconds."""
+        task = self._renders.get(handle)
+        if task is not None and not task.done() and timeout > 0:
+            # asyncio.wait never cancels the render, even when this waiter times out
+            await asyncio.wait({task}, timeout=timeout)
+        return self.status(handle)
+
+    def refresh(self, scenario: dict) -> dict:
+        """Brings a pre-built scenario's image fields up to date before it is served."""
+        handle = scenario.get("image_handle")
+        if handle and scenario.get("image_status") == "pending":
+            state = self.status(handle) or self._state(handle, "error", self.fallback_url)
+            scenario["image_status"] = state["status"]
+            scenario["image_url"] = state["url"]
+        return scenario
+
+    def _settle(self, handle: str, task: asyncio.Task):
+        url = None
+        if not task.cancelled():
+            try:
+                url = task.result()
+            except Exception as e:
+                logger.warning(f"🎨 Diagram render {handle} failed: {e}")
+        if url:
+            self.counters["rendered"] += 1
+        else:
+            self.counters["failed"] += 1
+            self._failed[handle] = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - IMAGE_RENDER_TTL_SECONDS
+        for handle in [h for h, failed_at in self._failed.items() if failed_at < cutoff]:
+            del self._failed[handle]
+            self._renders.pop(handle, None)
+        for handle in [h for h, task in self._renders.items() if task.done() and h not in self._failed]:
+            del self._renders[handle]
+
+    def stats(self) -> dict:
+        pending = sum(1 for task in self._renders.values() if not task.done())
+        return {**self.counters, "pending": pending}
+
+async def image_event_stream(renders: ImageRenders, handle: str):
+    """SSE generator: a comment every SSE_KEEPALIVE_SECONDS while pending, then one `ready` / `error` event."""
+    while True:
+        state = await renders.wait(handle, SSE_KEEPALIVE_SECONDS)
+        if state is None:
+            yield sse_event("error", {"handle": handle, "status": "error", "url": renders.fallback_url})
+            return
+        if state["status"] != "pending":
+            yield sse_event(state["status"], state)
+            return
+        yield ": pending\n\n"
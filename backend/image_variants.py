@@ -0,0 +1,127 @@
+import os
+import logging
+import threading
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# WEB DERIVATIVES OF EXTRACTED PDF IMAGES
+# ==========================================
+# Role: Clients never download a multi-megabyte scan to show a 600px figure.
+# Logic: After extraction, every image a document kept is decoded once and
+# re-encoded as a few width-bounded variants (WebP, or JPEG when PIL has no
+# WebP encoder), never upscaled. PIL releases the GIL while resizing and
+# encoding, so a small thread pool keeps every core busy without copying
+# image bytes to another process. Variants sit next to the original and are
+# named after it (<content hash>.w<width>.<ext>), so their URLs are as
+# immutable as the original's and cache / ETag validation never goes stale.
+# The per-image metadata (original and variant sizes) is stored in the
+# ingestion manifest; scenarios get the variant that fits the requested
+# display width plus a srcset for the browser to choose from.
+# ------------------------------------------------------------------
+IMAGE_VARIANT_WIDTHS = tuple(sorted({int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,1280").split(",")}))
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", str(min(4, os.cpu_count() or 1))))
+DEFAULT_DISPLAY_WIDTH = 640
+VARIANT_FORMAT, VARIANT_EXT = ("WEBP", "webp") if features.check("webp") else ("JPEG", "jpg")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_VARIANT_WORKERS, thread_name_prefix="variants")
+        return _executor
+
+def variant_name(image_id: str, width: int) -> str:
+    return f"{image_id.rsplit('.', 1)[0]}.w{width}.{VARIANT_EXT}"
+
+def _web_mode(image: Image.Image) -> Image.Image:
+    # Scans come as CMYK, palette, 16-bit grey...; variants are RGB, or RGBA when WebP can keep the alpha
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        rgba = image.convert("RGBA")
+        if VARIANT_FORMAT == "WEBP":
+            return rgba
+        flat = Image.new("RGB", rgba.size, "white")
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+        return flat
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+def derive_image(image_dir: str, image_id: str) -> Optional[dict]:
+    """
+    Writes the missing variants of one extracted image and returns its metadata:
+    {"width", "height", "bytes", "variants": [{"file", "width", "height", "bytes"}, ...]}.
+    None when PIL can't decode the original (clients then get the original as is).
+    """
+    path = os.path.join(image_dir, image_id)
+    try:
+        with Image.open(path) as original:
+            width, height = original.size
+            source = None
+            variants = []
+            for target in sorted({min(w, width) for w in IMAGE_VARIANT_WIDTHS}):
+                name = variant_name(image_id, target)
+                out_path = os.path.join(image_dir, name)
+                target_height = max(1, round(height * target / width))
+                # Re-ingesting the same document finds its variants already on disk
+                if not os.path.exists(out_path):
+                    if source is None:
+                        source = _web_mode(original)
+                    variant = source if target == width else source.resize((target, target_height), Image.LANCZOS)
+                    tmp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                    variant.save(tmp_path, format=VARIANT_FORMAT, quality=IMAGE_VARIANT_QUALITY)
+                    os.replace(tmp_path, out_path)
+                variants.append({"file": name, "width": target, "height": target_height,
+                                 "bytes": os.path.getsize(out_path)})
+    except Exception as e:
+        logger.warning(f"Image variants skipped for {image_id}: {e}")
+        return None
+    return {"width": width, "height": height, "bytes": os.path.getsize(path), "variants": variants}
+
+def derive_images(image_dir: str, image_ids) -> dict:
+    """{ image_id: metadata } for every image PIL could decode, built on the variant pool."""
+    image_ids = list(dict.fromkeys(image_ids))
+    results = _get_executor().map(lambda image_id: derive_image(image_dir, image_id), image_ids)
+    return {image_id: meta for image_id, meta in zip(image_ids, results) if meta is not None}
+
+def pick_variant(meta: Optional[dict], display_width: int) -> Optional[dict]:
+    """Narrowest variant at least `display_width` wide (the widest one if none is), or None."""
+    variants = (meta or {}).get("variants") or []
+    if not variants:
+        return None
+    return next((v for v in variants if v["width"] >= display_width), variants[-1])
+
+def refit_image_fields(scenario: dict, display_width: int) -> dict:
+    """A pre-built scenario with its manual image switched to the srcset variant that fits `display_width`."""
+    srcset, width, height = scenario.get("image_srcset"), scenario.get("image_width"), scenario.get("image_height")
+    if not srcset or not width or not height:
+        return scenario
+    variants = []
+    for entry in srcset.split(", "):
+        url, w = entry.rsplit(" ", 1)
+        variants.append({"file": url, "width": int(w.rstrip("w"))})
+    chosen = pick_variant({"variants": sorted(variants, key=lambda v: v["width"])}, display_width)
+    return {
+        **scenario,
+        "image_url": chosen["file"],
+        "image_width": chosen["width"],
+        "image_height": max(1, round(height * chosen["width"] / width)),
+    }
+
+def image_fields(image_id: str, meta: Optional[dict], display_width: int, url_for) -> dict:
+    """Response fields for a manual image: the fitting variant's URL, its size and a srcset."""
+    chosen = pick_variant(meta, display_width)
+    if chosen is None:
+        return {"image_url": url_for(image_id), "image_width": None, "image_height": None, "image_srcset": None}
+    return {
+        "image_url": url_for(chosen["file"]),
+        "image_width": chosen["width"],
+        "image_height": chosen["height"],
+        "image_srcset": ", ".join(f"{url_for(v['file'])} {v['width']}w" for v in meta["variants"]),
+    }
@@ -0,0 +1,130 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# CONTENT-ADDRESSED INGESTION CACHE
+# ==========================================
+# Role: Makes re-uploading the same manual free.
+# Logic: Ingestion results are keyed by the SHA-256 of the PDF bytes and
+# persisted under INGEST_CACHE_DIR/<profile>/<hash>/:
+#   manifest.json   -> chunks, page->image manifest, image sizes / variants,
+#                      owning tenants
+#   <name>.npy      -> float arrays (embeddings), loaded memory-mapped
+#   anything else   -> app-specific artefacts (e.g. a FAISS index)
+# Extracted images live in the document's own static folder, which is also
+# content-addressed, so they survive restarts alongside the manifest.
+# ------------------------------------------------------------------
+INGEST_CACHE_DIR = os.getenv("INGEST_CACHE_DIR", "ingest_cache")
+
+def content_hash(buf) -> str:
+    """SHA-256 of an in-memory PDF (bytes or memoryview, hashed without copying)."""
+    return hashlib.sha256(buf).hexdigest()
+
+class IngestCache:
+    """
+    On-disk store of finished ingestions. `profile` namespaces entries per
+    pipeline (Lite vs. OCR+embeddings) since they produce different chunks.
+    """
+    def __init__(self, profile: str, root: str = INGEST_CACHE_DIR):
+        self.root = os.path.join(root, profile)
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def path(self, key: str, name: str) -> str:
+        return os.path.join(self.entry_dir(key), name)
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self.path(key, "manifest.json"))
+
+    def load(self, key: str, tenant_id: str = None):
+        """
+        Returns the manifest dict (arrays attached as read-only memmaps under
+        manifest["arrays"]) or None on a miss. When `tenant_id` is given the
+        entry must have been uploaded by that tenant.
+        """
+        try:
+            with open(self.path(key, "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if tenant_id is not None and tenant_id not in manifest.get("tenants", []):
+            return None
+
+        arrays = {}
+        for name in manifest.get("arrays", []):
+            try:
+                arrays[name] = np.load(self.path(key, f"{name}.npy"), mmap_mode="r")
+            except (OSError, ValueError):
+                logger.warning(f"Ingest cache entry {key} is missing '{name}', treating as miss.")
+                return None
+        manifest["arrays"] = arrays
+        return manifest
+
+    def save(self, key: str, chunks: list, pdf_images: dict, tenant_id: str,
+             arrays: dict = None, extra_files: dict = None, image_meta: dict = None):
+        """
+        Atomically writes an entry. `extra_files` maps file names to callables
+        that write the artefact to a given path (e.g. faiss.write_index).
+        """
+        arrays = arrays or {}
+        tmp_dir = self.entry_dir(key) + f".tmp{os.getpid()}_{threading.get_ident()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            for name, arr in arrays.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(arr, dtype=np.float32))
+            for name, writer in (extra_files or {}).items():
+                writer(os.path.join(tmp_dir, name))
+            # Re-ingesting the same bytes keeps every tenant that already had access
+            previous = self.load(key) or {}
+            tenants = previous.get("tenants", [])
+            manifest = {
+                "chunks": chunks,
+                # JSON keys are strings; load_pdf_images() turns them back into page ints
+                "pdf_images": {str(k): v for k, v in pdf_images.items()},
+                # { image_id: original size + web variants } (see image_variants.py)
+                "image_meta": image_meta or {},
+                "arrays": list(arrays.keys()),
+                "tenants": tenants + [tenant_id] if tenant_id not in tenants else tenants,
+            }
+            with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            with self._lock:
+                shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+                os.replace(tmp_dir, self.entry_dir(key))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def set_tenant_access(self, key: str, tenant_id: str, allowed: bool = True):
+        """Grants (re-upload of the same bytes) or revokes (delete) a tenant's access to an entry."""
+        with self._lock:
+            manifest_path = self.path(key, "manifest.json")
+            try:
+                with open(manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                return
+            tenants = manifest.setdefault("tenants", [])
+            if (tenant_id in tenants) == allowed:
+                return
+            if allowed:
+                tenants.append(tenant_id)
+            else:
+                tenants.remove(tenant_id)
+            tmp_path = manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, manifest_path)
+
+def load_pdf_images(manifest: dict) -> dict:
+    return {int(k): v for k, v in manifest.get("pdf_images", {}).items()}
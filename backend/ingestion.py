@@ -0,0 +1,192 @@
+import os
+import math
+import hashlib
+import mmap
+import logging
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# PARALLEL PAGE-LEVEL PDF INGESTION
+# ==========================================
+# Role: Splits a PDF's page range across a process pool.
+# Logic: Every worker opens its own fitz handle (PyMuPDF documents are not
+# shareable across processes), extracts text + rips images for its slice,
+# and the parent merges the slices back in page order.
+# ------------------------------------------------------------------
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# Below this many pages the pool start-up cost outweighs the speed-up
+MIN_PARALLEL_PAGES = int(os.getenv("INGEST_MIN_PARALLEL_PAGES", "8"))
+# Slices per worker; more slices = better balance when some pages are image-heavy
+SLICES_PER_WORKER = 4
+# Uploads above this are rejected; above the mmap threshold the spooled body is mapped, not copied
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "200"))
+UPLOAD_MMAP_THRESHOLD_MB = int(os.getenv("UPLOAD_MMAP_THRESHOLD_MB", "16"))
+
+class UploadTooLarge(ValueError):
+    pass
+
+def read_upload(src, max_bytes: int = MAX_UPLOAD_MB * 1024 * 1024,
+                mmap_threshold: int = UPLOAD_MMAP_THRESHOLD_MB * 1024 * 1024):
+    """
+    Returns the PDF as an in-memory buffer without writing a temp copy.
+    Small uploads are read into bytes; large ones (already spooled to an
+    anonymous file by the server) are memory-mapped and wrapped in a memoryview.
+    """
+    size = src.seek(0, os.SEEK_END)
+    src.seek(0)
+    if size > max_bytes:
+        raise UploadTooLarge(f"Upload is {size // (1024 * 1024)} MB, limit is {max_bytes // (1024 * 1024)} MB")
+    if size >= mmap_threshold:
+        # The mapping keeps its own reference, so it outlives the request's file handle
+        return memoryview(mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ))
+    return src.read()
+
+def open_pdf(source):
+    """Opens a PDF from a path or from an in-memory buffer (bytes / memoryview)."""
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+@contextmanager
+def worker_visible_path(buf):
+    """
+    Exposes an in-memory PDF to pool workers as a path without touching disk,
+    via a Linux memfd. Yields None where memfd is unavailable.
+    """
+    if not hasattr(os, "memfd_create"):
+        yield None
+        return
+    fd = os.memfd_create("skillsync-pdf", os.MFD_CLOEXEC)
+    try:
+        with os.fdopen(os.dup(fd), "wb") as f:
+            f.write(buf)
+        yield f"/proc/{os.getpid()}/fd/{fd}"
+    finally:
+        os.close(fd)
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+# PyMuPDF is not thread-safe: every in-process fitz call (background job
+# threads, OCR rendering) goes through this lock. Pool workers are separate
+# processes and don't need it.
+FITZ_LOCK = threading.RLock()
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Lazily creates (or resizes) the shared ingestion pool."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # Never fork the server: it already runs threads (job pool, HTTP client,
+            # event loop) whose locks a forked child could inherit mid-acquire
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+            _pool_workers = workers
+        return _pool
+
+def split_pages(page_count: int, workers: int) -> list[tuple[int, int]]:
+    """Contiguous [start, stop) slices covering every page."""
+    size = max(1, math.ceil(page_count / (workers * SLICES_PER_WORKER)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+def store_image(image_dir: str, data: bytes, ext: str) -> str:
+    """
+    Writes an image under its content hash and returns the image ID (file name).
+    Identical bytes map to the same file, so each unique image is stored once;
+    the temp + rename keeps concurrent workers from seeing half-written files.
+    """
+    fname = f"{hashlib.sha256(data).hexdigest()[:24]}.{ext}"
+    path = os.path.join(image_dir, fname)
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f: f.write(data)
+        os.replace(tmp_path, path)
+    return fname
+
+def extract_page_range(source, start: int, stop: int, image_dir: str, min_image_bytes: int) -> list[dict]:
+    """
+    Worker entry point. Returns one record per page:
+    {"page": n, "text": raw_text, "images": [image_id, ...]}
+    Images are memoized by xref (a logo referenced on every page is decoded
+    once per worker) and stored by content hash (see store_image).
+    """
+    doc = open_pdf(source)
+    pages = []
+    seen_xrefs = {}  # { xref: image_id, or None if filtered out / failed }
+    try:
+        for pg_num in range(start, stop):
+            page = doc[pg_num]
+            images = []
+            for img in page.get_images(full=True):
+                xref = img[0]
+                if xref not in seen_xrefs:
+                    seen_xrefs[xref] = None
+                    try:
+                        base = doc.extract_image(xref)
+                        if len(base["image"]) >= min_image_bytes:
+                            seen_xrefs[xref] = store_image(image_dir, base["image"], base["ext"])
+                    except Exception as e:
+                        logger.warning(f"Image extract error on pg {pg_num}: {e}")
+                image_id = seen_xrefs[xref]
+                if image_id and image_id not in images:
+                    images.append(image_id)
+            pages.append({"page": pg_num, "text": page.get_text(), "images": images})
+    finally:
+        doc.close()
+    return pages
+
+def extract_pages(source, image_dir: str, min_image_bytes: int = 5120, workers: int = None,
+                  on_progress=None) -> list[dict]:
+    """
+    Extracts every page of the PDF (a path or an in-memory buffer), in page order.
+    Runs in-process for small documents or workers <= 1, otherwise fans out
+    over the shared process pool. `on_progress(pages, page_total)` is called
+    with each finished slice (in completion order) for progress reporting.
+    """
+    workers = INGEST_WORKERS if workers is None else workers
+    os.makedirs(image_dir, exist_ok=True)
+    with FITZ_LOCK, open_pdf(source) as doc:
+        page_count = len(doc)
+    report = on_progress or (lambda pages, total: None)
+
+    if workers > 1 and page_count >= MIN_PARALLEL_PAGES:
+        if isinstance(source, str):
+            return _extract_parallel(source, page_count, image_dir, min_image_bytes, workers, report)
+        # Workers can't receive a buffer cheaply (it would be pickled per slice),
+        # so they open a memfd copy of it by path instead
+        with worker_visible_path(source) as path:
+            if path is not None:
+                return _extract_parallel(path, page_count, image_dir, min_image_bytes, workers, report)
+
+    pages = []
+    for start, stop in split_pages(page_count, 1):
+        with FITZ_LOCK:
+            batch = extract_page_range(source, start, stop, image_dir, min_image_bytes)
+        report(batch, page_count)
+        pages.extend(batch)
+    return pages
+
+def _extract_parallel(path: str, page_count: int, image_dir: str, min_image_bytes: int, workers: int, report) -> list[dict]:
+    slices = split_pages(page_count, workers)
+    logger.info(f"⚡ [INGEST] {page_count} pages across {workers} workers ({len(slices)} slices)")
+    pool = get_pool(workers)
+    futures = {
+        pool.submit(extract_page_range, path, start, stop, image_dir, min_image_bytes): idx
+        for idx, (start, stop) in enumerate(slices)
+    }
+    # Progress is reported as slices finish; the merge is by slice index so pages stay in order
+    results = [None] * len(slices)
+    for future in as_completed(futures):
+        batch = future.result()
+        results[futures[future]] = batch
+        report(batch, page_count)
+    return [page for batch in results for page in batch]
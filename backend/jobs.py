@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# BACKGROUND INGESTION JOBS
+# ==========================================
+# Role: Keeps /upload off the event loop.
+# Logic: /upload hands the ingestion to a small thread pool and returns a
+# job ID straight away. The job's progress (pages done, chunks, images)
+# lives in a plain dict guarded by a lock; SSE subscribers poll a version
+# counter so every change is pushed without cross-thread asyncio plumbing.
+# ------------------------------------------------------------------
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "2"))
+JOB_TTL_SECONDS = int(os.getenv("INGEST_JOB_TTL_SECONDS", "900"))
+SSE_POLL_SECONDS = 0.25
+
+class IngestJob:
+    def __init__(self, tenant_id: str, document_id: str):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.tenant_id = tenant_id
+        self.document_id = document_id
+        self.status = "queued"   # queued -> running -> done | error
+        self.info = ""
+        self.progress = {"pages_total": 0, "pages_done": 0, "chunks": 0, "images": 0}
+        self.finished_at = None
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        """Thread-safe progress update; `status`/`info` are top-level, the rest is progress."""
+        with self._lock:
+            for key, value in fields.items():
+                if key in ("status", "info"):
+                    setattr(self, key, value)
+                else:
+                    self.progress[key] = value
+            if self.status in ("done", "error") and self.finished_at is None:
+                self.finished_at = time.time()
+            self.version += 1
+
+    def add_progress(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self.progress[key] = self.progress.get(key, 0) + delta
+            self.version += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "tenant_id": self.tenant_id,
+                "document_id": self.document_id,
+                "status": self.status,
+                "info": self.info,
+                "progress": dict(self.progress),
+            }
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+class JobManager:
+    def __init__(self, workers: int = INGEST_JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, tenant_id: str, document_id: str, fn) -> IngestJob:
+        """
+        Runs `fn(job)` on the ingestion pool. `fn` returns the final info
+        message; exceptions mark the job as failed.
+        """
+        job = IngestJob(tenant_id, document_id)
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def active_documents(self) -> set:
+        """Document IDs with an ingestion still queued or running."""
+        with self._lock:
+            return {job.document_id for job in self._jobs.values() if not job.finished}
+
+    def _run(self, job: IngestJob, fn):
+        job.update(status="running")
+        try:
+            info = fn(job)
+            job.update(status="done", info=info)
+        except Exception as e:
+            logger.error(f"Ingestion job {job.job_id} failed: {e}")
+            job.update(status="error", info=f"Error: {e}")
+
+    def _prune(self):
+        # Caller holds the lock
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for job_id in [j for j, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+async def job_event_stream(job: IngestJob):
+    """SSE generator: one `progress` event per change, then a final `done`/`error` event."""
+    last_version = -1
+    while True:
+        version = job.version
+        if version != last_version:
+            last_version = version
+            snapshot = job.snapshot()
+            finished = snapshot["status"] in ("done", "error")
+            event = snapshot["status"] if finished else "progress"
+            yield f"event: {event}\ndata: {json.dumps(snapshot)}\n\n"
+            if finished:
+                return
+        await asyncio.sleep(SSE_POLL_SECONDS)
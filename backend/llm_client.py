@@ -0,0 +1,203 @@
+import os
+import random
+import asyncio
+import logging
+
+import aiohttp
+import erniebot
+import erniebot.errors as eb_errors
+
+from singleflight import SingleFlight, StreamFlight, flight_key
+from structured_reply import ReplySchema, generate_structured
+from prompt_budget import UsageMeter, approx_tokens, messages_tokens
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# ASYNC LLM BRIDGE (POOLED, BOUNDED, RETRIED)
+# ==========================================
+# Role: The one place agents talk to ERNIE from.
+# Logic: Calls go through erniebot's async API on a shared aiohttp session,
+# so connections are kept alive and reused instead of a new TLS handshake
+# per call. A semaphore caps in-flight calls per upstream, every call has a
+# hard timeout, and transient failures (timeouts, 5xx, rate limits) are
+# retried with full-jitter exponential backoff. ERNIE_API_BASE points the
+# client at another server, e.g. the local stub in ernie_stub.py.
+# Identical concurrent calls (same model + normalised messages) share one
+# upstream round trip, streamed or not (see singleflight.py). Token usage is recorded per
+# call under the caller's tag (see prompt_budget.UsageMeter).
+# ------------------------------------------------------------------
+ERNIE_API_BASE = os.getenv("ERNIE_API_BASE") or None  # None -> erniebot's AI Studio URL
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "64"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = 8.0
+LLM_KEEPALIVE_SECONDS = 60
+
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    aiohttp.ClientError,
+    eb_errors.ConnectionError,
+    eb_errors.TimeoutError,
+    eb_errors.RateLimitError,
+    eb_errors.RequestLimitError,
+    eb_errors.TryAgain,
+)
+
+class LLMError(RuntimeError):
+    pass
+
+def _is_retryable(e: Exception) -> bool:
+    if isinstance(e, RETRYABLE_ERRORS):
+        return True
+    # Non-200 answers from the gateway itself: only 429 / 5xx are worth another try
+    rcode = getattr(e, "rcode", None)
+    return isinstance(e, eb_errors.HTTPRequestError) and rcode is not None and (rcode == 429 or rcode >= 500)
+
+class LLMClient:
+    """Async chat client for one upstream (base URL + token)."""
+    def __init__(self, access_token: str = None, base_url: str = ERNIE_API_BASE,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY, timeout: float = LLM_TIMEOUT_SECONDS,
+                 max_retries: int = LLM_MAX_RETRIES):
+        self.access_token = access_token
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+        self._flights = SingleFlight()
+        self._streams = StreamFlight()
+        self.stats = {"calls": 0, "retries": 0, "failures": 0, "in_flight": 0, "malformed": 0, "exhausted": 0}
+        self.usage = UsageMeter()
+
+    def _config(self) -> dict:
+        # The session is created on first use, inside the server's event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=LLM_POOL_SIZE, keepalive_timeout=LLM_KEEPALIVE_SECONDS)
+            )
+        config = {"api_type": "aistudio", "aiohttp_session": self._session}
+        if self.access_token:
+            config["access_token"] = self.access_token
+        if self.base_url:
+            config["api_base_url"] = self.base_url
+        return config
+
+    async def _create(self, model: str, messages: list[dict], **kwargs):
+        return await asyncio.wait_for(
+            erniebot.ChatCompletion.acreate(
+                _config_=self._config(), model=model, messages=messages,
+                request_timeout=self.timeout, **kwargs
+            ),
+            timeout=self.timeout,
+        )
+
+    async def chat(self, messages: list[dict], model: str = "ernie-3.5", tag: str = "chat") -> str:
+        """Sends one chat completion and returns the reply text. Raises LLMError once retries run out."""
+        key = flight_key(model, *[(m["role"], m["content"]) for m in messages])
+        return await self._flights.run(key, lambda: self._chat(messages, model, tag))
+
+    async def chat_json(self, messages: list[dict], schema: ReplySchema, model: str = "ernie-3.5", tag: str = None):
+        """
+        Streams the reply through the incremental schema check (see structured_reply.py):
+        malformed output is cut off and retried. Returns the parsed object, or None
+        once the retry budget is spent.
+        """
+        key = flight_key("json", schema.name, model, *[(m["role"], m["content"]) for m in messages])
+        return await self._flights.run(key, lambda: generate_structured(
+            lambda: self.stream(messages, model, tag or schema.name), schema, counters=self.stats
+        ))
+
+    def flight_stats(self) -> dict:
+        return {**self._flights.stats(), "streams": self._streams.stats()}
+
+    def _record_usage(self, tag: str, messages: list[dict], reply: str, usage: dict):
+        # ERNIE reports usage on complete replies; anything else is estimated the SDK's way
+        reported = bool(usage and usage.get("prompt_tokens"))
+        self.usage.record(
+            tag,
+            usage["prompt_tokens"] if reported else messages_tokens(messages),
+            usage.get("completion_tokens", 0) if reported else approx_tokens(reply),
+            estimated=not reported,
+        )
+
+    async def _chat(self, messages: list[dict], model: str, tag: str) -> str:
+        self.stats["calls"] += 1
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    self.stats["in_flight"] += 1
+                    try:
+                        response = await self._create(model, messages)
+                    finally:
+                        self.stats["in_flight"] -= 1
+                reply = response.get_result()
+                self._record_usage(tag, messages, reply, response.get("usage"))
+                return reply
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    self.stats["failures"] += 1
+                    raise LLMError(f"{type(e).__name__}: {e}") from e
+                # Full jitter keeps a burst of failed calls from retrying in lock-step
+                delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+                attempt += 1
+                self.stats["retries"] += 1
+                logger.warning(f"LLM call failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def stream(self, messages: list[dict], model: str = "ernie-3.5", tag: str = "chat"):
+        """
+        Async generator of reply text deltas (ERNIE stream mode). Identical concurrent
+        streams share one upstream call; a late subscriber first gets the text so far.
+        """
+        key = flight_key("stream", model, *[(m["role"], m["content"]) for m in messages])
+        async for delta in self._streams.subscribe(key, lambda: self._stream(messages, model, tag)):
+            yield delta
+
+    async def _stream(self, messages: list[dict], model: str, tag: str):
+        # Holds a concurrency slot for the whole stream; the timeout applies per delta.
+        # Transient failures are retried until the first delta arrives; after that
+        # they are raised, since deltas may already have been forwarded.
+        self.stats["calls"] += 1
+        attempt = 0
+        while True:
+            deltas = None
+            received, usage = [], None
+            try:
+                async with self._semaphore:
+                    self.stats["in_flight"] += 1
+                    try:
+                        response = await self._create(model, messages, stream=True)
+                        deltas = response.__aiter__()
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(deltas.__anext__(), timeout=self.timeout)
+                            except StopAsyncIteration:
+                                break
+                            received.append(chunk.get_result())
+                            # Only the last chunk's usage covers the whole reply
+                            usage = chunk.get("usage") if chunk.get("is_end") else None
+                            yield received[-1]
+                    finally:
+                        # Closed early (consumer stopped reading): release the upstream connection now
+                        if deltas is not None and hasattr(deltas, "aclose"):
+                            await deltas.aclose()
+                        self.stats["in_flight"] -= 1
+                        self._record_usage(tag, messages, "".join(received), usage)
+                return
+            except Exception as e:
+                if received or attempt >= self.max_retries or not _is_retryable(e):
+                    self.stats["failures"] += 1
+                    raise LLMError(f"{type(e).__name__}: {e}") from e
+                delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+                attempt += 1
+                self.stats["retries"] += 1
+                logger.warning(f"LLM stream failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -389,33 +389,48 @@
 
 
 import os
-import shutil
 import logging
 import random
 import json
-import base64
-import io
 import re
-import fitz  # PyMuPDF
-import numpy as np
-from PIL import Image
+import asyncio
+import threading
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from typing import Optional
+from contextlib import contextmanager
+
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Path
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
-# --- CAMEL-AI IMPORTS ---
-from camel.agents import ChatAgent
-from camel.messages import BaseMessage
-from camel.types import RoleType
-
 # --- UTILITY IMPORTS ---
 import erniebot
 # from paddleocr import PaddleOCR  <-- REMOVED FOR LITE VERSION
 from huggingface_hub import InferenceClient
 
+from corpus import CorpusStore, DEFAULT_TENANT
+from ingestion import extract_pages, read_upload, UploadTooLarge
+from ingest_cache import IngestCache, content_hash, load_pdf_images
+from jobs import JobManager, job_event_stream
+from chunking import chunk_page
+from llm_client import LLMClient, LLMError
+from response_cache import ResponseCache, cache_key
+from scenario_pool import ScenarioPool
+from singleflight import SingleFlight
+from sse_stream import SSE_HEADERS, json_event_stream, result_stream
+from structured_reply import QUIZ_SCHEMA, AUDIT_SCHEMA
+from prompt_budget import PROMPT_TOKEN_BUDGETS, approx_tokens, build_prompt, fit_segments, detect_boilerplate
+from batch_quiz import BATCH_MAX_COUNT, sample_chunks, group, build_batch_prompt, parse_batch_response
+from answer_key import AnswerKeyStore
+from translation_memory import CANONICAL_LANGUAGE, TRANSLATION_LANGUAGES, TRANSLATION_SCHEMA, TranslationMemory
+from generated_images import GeneratedImageCache, ImmutableStaticFiles
+from asset_store import AssetStore
+from image_variants import DEFAULT_DISPLAY_WIDTH, derive_images, image_fields, refit_image_fields
+from image_renders import IMAGE_HANDLE_PATTERN, IMAGE_LONG_POLL_SECONDS, ImageRenders, image_event_stream
+
 # ==========================================
 # 0. LOGGING & SETUP
 # ==========================================
@@ -427,6 +442,8 @@ logging.basicConfig(
 logger = logging.getLogger("SkillSync")
 
 LAST_USED_LANGUAGE = "English" 
+# Language pre-built into the scenario pool as soon as a document is ingested
+DEFAULT_LANGUAGE = os.getenv("DEFAULT_LANGUAGE", "English")
 
 load_dotenv()
 
@@ -438,6 +455,9 @@ os.environ["OPENAI_API_KEY"] = "fake-key-bypass-for-camel-compliance"
 AI_STUDIO_TOKEN = os.getenv("AI_STUDIO_TOKEN")
 HF_TOKEN = os.getenv("HF_TOKEN")
 
+# Memory budget for documents kept hot in the corpus store (cold ones are evicted LRU)
+CORPUS_MEMORY_BUDGET_MB = int(os.getenv("CORPUS_MEMORY_BUDGET_MB", "256"))
+
 # Simple check to ensure keys exist (prevents crash on startup if missing)
 if not AI_STUDIO_TOKEN:
     logger.warning("⚠️ AI_STUDIO_TOKEN is missing. ERNIE features will fail.")
@@ -447,18 +467,23 @@ if not HF_TOKEN:
 erniebot.api_type = "aistudio"
 erniebot.access_token = AI_STUDIO_TOKEN
 hf_client = InferenceClient(token=HF_TOKEN)
+# Shared by every agent: pooled keep-alive connections + a cap on in-flight ERNIE calls
+llm = LLMClient(access_token=AI_STUDIO_TOKEN)
+SDXL_MODEL = "stabilityai/stable-diffusion-xl-base-1.0"
+image_flights = SingleFlight()
 
 app = FastAPI(title="SkillSync CAMEL Core (Lite)")
 STATIC_DIR = "static_images"
 os.makedirs(STATIC_DIR, exist_ok=True)
 
-# Clean static folder
-for f in os.listdir(STATIC_DIR):
-    try:
-        os.remove(os.path.join(STATIC_DIR, f))
-    except: pass
+# NOTE: static_images is no longer wiped on startup. Document folders are
+# content-addressed (named by PDF hash), so they stay valid across restarts.
+# Its size is bounded instead: least recently used folders / diagrams are evicted
+# past STATIC_DISK_BUDGET_MB, except those of live documents.
+assets = AssetStore(STATIC_DIR, pinned=lambda: corpus.document_ids() | jobs.active_documents())
+# Files under /static never change once written, so they are served with immutable cache headers.
 
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+app.mount("/static", ImmutableStaticFiles(directory=STATIC_DIR, on_access=assets.touch_path), name="static")
 
 app.add_middleware(
     CORSMiddleware,
@@ -467,6 +492,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def bind_scenario_pool():
+    # Ingestion threads schedule pool fills onto this loop
+    scenario_pool.bind_loop(asyncio.get_running_loop())
+
+@app.on_event("startup")
+async def enforce_asset_budget():
+    # The index was rebuilt at import; a lowered budget takes effect before the first upload
+    await run_in_threadpool(assets.enforce)
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm.close()
+
+@app.on_event("shutdown")
+async def flush_asset_index():
+    # Last-access times since the previous periodic save
+    assets.flush(force=True)
+
 # ==========================================
 # 1. AGENT 1: VISUAL PERCEPTION AGENT (LITE)
 # ==========================================
@@ -481,50 +525,117 @@ app.add_middleware(
 class ErnieCamelBackend:
     """
     Acts as the 'Brain' for the CAMEL Agents, routing thoughts to Baidu Ernie.
+    Calls are awaited on the shared async client, so a slow ERNIE reply no
+    longer blocks the event loop for every other request.
     """
-    def __init__(self, model_name="ernie-3.5"):
+    def __init__(self, model_name="ernie-3.5", client: LLMClient = None):
         self.model_name = model_name
+        self.client = client or llm
 
-    def run(self, messages: list[BaseMessage]) -> str:
-        ernie_messages = []
-        system_content = ""
-
-        # Convert CAMEL messages to ERNIE format
-        for msg in messages:
-            if msg.role_name == "Assistant":
-                ernie_messages.append({"role": "assistant", "content": msg.content})
-            elif msg.role_name == "User":
-                ernie_messages.append({"role": "user", "content": msg.content})
-            elif msg.role_name == "System": 
-                system_content += f"SYSTEM INSTRUCTION: {msg.content}\n\n"
-
-        # Inject System Prompt into the first user message
-        if system_content and ernie_messages:
-            for m in ernie_messages:
-                if m['role'] == 'user':
-                    m['content'] = system_content + "TASK:\n" + m['content']
-                    break
-        
+    async def run(self, messages: list[dict], tag: str = "chat") -> str:
         try:
-            response = erniebot.ChatCompletion.create(
-                model=self.model_name,
-                messages=ernie_messages,
-            )
-            return response.get_result()
-        except Exception as e:
+            return await self.client.chat(messages, model=self.model_name, tag=tag)
+        except LLMError as e:
             logger.error(f"Ernie Bridge Error: {e}")
             return '{"error": "Agent connection failed"}'
 
-def create_camel_agent(system_role: str):
-    """Factory to create a CAMEL agent with the Ernie Brain."""
-    sys_msg = BaseMessage.make_assistant_message(
-        role_name="Assistant",
-        content=system_role
-    )
-    # Pass model=None to bypass OpenAI connection
-    agent = ChatAgent(system_message=sys_msg, model=None)
-    backend = ErnieCamelBackend(model_name="ernie-3.5")
-    return agent, backend
+    async def run_json(self, messages: list[dict], schema, tag: str = None):
+        """
+        Parsed reply object, checked against `schema` while it streams in. Malformed
+        replies are cut off early and retried; None once the retry budget is spent.
+        """
+        try:
+            return await self.client.chat_json(messages, schema, model=self.model_name, tag=tag)
+        except LLMError as e:
+            logger.error(f"Ernie Bridge Error: {e}")
+            return None
+
+    def stream(self, messages: list[dict], tag: str = "chat"):
+        """Reply text deltas as ERNIE produces them (raises LLMError on failure)."""
+        return self.client.stream(messages, model=self.model_name, tag=tag)
+
+class CamelAgent:
+    """
+    One CAMEL agent role with the Ernie Brain, built once and shared by every request.
+    Each call is a fresh one-turn exchange (the agent keeps no conversation memory),
+    so concurrent requests can use the same instance. The system prompt is rendered
+    into the ERNIE message prefix once, here, instead of per request.
+    """
+    def __init__(self, name: str, system_role: str, model_name="ernie-3.5"):
+        self.name = name
+        self.backend = ErnieCamelBackend(model_name=model_name)
+        self.system_prefix = f"SYSTEM INSTRUCTION: {system_role}\n\nTASK:\n"
+        # Tokens left for the task prompt once the system prefix is paid for
+        self.prompt_budget = PROMPT_TOKEN_BUDGETS[name] - approx_tokens(self.system_prefix)
+        self.counters = {"calls": 0, "in_flight": 0, "peak_in_flight": 0}
+
+    def messages(self, prompt: str) -> list[dict]:
+        return [{"role": "user", "content": self.system_prefix + prompt}]
+
+    @contextmanager
+    def _tracked(self):
+        self.counters["calls"] += 1
+        self.counters["in_flight"] += 1
+        self.counters["peak_in_flight"] = max(self.counters["peak_in_flight"], self.counters["in_flight"])
+        try:
+            yield
+        finally:
+            self.counters["in_flight"] -= 1
+
+    async def run(self, prompt: str) -> str:
+        with self._tracked():
+            return await self.backend.run(self.messages(prompt), tag=self.name)
+
+    async def run_json(self, prompt: str, schema):
+        with self._tracked():
+            return await self.backend.run_json(self.messages(prompt), schema, tag=self.name)
+
+    def stream(self, prompt: str):
+        self.counters["calls"] += 1
+        return self.backend.stream(self.messages(prompt), tag=self.name)
+
+    def stats(self) -> dict:
+        return {"instances": 1, **self.counters}
+
+class ArtistAgent:
+    """Agent 4 (Generative Artist): SDXL diagrams, shared the same way. draw() blocks; run it in a thread."""
+    def __init__(self, name: str, model: str = SDXL_MODEL):
+        self.name = name
+        self.model = model
+        self.prompt_template = "technical schematic of {}, blueprint style, white on blue, high detail"
+        # Diagrams are kept on disk by (model, normalised query) and reused across requests and restarts
+        self.images = GeneratedImageCache(STATIC_DIR, model, assets=assets)
+        self.counters = {"calls": 0, "in_flight": 0, "peak_in_flight": 0}
+        self._lock = threading.Lock()
+
+    def draw(self, visual_query: str) -> str:
+        """/static URL of the SDXL diagram for `visual_query`, generated on first request only."""
+        cached_url = self.images.lookup(visual_query)
+        if cached_url:
+            return cached_url
+        with self._lock:
+            self.counters["calls"] += 1
+            self.counters["in_flight"] += 1
+            self.counters["peak_in_flight"] = max(self.counters["peak_in_flight"], self.counters["in_flight"])
+        try:
+            image = hf_client.text_to_image(prompt=self.prompt_template.format(visual_query), model=self.model)
+            return self.images.store(visual_query, image)
+        finally:
+            with self._lock:
+                self.counters["in_flight"] -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"instances": 1, **self.counters}
+
+# Built once at startup; every request shares these (see CamelAgent)
+instructor_agent = CamelAgent("instructor", "You are an Expert Technical Instructor. You output strictly valid JSON.")
+auditor_agent = CamelAgent("auditor", "You are a Strict Compliance Auditor. Verify actions against text.")
+translator_agent = CamelAgent("translator", "You are a Professional Technical Translator. You output strictly valid JSON.")
+artist_agent = ArtistAgent("artist")
+agents = {agent.name: agent for agent in (instructor_agent, auditor_agent, translator_agent, artist_agent)}
+# Diagrams render in the background; scenarios carry a handle the client resolves later
+image_renders = ImageRenders(artist_agent.images, image_flights, fallback_url="https://placehold.co/600x400?text=No+Image")
 
 # ==========================================
 # 3. RAG LOGIC (LITE VERSION)
@@ -534,134 +645,365 @@ def clean_text_for_json(text: str):
     text = re.sub(r'[\x00-\x1f\x7f-\x9f]', '', text)
     return text.replace('\\', '\\\\')
 
-def extract_json_from_ai_response(raw_text: str):
-    try:
-        match = re.search(r'(\{.*\})', raw_text, re.DOTALL)
-        if match:
-            return json.loads(match.group(1))
-        return json.loads(raw_text)
-    except:
-        return None
-
 class RAGEngine:
-    def __init__(self):
+    """One ingested document: its chunks, page->image manifest and image folder."""
+    def __init__(self, tenant_id: str = DEFAULT_TENANT, document_id: str = "default"):
+        self.tenant_id = tenant_id
+        self.document_id = document_id
         self.chunks = []
         self.pdf_images = {}
-
-    def ingest_pdf(self, path):
+        self.image_meta = {}  # { image_id: original size + web variants }
+        self._boilerplate = None
+        # Document IDs are PDF content hashes, so identical uploads share one image folder
+        self.image_dir = os.path.join(STATIC_DIR, document_id)
+
+    @property
+    def boilerplate(self) -> tuple:
+        # Running headers / footers, detected once per loaded document and stripped from prompts
+        if self._boilerplate is None and self.chunks:
+            self._boilerplate = detect_boilerplate(self.chunks)
+        return self._boilerplate or ()
+
+    def static_url(self, fname: str) -> str:
+        return f"/static/{self.document_id}/{fname}"
+
+    def image_fields(self, image_id: str, display_width: int = DEFAULT_DISPLAY_WIDTH) -> dict:
+        """URL of the web variant of `image_id` that fits `display_width`, its size and a srcset."""
+        return image_fields(image_id, self.image_meta.get(image_id), display_width, self.static_url)
+
+    def load_cached(self) -> bool:
+        """Restores a previous ingestion of the same bytes from the on-disk cache."""
+        manifest = ingest_cache.load(self.document_id, tenant_id=self.tenant_id)
+        if manifest is None or not os.path.isdir(self.image_dir):
+            return False
+        self.chunks = manifest["chunks"]
+        self.pdf_images = load_pdf_images(manifest)
+        self.image_meta = manifest.get("image_meta", {})
+        return True
+
+    def save_cached(self):
+        ingest_cache.save(self.document_id, self.chunks, self.pdf_images, tenant_id=self.tenant_id,
+                          image_meta=self.image_meta)
+
+    def memory_bytes(self) -> int:
+        """Rough footprint used by the corpus store's memory budget."""
+        size = sum(len(c["text"]) + 64 for c in self.chunks)
+        size += sum(len(f) + 16 for imgs in self.pdf_images.values() for f in imgs)
+        size += sum(256 + 128 * len(meta["variants"]) for meta in self.image_meta.values())
+        return size
+
+    def ingest_pdf(self, pdf, workers: int = None, job=None):
+        """
+        Extracts text + images page by page from a path or an in-memory buffer;
+        large PDFs fan out over the ingestion pool. When a background `job` is
+        given, pages/images found are reported as slices finish, chunks as they are cut.
+        """
         self.chunks = []
         self.pdf_images = {}
+        self.image_meta = {}
+        logger.info(f"📂 [AGENT 1: VISUAL LITE] Scanning document {self.document_id[:12]}...")
+
+        def report(batch, page_total):
+            if job is not None:
+                job.update(pages_total=page_total)
+                job.add_progress(pages_done=len(batch), images=sum(len(p["images"]) for p in batch))
+
         try:
-            doc = fitz.open(path)
+            pages = extract_pages(pdf, self.image_dir, min_image_bytes=5120, workers=workers, on_progress=report)
         except Exception as e:
             return f"Error: {e}"
 
-        logger.info(f"📂 [AGENT 1: VISUAL LITE] Scanning {len(doc)} pages...")
-
-        for pg_num, page in enumerate(doc):
-            # 1. TEXT EXTRACTION (Standard)
-            txt = page.get_text()
-            
+        for page in pages:
+            # 1. TEXT EXTRACTION (Standard) -> sentence-aligned sub-page chunks.
             # Note: Heavy OCR fallback removed for Lite version.
             # If pdf is an image scan, txt will be empty.
-            
-            if txt.strip():
-                self.chunks.append({
-                    "text": clean_text_for_json(txt.replace("\n", " ").strip()), 
-                    "page": pg_num
-                })
+            # Chunk offsets index into the cleaned page text.
+            txt = clean_text_for_json(page["text"].replace("\n", " ").strip())
+            for chunk in chunk_page(txt, page["page"]):
+                chunk["id"] = len(self.chunks)
+                self.chunks.append(chunk)
+                if job is not None: job.add_progress(chunks=1)
 
             # 2. IMAGE RIP (Works fine in Lite)
-            for img_idx, img in enumerate(page.get_images(full=True)):
-                try:
-                    xref = img[0]
-                    base = doc.extract_image(xref)
-                    if len(base["image"]) < 5120: continue
-                    fname = f"p{pg_num}_{img_idx}.{base['ext']}"
-                    full_path = os.path.join(STATIC_DIR, fname)
-                    with open(full_path, "wb") as f: f.write(base["image"])
-                    
-                    if pg_num not in self.pdf_images: self.pdf_images[pg_num] = []
-                    self.pdf_images[pg_num].append(fname)
-                except: pass
+            if page["images"]:
+                self.pdf_images[page["page"]] = page["images"]
+
+        # 3. WEB VARIANTS: width-bounded WebP / JPEG copies of every kept image
+        self.image_meta = derive_images(self.image_dir, [f for imgs in self.pdf_images.values() for f in imgs])
 
         return f"✅ Visual Agent (Lite) Indexed {len(self.chunks)} chunks."
 
-rag = RAGEngine()
+# v3: manifests carry image variant metadata
+ingest_cache = IngestCache(profile="lite-v3")
+
+# Evicted documents only leave memory; their cache entry and images stay on disk
+corpus = CorpusStore(
+    memory_budget_bytes=CORPUS_MEMORY_BUDGET_MB * 1024 * 1024,
+    on_evict=lambda engine: scenario_pool.drop_document_threadsafe(engine.tenant_id, engine.document_id),
+)
+jobs = JobManager()
+
+# Bump a version whenever its prompt changes, so stale cached answers are never served
+QUIZ_PROMPT_VERSION = "quiz-v2"
+AUDIT_PROMPT_VERSION = "audit-v1"
+quiz_cache = ResponseCache("lite-quiz")
+audit_cache = ResponseCache("lite-audit")
+# Correct option + supporting span per generated scenario, never sent to the client
+answer_keys = AnswerKeyStore("lite-answer-keys")
+
+def get_document(tenant_id: str, document_id: Optional[str]) -> Optional[RAGEngine]:
+    """
+    Looks up a document, reloading cold (evicted / pre-restart) ones from the
+    ingestion cache. Unknown IDs are a 404, a missing ID means 'latest upload'
+    (None only when the tenant never uploaded anything).
+    """
+    if document_id is None:
+        document_id = corpus.latest(tenant_id)
+        if document_id is None:
+            return None
+    engine = corpus.get(tenant_id, document_id)
+    if engine is None:
+        engine = RAGEngine(tenant_id=tenant_id, document_id=document_id)
+        # Also fails once the document's images were evicted from disk (re-upload restores them)
+        if not engine.load_cached():
+            raise HTTPException(status_code=404, detail=f"Unknown document '{document_id}'")
+        corpus.put(tenant_id, document_id, engine)
+        assets.touch(document_id)
+    return engine
 
 # ==========================================
 # 4. API & AGENT WORKFLOWS
 # ==========================================
 
+# Tenant and document IDs become folder names under /static, so keep them path-safe
+ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
 class QuizRequest(BaseModel):
     topic: str = "General"
     target_language: str = "English"
+    tenant_id: str = Field(DEFAULT_TENANT, pattern=ID_PATTERN)
+    document_id: Optional[str] = Field(None, pattern=ID_PATTERN)
+    # CSS pixels x device pixel ratio of the image slot; picks the manual image variant
+    image_width: int = Field(DEFAULT_DISPLAY_WIDTH, ge=64, le=4096)
+
+class TranslateAllRequest(BaseModel):
+    # Defaults to every configured language (TRANSLATION_LANGUAGES)
+    languages: list[str] = Field(default_factory=lambda: list(TRANSLATION_LANGUAGES), min_length=1, max_length=16)
+    tenant_id: str = Field(DEFAULT_TENANT, pattern=ID_PATTERN)
+    document_id: Optional[str] = Field(None, pattern=ID_PATTERN)
+    image_width: int = Field(DEFAULT_DISPLAY_WIDTH, ge=64, le=4096)
+
+class BatchQuizRequest(BaseModel):
+    count: int = Field(10, ge=1, le=BATCH_MAX_COUNT)
+    languages: list[str] = Field(default_factory=lambda: [DEFAULT_LANGUAGE], min_length=1, max_length=8)
+    # True -> one JSON object per line (application/x-ndjson) as each upstream call finishes
+    stream: bool = False
+    tenant_id: str = Field(DEFAULT_TENANT, pattern=ID_PATTERN)
+    document_id: Optional[str] = Field(None, pattern=ID_PATTERN)
 
 class EvaluateRequest(BaseModel):
     question: str
     selected_option: str
-    context: str
+    # Either send the context back, or just the chunk_id returned by /generate_quiz
+    context: str = ""
+    chunk_id: Optional[int] = None
+    # quiz_id from /generate_quiz: multiple-choice answers are graded against the stored key
+    quiz_id: Optional[str] = None
+    # True -> always ask the Compliance Auditor for a written explanation
+    rich_feedback: bool = False
     target_language: str = "English"
+    tenant_id: str = Field(DEFAULT_TENANT, pattern=ID_PATTERN)
+    document_id: Optional[str] = Field(None, pattern=ID_PATTERN)
+
+def load_upload(src):
+    """Reads (or memory-maps) the upload and hashes it. The PDF hash doubles as the document ID."""
+    pdf = read_upload(src)
+    return pdf, content_hash(pdf)
+
+def run_ingestion(job, pdf) -> str:
+    """Background job body: corpus hit -> cache hit -> full ingestion (then persisted)."""
+    tenant_id, document_id = job.tenant_id, job.document_id
+
+    # 1. Already hot for this tenant -> nothing to do
+    if corpus.get(tenant_id, document_id) is not None:
+        return "✅ Document already loaded."
+
+    # 2. Same bytes ingested before (any tenant, any process lifetime) -> cache load
+    engine = RAGEngine(tenant_id=tenant_id, document_id=document_id)
+    if ingest_cache.contains(document_id):
+        ingest_cache.set_tenant_access(document_id, tenant_id)
+    if engine.load_cached():
+        logger.info(f"♻️ [INGEST CACHE] Hit for {document_id[:12]}")
+        job.update(chunks=len(engine.chunks), images=sum(len(v) for v in engine.pdf_images.values()))
+        info = f"✅ Visual Agent (Lite) Restored {len(engine.chunks)} chunks from cache."
+    else:
+        # 3. New manual -> full ingestion straight from memory, then persist
+        info = engine.ingest_pdf(pdf, job=job)
+        if info.startswith("Error"):
+            raise RuntimeError(info.removeprefix("Error: "))
+        engine.save_cached()
+
+    corpus.put(tenant_id, document_id, engine)
+    # The document is live (pinned) now; older image folders make room for it if needed
+    assets.record(document_id)
+    # Start pre-building scenarios so the first /generate_quiz doesn't wait on ERNIE + SDXL
+    scenario_pool.ensure_threadsafe(tenant_id, document_id, DEFAULT_LANGUAGE)
+    return info
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    temp_path = f"temp_{file.filename}"
+async def upload_file(
+    file: UploadFile = File(...),
+    tenant_id: str = Form(DEFAULT_TENANT, pattern=ID_PATTERN),
+):
+    # No temp copy: the spooled body is parsed from memory (or a memory map for
+    # large files). Reading + hashing is blocking, so it runs off the event loop;
+    # the CPU-bound ingestion itself is handed to the background job pool.
     try:
-        with open(temp_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-        return {"status": "success", "info": rag.ingest_pdf(temp_path)}
-    finally:
-        if os.path.exists(temp_path): os.remove(temp_path)
-
-@app.post("/generate_quiz")
-async def generate_quiz(req: QuizRequest):
-    global LAST_USED_LANGUAGE
-    if req.target_language != LAST_USED_LANGUAGE:
-        logger.info(f"🌐 Switching Lang: {LAST_USED_LANGUAGE} -> {req.target_language}")
-        LAST_USED_LANGUAGE = req.target_language
-
-    # Context Selection
-    if not rag.chunks:
-        context_text = "Standard safety protocols for industrial machinery."
-        page_num = 0
-    else:
-        ctx = random.choice(rag.chunks)
-        context_text = ctx['text']
-        page_num = ctx['page']
+        pdf, document_id = await run_in_threadpool(load_upload, file.file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    job = jobs.submit(tenant_id, document_id, lambda job: run_ingestion(job, pdf))
+    return {
+        "status": "queued",
+        "info": "⏳ Ingestion queued.",
+        "job_id": job.job_id,
+        "document_id": document_id,
+        "tenant_id": tenant_id,
+    }
 
-    # ==========================================
-    # AGENT 2: INSTRUCTIONAL ARCHITECT AGENT
-    # ==========================================
-    logger.info("🧠 [AGENT 2: INSTRUCTOR] Designing Scenario...")
-    
-    instructor_agent, backend = create_camel_agent(
-        "You are an Expert Technical Instructor. You output strictly valid JSON."
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return job.snapshot()
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job(job_id: str):
+    """Server-Sent Events: `progress` events while ingesting, then `done` or `error`."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return StreamingResponse(
+        job_event_stream(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    
-    prompt_content = f"""
+
+@app.get("/documents")
+async def list_documents(tenant_id: str = DEFAULT_TENANT):
+    return {"tenant_id": tenant_id, "documents": corpus.list_documents(tenant_id), "store": corpus.stats()}
+
+@app.delete("/documents/{document_id}")
+async def delete_document(document_id: str, tenant_id: str = DEFAULT_TENANT):
+    dropped = corpus.drop(tenant_id, document_id)
+    scenario_pool.drop_document(tenant_id, document_id)
+    if not dropped and not ingest_cache.contains(document_id):
+        raise HTTPException(status_code=404, detail=f"Unknown document '{document_id}'")
+    # Revoke the tenant's access so the document isn't lazily reloaded from cache
+    ingest_cache.set_tenant_access(document_id, tenant_id, allowed=False)
+    return {"status": "deleted", "document_id": document_id}
+
+def scenario_prompt(context_text: str, target_language: str, boilerplate: tuple = ()) -> str:
+    """Agent 2 (Instructional Architect) task prompt, within the instructor's token budget."""
+    return build_prompt(lambda source: f"""
     TASK: Create a technical scenario based on source material.
-    TARGET LANGUAGE: {req.target_language}
+    TARGET LANGUAGE: {target_language}
     
     OUTPUT JSON FORMAT:
     {{
-        "scenario": "Scenario description in {req.target_language}...",
-        "question": "Question in {req.target_language}...",
+        "scenario": "Scenario description in {target_language}...",
+        "question": "Question in {target_language}...",
         "options": ["Option A", "Option B", "Option C", "Option D"],
+        "correct_option": 0,
+        "source_span": "The sentence of the source material that proves the answer, copied verbatim",
+        "explanation": "Why that option is correct, in {target_language}",
         "visual_query": "3 keywords in ENGLISH for a diagram"
     }}
+    Exactly one option is correct; "correct_option" is its index in "options".
 
     SOURCE MATERIAL:
-    {context_text[:2000]}
+    {source}
+    """, context_text, instructor_agent.prompt_budget, boilerplate)
+
+async def design_scenario(context_text: str, target_language: str, boilerplate: tuple = ()):
+    """Agent 2 round trip. Returns the parsed scenario, or None if no valid reply came back."""
+    logger.info("🧠 [AGENT 2: INSTRUCTOR] Designing Scenario...")
+    return await instructor_agent.run_json(scenario_prompt(context_text, target_language, boilerplate), QUIZ_SCHEMA)
+
+# Scenarios are written once, in CANONICAL_LANGUAGE, and translated segment by segment
+translations = TranslationMemory(
+    "lite-translations",
+    lambda prompt: translator_agent.run_json(prompt, TRANSLATION_SCHEMA),
+    translator_agent.prompt_budget,
+)
+
+async def canonical_scenario(context_text: str, boilerplate: tuple = ()):
+    """The chunk's scenario in CANONICAL_LANGUAGE: from the quiz cache, else generated (and cached)."""
+    # Same chunk + prompt version -> same scenario, served from cache
+    quiz_key = cache_key(QUIZ_PROMPT_VERSION, context_text, CANONICAL_LANGUAGE)
+    quiz_data = quiz_cache.get(quiz_key)
+    if quiz_data is not None:
+        logger.info("♻️ [AGENT 2: INSTRUCTOR] Scenario served from cache.")
+        return quiz_data
+    quiz_data = await design_scenario(context_text, CANONICAL_LANGUAGE, boilerplate)
+    # Only parsed agent output is cached, never the placeholder
+    if quiz_data:
+        quiz_cache.put(quiz_key, quiz_data)
+    return quiz_data
+
+async def localized_scenario(context_text: str, target_language: str, boilerplate: tuple = ()):
+    """The chunk's scenario in `target_language` (see localize_scenario). None if all fails."""
+    quiz_data = await canonical_scenario(context_text, boilerplate)
+    return await localize_scenario(quiz_data, context_text, target_language, boilerplate)
+
+async def localize_scenario(quiz_data, context_text: str, target_language: str, boilerplate: tuple = ()):
     """
-    
-    messages = [
-        instructor_agent.system_message,
-        BaseMessage.make_user_message(role_name="User", content=prompt_content)
-    ]
-    
-    raw_response = backend.run(messages)
-    quiz_data = extract_json_from_ai_response(raw_response)
+    A canonical scenario in `target_language`, through the translation memory.
+    If the translator fails, it is written directly in the target language
+    instead (the pre-translation-memory path).
+    """
+    if not quiz_data or target_language == CANONICAL_LANGUAGE:
+        return quiz_data
+    translated = await translations.translate_quiz(quiz_data, target_language)
+    if translated is not None:
+        return translated
+    logger.warning(f"🌐 [TRANSLATOR] Falling back to a direct {target_language} scenario.")
+    quiz_key = cache_key(QUIZ_PROMPT_VERSION, context_text, target_language)
+    quiz_data = quiz_cache.get(quiz_key) or await design_scenario(context_text, target_language, boilerplate)
+    if quiz_data:
+        quiz_cache.put(quiz_key, quiz_data)
+    return quiz_data
+
+def pick_context(rag: Optional[RAGEngine]):
+    """(chunk or None, context text, page number) for the next scenario."""
+    if not rag or not rag.chunks:
+        return None, "Standard safety protocols for industrial machinery.", 0
+    ctx = random.choice(rag.chunks)
+    return ctx, ctx['text'], ctx['page']
+
+async def build_scenario(rag: Optional[RAGEngine], target_language: str, display_width: int = DEFAULT_DISPLAY_WIDTH):
+    """
+    Builds one complete scenario (quiz JSON, image, context) for a document.
+    Returns (response, generated): `generated` is False when the agent reply
+    was unusable and the placeholder scenario was returned instead.
+    """
+    # Context Selection
+    ctx, context_text, page_num = pick_context(rag)
 
+    # ==========================================
+    # AGENT 2: INSTRUCTIONAL ARCHITECT AGENT
+    # ==========================================
+    # One canonical generation per chunk; other languages are translations of it
+    quiz_data = await localized_scenario(context_text, target_language, rag.boilerplate if rag else ())
+
+    generated = bool(quiz_data)
+    return await finish_scenario(rag, ctx, context_text, page_num, quiz_data, display_width), generated
+
+async def finish_scenario(rag: Optional[RAGEngine], ctx: Optional[dict], context_text: str,
+                          page_num: int, quiz_data: Optional[dict],
+                          display_width: int = DEFAULT_DISPLAY_WIDTH) -> dict:
+    """Placeholder for unusable agent output, then the image (Agent 1 / 4) and the response shape."""
     if not quiz_data:
         quiz_data = {
             "scenario": "Error generating scenario.",
@@ -675,8 +1017,11 @@ async def generate_quiz(req: QuizRequest):
     # ==========================================
     image_url = ""
     image_source = ""
+    image_status = "ready"
+    image_handle = None
+    image_size = {"image_width": None, "image_height": None, "image_srcset": None}
     
-    real_images = rag.pdf_images.get(page_num, [])
+    real_images = rag.pdf_images.get(page_num, []) if rag else []
     
     # NOTE: IMPORTANT FIX FOR DEPLOYMENT URL
     # Replace 'localhost' with your Render URL if needed, or keep relative.
@@ -686,78 +1031,377 @@ async def generate_quiz(req: QuizRequest):
         logger.info("👁️ [AGENT 1] Retrieving specific evidence from PDF.")
         selected_img = random.choice(real_images)
         # Use full URL if deployed, or just path if frontend handles it
-        # Assuming your frontend appends BACKEND_URL, sending just the path is safer:
-        image_url = f"/static/{selected_img}" 
+        # Assuming your frontend appends BACKEND_URL, sending just the path is safer.
+        # The web variant that fits the client's display, not the raw extracted file:
+        image_size = rag.image_fields(selected_img, display_width)
+        image_url = image_size.pop("image_url")
         image_source = f"MANUAL EVIDENCE (PG {page_num + 1})"
     else:
-        logger.info("🎨 [AGENT 4: ARTIST] Generating synthetic diagram...")
+        logger.info("🎨 [AGENT 4: ARTIST] Requesting synthetic diagram...")
         visual_query = quiz_data.get("visual_query", "schematic diagram")
-        try:
-            hf_prompt = f"technical schematic of {visual_query}, blueprint style, white on blue, high detail"
-            image = hf_client.text_to_image(prompt=hf_prompt, model="stabilityai/stable-diffusion-xl-base-1.0")
-            
-            buf = io.BytesIO()
-            image.save(buf, format="PNG")
-            b64_img = base64.b64encode(buf.getvalue()).decode("utf-8")
-            image_url = f"data:image/png;base64,{b64_img}"
-            image_source = "AI RECONSTRUCTION (SDXL)"
-        except Exception as e:
-            image_url = "https://placehold.co/600x400?text=No+Image"
-            image_source = "IMAGE UNAVAILABLE"
+        # The scenario goes out now; the diagram resolves later via /images/{handle}
+        image = image_renders.request(visual_query, lambda: run_in_threadpool(artist_agent.draw, visual_query))
+        image_url, image_status, image_handle = image["url"], image["status"], image["handle"]
+        image_source = "AI RECONSTRUCTION (SDXL)"
 
     # If the image_url is a local path (starts with /static), prepend the Render URL in production
     # But for now, we return it as is, and the frontend should handle the base URL.
     # To be safe for your specific frontend, let's include the full path based on request if possible,
     # or just assume the frontend will attach its BACKEND_URL variable to the path.
 
+    # The answer key stays on the server; the client only gets its quiz_id
+    quiz_data, quiz_id = answer_keys.register(quiz_data, context_text)
+
     return {
         "data": quiz_data,
+        "quiz_id": quiz_id,
         "context": context_text,
         "image_url": image_url,
-        "image_source": image_source
+        **image_size,
+        "image_source": image_source,
+        # "pending" until the Artist finishes; poll /images/{image_handle} for the URL
+        "image_status": image_status,
+        "image_handle": image_handle,
+        "document_id": rag.document_id if rag else None,
+        # Exact span the scenario was built from (offsets into the cleaned page text)
+        "chunk": {k: ctx[k] for k in ("id", "page", "start", "end")} if ctx else None
     }
 
-@app.post("/evaluate_answer")
-async def evaluate_answer(req: EvaluateRequest):
-    # ==========================================
-    # AGENT 3: COMPLIANCE AUDITOR AGENT
-    # ==========================================
-    logger.info("⚖️ [AGENT 3: AUDITOR] Verifying compliance...")
-    
-    auditor_agent, backend = create_camel_agent(
-        "You are a Strict Compliance Auditor. Verify actions against text."
-    )
-    
-    prompt_content = f"""
-    CONTEXT: {req.context}
-    QUESTION: {req.question}
-    USER ANSWER: {req.selected_option}
+async def produce_pooled_scenario(tenant_id: str, document_id: str, language: str):
+    # Pool filling never reloads or re-heats a document; placeholders are not pooled
+    rag = corpus.peek(tenant_id, document_id)
+    if rag is None or not rag.chunks:
+        return None
+    scenario, generated = await build_scenario(rag, language)
+    return scenario if generated else None
+
+# Buffers only for the languages the app offers; other languages are built on demand
+scenario_pool = ScenarioPool(produce_pooled_scenario, {DEFAULT_LANGUAGE, CANONICAL_LANGUAGE, *TRANSLATION_LANGUAGES})
+
+@app.post("/generate_quiz")
+async def generate_quiz(req: QuizRequest):
+    global LAST_USED_LANGUAGE
+    if req.target_language != LAST_USED_LANGUAGE:
+        logger.info(f"🌐 Switching Lang: {LAST_USED_LANGUAGE} -> {req.target_language}")
+        LAST_USED_LANGUAGE = req.target_language
+
+    rag = get_document(req.tenant_id, req.document_id)
+    if rag and rag.chunks:
+        scenario = scenario_pool.pop(req.tenant_id, rag.document_id, req.target_language)
+        if scenario is not None:
+            # Pooled scenarios are built at the default width; serve the variant this client asked for
+            scenario = refit_image_fields(scenario, req.image_width)
+            logger.info("⚡ [POOL] Served a pre-built scenario.")
+            return image_renders.refresh(scenario)
+    # Pool empty (cold document / new language): build inline, the pool refills meanwhile
+    scenario, _ = await build_scenario(rag, req.target_language, req.image_width)
+    return scenario
+
+@app.post("/generate_quiz/stream")
+async def generate_quiz_stream(req: QuizRequest):
+    """
+    SSE variant of /generate_quiz: `delta` events carry the scenario and question
+    text as ERNIE writes it; the final `result` event is the /generate_quiz payload.
+    """
+    rag = get_document(req.tenant_id, req.document_id)
+    if rag and rag.chunks:
+        scenario = scenario_pool.pop(req.tenant_id, rag.document_id, req.target_language)
+        if scenario is not None:
+            # Pooled scenarios are built at the default width; serve the variant this client asked for
+            scenario = refit_image_fields(scenario, req.image_width)
+            return StreamingResponse(
+                result_stream(image_renders.refresh(scenario)), media_type="text/event-stream", headers=SSE_HEADERS
+            )
+
+    ctx, context_text, page_num = pick_context(rag)
+    boilerplate = rag.boilerplate if rag else ()
+    quiz_key = cache_key(QUIZ_PROMPT_VERSION, context_text, CANONICAL_LANGUAGE)
+    if quiz_cache.get(quiz_key) is not None:
+        # Only the (segment-cached) translation is left to do: one `result` event
+        async def localized() -> dict:
+            quiz_data = await localized_scenario(context_text, req.target_language, boilerplate)
+            return await finish_scenario(rag, ctx, context_text, page_num, quiz_data, req.image_width)
+
+        events = result_stream(localized())
+    else:
+        logger.info("🧠 [AGENT 2: INSTRUCTOR] Designing Scenario (streaming)...")
+        prompt = scenario_prompt(context_text, CANONICAL_LANGUAGE, boilerplate)
+
+        # Deltas carry the canonical text as it is written. Other languages only get
+        # `progress` events: the translated scenario arrives in the `result` event
+        fields = ("scenario", "question") if req.target_language == CANONICAL_LANGUAGE else ()
+
+        async def finalize(quiz_data: Optional[dict]) -> dict:
+            if quiz_data:
+                quiz_cache.put(quiz_key, quiz_data)
+            quiz_data = await localize_scenario(quiz_data, context_text, req.target_language, boilerplate)
+            return await finish_scenario(rag, ctx, context_text, page_num, quiz_data, req.image_width)
+
+        events = json_event_stream(
+            lambda: instructor_agent.stream(prompt), QUIZ_SCHEMA, fields, finalize, counters=llm.stats
+        )
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/generate_quiz/all_languages")
+async def generate_quiz_all_languages(req: TranslateAllRequest):
+    """
+    One scenario (same chunk, same question, same answer key index) in every
+    requested language: a single generation, then one translation per language.
+    Languages whose translation failed are listed under `failed`.
+    """
+    rag = get_document(req.tenant_id, req.document_id)
+    ctx, context_text, page_num = pick_context(rag)
+    quiz_data = await canonical_scenario(context_text, rag.boilerplate if rag else ())
+    if not quiz_data:
+        raise HTTPException(status_code=502, detail="The instructor returned no usable scenario.")
+
+    translated = await asyncio.gather(*[translations.translate_quiz(quiz_data, lang) for lang in req.languages])
+    scenarios = {}
+    for language, localized in zip(req.languages, translated):
+        if localized is not None:
+            scenarios[language] = await finish_scenario(rag, ctx, context_text, page_num, localized, req.image_width)
+    return {
+        "document_id": rag.document_id if rag else None,
+        "canonical_language": CANONICAL_LANGUAGE,
+        "scenarios": scenarios,
+        "failed": [lang for lang in req.languages if lang not in scenarios],
+    }
+
+@app.get("/scenario_pool/stats")
+async def scenario_pool_stats():
+    return scenario_pool.stats()
+
+@app.get("/images/{handle}")
+async def get_image(handle: str = Path(pattern=IMAGE_HANDLE_PATTERN), wait: float = 0):
+    """State of a deferred diagram. With `wait`, long-polls up to that many seconds for it to settle."""
+    state = await image_renders.wait(handle, min(max(wait, 0), IMAGE_LONG_POLL_SECONDS))
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Unknown image '{handle}'")
+    return state
+
+@app.get("/images/{handle}/events")
+async def stream_image(handle: str = Path(pattern=IMAGE_HANDLE_PATTERN)):
+    """Server-Sent Events: a single `ready` (or `error`) event once the diagram is drawn."""
+    if image_renders.status(handle) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown image '{handle}'")
+    return StreamingResponse(image_event_stream(image_renders, handle), media_type="text/event-stream", headers=SSE_HEADERS)
+
+async def design_scenario_batch(chunks: list[dict], target_language: str, boilerplate: tuple = ()) -> dict:
+    """Agent 2, one round trip for several source chunks. Returns { chunk_index: scenario }."""
+    logger.info(f"🧠 [AGENT 2: INSTRUCTOR] Designing {len(chunks)} scenarios in one call...")
+    # The segments share whatever the instructor's budget leaves after the template
+    room = instructor_agent.prompt_budget - approx_tokens(build_batch_prompt([{"text": ""}] * len(chunks), target_language))
+    texts = fit_segments([c["text"] for c in chunks], room, boilerplate)
+    prompt = build_batch_prompt([{**c, "text": t} for c, t in zip(chunks, texts)], target_language)
+    raw_response = await instructor_agent.run(prompt)
+    return parse_batch_response(raw_response, len(chunks))
+
+def batch_item(rag: RAGEngine, ctx: dict, quiz_data: dict, language: str) -> dict:
+    # Same shape as /generate_quiz. Only manual images are attached: one SDXL call
+    # per question would cost more than the batching saves
+    real_images = rag.pdf_images.get(ctx["page"], [])
+    quiz_data, quiz_id = answer_keys.register(quiz_data, ctx["text"])
+    return {
+        "data": quiz_data,
+        "quiz_id": quiz_id,
+        "context": ctx["text"],
+        "language": language,
+        "image_url": rag.image_fields(random.choice(real_images))["image_url"] if real_images else None,
+        "image_source": f"MANUAL EVIDENCE (PG {ctx['page'] + 1})" if real_images else None,
+        "document_id": rag.document_id,
+        "chunk": {k: ctx[k] for k in ("id", "page", "start", "end")},
+    }
+
+async def run_batch_group(rag: RAGEngine, chunks: list[dict], languages: list[str]) -> list[dict]:
+    # Canonical scenarios: cached chunks skip the upstream call, the rest share one prompt
+    canonical, missing = {}, []
+    for i, ctx in enumerate(chunks):
+        quiz_data = quiz_cache.get(cache_key(QUIZ_PROMPT_VERSION, ctx["text"], CANONICAL_LANGUAGE))
+        if quiz_data is not None:
+            canonical[i] = quiz_data
+        else:
+            missing.append(i)
+    if missing:
+        scenarios = await design_scenario_batch([chunks[i] for i in missing], CANONICAL_LANGUAGE, rag.boilerplate)
+        for j, i in enumerate(missing):
+            if j in scenarios:
+                quiz_cache.put(cache_key(QUIZ_PROMPT_VERSION, chunks[i]["text"], CANONICAL_LANGUAGE), scenarios[j])
+                canonical[i] = scenarios[j]
+
+    # Then one translation pass per language for the whole group
+    ready = sorted(canonical)
+    per_language = await asyncio.gather(*[
+        translations.translate_quizzes([canonical[i] for i in ready], language) for language in languages
+    ])
+    items = []
+    for language, translated in zip(languages, per_language):
+        if translated is None:
+            logger.warning(f"🌐 [BATCH] Dropped {len(ready)} {language} scenarios: translation failed")
+            continue
+        items.extend(batch_item(rag, chunks[i], quiz_data, language) for i, quiz_data in zip(ready, translated))
+    return items
+
+@app.post("/generate_quiz/batch")
+async def generate_quiz_batch(req: BatchQuizRequest):
+    """
+    `count` scenarios per language from one document, several chunks per ERNIE call.
+    Each chunk is written once and translated into the other languages.
+    Malformed entries are dropped, so fewer than requested may come back.
+    """
+    rag = get_document(req.tenant_id, req.document_id)
+    if not rag or not rag.chunks:
+        raise HTTPException(status_code=404, detail="No ingested document to build scenarios from.")
+
+    groups = group(sample_chunks(rag.chunks, req.count))
+    # Each group is generated once (canonical language) and translated into every language
+    tasks = [asyncio.ensure_future(run_batch_group(rag, chunks, req.languages)) for chunks in groups]
+    logger.info(f"📚 [BATCH] {req.count} x {len(req.languages)} scenarios in {len(tasks)} groups")
+
+    if req.stream:
+        async def jsonl():
+            try:
+                for next_group in asyncio.as_completed(tasks):
+                    for item in await next_group:
+                        yield json.dumps(item, ensure_ascii=False) + "\n"
+            finally:
+                # Client went away: stop the groups that haven't finished
+                for task in tasks:
+                    task.cancel()
+        return StreamingResponse(jsonl(), media_type="application/x-ndjson")
+
+    items = [item for items in await asyncio.gather(*tasks) for item in items]
+    return {
+        "document_id": rag.document_id,
+        "requested": req.count * len(req.languages),
+        "returned": len(items),
+        "scenarios": items,
+    }
+
+def audit_prompt(context_text: str, question: str, selected_option: str, target_language: str,
+                 boilerplate: tuple = ()) -> str:
+    """Agent 3 (Compliance Auditor) task prompt, within the auditor's token budget."""
+    return build_prompt(lambda source: f"""
+    CONTEXT: {source}
+    QUESTION: {question}
+    USER ANSWER: {selected_option}
     
     TASK:
     1. Evaluate correctness based strictly on context.
-    2. Provide feedback in {req.target_language}.
+    2. Provide feedback in {target_language}.
     
     OUTPUT JSON:
     {{
         "is_correct": true/false,
-        "feedback": "Explanation in {req.target_language}...",
+        "feedback": "Explanation in {target_language}...",
         "citation": "Quote from text..."
     }}
-    """
-    
-    messages = [
-        auditor_agent.system_message,
-        BaseMessage.make_user_message(role_name="User", content=prompt_content)
-    ]
-    
-    raw_response = backend.run(messages)
-    result = extract_json_from_ai_response(raw_response)
+    """, context_text, auditor_agent.prompt_budget, boilerplate)
+
+async def audit_answer(context_text: str, question: str, selected_option: str, target_language: str,
+                       boilerplate: tuple = ()):
+    """Agent 3 round trip. Returns the parsed verdict, or None if no valid reply came back."""
+    prompt = audit_prompt(context_text, question, selected_option, target_language, boilerplate)
+    return await auditor_agent.run_json(prompt, AUDIT_SCHEMA)
+
+@app.get("/agents/stats")
+async def agent_stats():
+    # Agents are constructed once; `instances` stays 1 per role however busy the server is
+    return {name: agent.stats() for name, agent in agents.items()}
+
+@app.get("/llm/stats")
+async def llm_stats():
+    # Upstream calls and per-agent prompt / completion tokens
+    return {"client": llm.stats, "usage": llm.usage.stats()}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "quiz": quiz_cache.stats(),
+        "audit": audit_cache.stats(),
+        "answer_keys": answer_keys.stats(),
+        # Calls that joined an identical in-flight request instead of going upstream
+        "llm_flights": llm.flight_stats(),
+        "image_flights": image_flights.stats(),
+        "generated_images": artist_agent.images.stats(),
+        "image_renders": image_renders.stats(),
+        "translations": translations.stats(),
+        "static_assets": assets.stats(),
+    }
+
+AUDIT_FALLBACK = {"is_correct": False, "feedback": "Auditor Error", "citation": "N/A"}
+
+def grade_locally(req: EvaluateRequest) -> Optional[dict]:
+    # Picking one of our own options is graded against the stored key in microseconds;
+    # the auditor only runs for rich feedback and free-text answers
+    if req.rich_feedback or not req.quiz_id:
+        return None
+    return answer_keys.grade(req.quiz_id, req.selected_option)
+
+def resolve_audit_context(req: EvaluateRequest):
+    """(context text, document boilerplate) for an audit."""
+    # Touch the document so an active session keeps it hot in the corpus store,
+    # and resolve the chunk server-side when the client only sent its ID
+    rag = get_document(req.tenant_id, req.document_id)
+    context_text = req.context
+    if req.chunk_id is not None and rag and 0 <= req.chunk_id < len(rag.chunks):
+        context_text = rag.chunks[req.chunk_id]["text"]
+    if not context_text:
+        raise HTTPException(status_code=400, detail="Send either 'context' or a valid 'chunk_id'.")
+    return context_text, rag.boilerplate if rag else ()
+
+@app.post("/evaluate_answer")
+async def evaluate_answer(req: EvaluateRequest):
+    verdict = grade_locally(req)
+    if verdict is not None:
+        logger.info("🔑 [ANSWER KEY] Graded locally.")
+        return verdict
+
+    # ==========================================
+    # AGENT 3: COMPLIANCE AUDITOR AGENT
+    # ==========================================
+    logger.info("⚖️ [AGENT 3: AUDITOR] Verifying compliance...")
+    context_text, boilerplate = resolve_audit_context(req)
     
+    audit_key = cache_key(AUDIT_PROMPT_VERSION, context_text, req.question, req.selected_option, req.target_language)
+    result = audit_cache.get(audit_key)
+    if result is not None:
+        logger.info("♻️ [AGENT 3: AUDITOR] Verdict served from cache.")
+    else:
+        result = await audit_answer(context_text, req.question, req.selected_option, req.target_language, boilerplate)
+        if result:
+            audit_cache.put(audit_key, result)
+
     if not result:
-        return {"is_correct": False, "feedback": "Auditor Error", "citation": "N/A"}
+        return dict(AUDIT_FALLBACK)
         
     return result
 
+@app.post("/evaluate_answer/stream")
+async def evaluate_answer_stream(req: EvaluateRequest):
+    """SSE variant: `delta` events carry the feedback text as ERNIE writes it, `result` the verdict."""
+    verdict = grade_locally(req)
+    if verdict is not None:
+        return StreamingResponse(result_stream(verdict), media_type="text/event-stream", headers=SSE_HEADERS)
+    logger.info("⚖️ [AGENT 3: AUDITOR] Verifying compliance (streaming)...")
+    context_text, boilerplate = resolve_audit_context(req)
+    audit_key = cache_key(AUDIT_PROMPT_VERSION, context_text, req.question, req.selected_option, req.target_language)
+    result = audit_cache.get(audit_key)
+    if result is not None:
+        events = result_stream(result)
+    else:
+        prompt = audit_prompt(context_text, req.question, req.selected_option, req.target_language, boilerplate)
+
+        async def finalize(verdict: Optional[dict]) -> dict:
+            if not verdict:
+                return dict(AUDIT_FALLBACK)
+            audit_cache.put(audit_key, verdict)
+            return verdict
+
+        events = json_event_stream(
+            lambda: auditor_agent.stream(prompt), AUDIT_SCHEMA, ("feedback",), finalize, counters=llm.stats
+        )
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
 if __name__ == "__main__":
     import uvicorn
     # Use port 10000 for Render
@@ -1,18 +1,17 @@
 import os
-import shutil
 import logging
 import random
 import json
-import base64
-import io
-import fitz  # PyMuPDF
+import asyncio
+import threading
 import numpy as np
-from PIL import Image
+from typing import Literal, Optional
 
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Path
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 # --- AI & ML LIBRARIES ---
@@ -22,6 +21,29 @@ from huggingface_hub import InferenceClient
 from sentence_transformers import SentenceTransformer
 import faiss
 
+from corpus import CorpusStore, DEFAULT_TENANT
+from ingestion import extract_pages, read_upload, UploadTooLarge
+from ingest_cache import IngestCache, content_hash, load_pdf_images
+from jobs import JobManager, job_event_stream
+from ocr_pipeline import OcrPipeline, needs_ocr
+from chunking import chunk_page
+from embeddings import EmbeddingCache, EmbeddingPipeline
+from vector_index import CorpusIndex, build_index, read_index, search
+from llm_client import LLMClient, LLMError
+from response_cache import ResponseCache, cache_key
+from scenario_pool import ScenarioPool
+from singleflight import SingleFlight
+from sse_stream import SSE_HEADERS, json_event_stream, result_stream
+from structured_reply import QUIZ_SCHEMA, AUDIT_SCHEMA
+from prompt_budget import PROMPT_TOKEN_BUDGETS, approx_tokens, build_prompt, fit_segments, detect_boilerplate
+from batch_quiz import BATCH_MAX_COUNT, sample_chunks, group, build_batch_prompt, parse_batch_response
+from answer_key import AnswerKeyStore
+from translation_memory import CANONICAL_LANGUAGE, TRANSLATION_LANGUAGES, TRANSLATION_SCHEMA, TranslationMemory
+from generated_images import GeneratedImageCache, ImmutableStaticFiles
+from asset_store import AssetStore
+from image_variants import DEFAULT_DISPLAY_WIDTH, derive_images, image_fields, refit_image_fields
+from image_renders import IMAGE_HANDLE_PATTERN, IMAGE_LONG_POLL_SECONDS, ImageRenders, image_event_stream
+
 # ==========================================
 # 1. SETUP & CONFIGURATION
 # ==========================================
@@ -29,19 +51,35 @@ load_dotenv()
 AI_STUDIO_TOKEN = os.getenv("AI_STUDIO_TOKEN")
 HF_TOKEN = os.getenv("HF_TOKEN")
 
+# Memory budget for documents kept hot in the corpus store (cold ones are evicted LRU)
+CORPUS_MEMORY_BUDGET_MB = int(os.getenv("CORPUS_MEMORY_BUDGET_MB", "256"))
+# Scenarios are drawn from the N chunks closest to the requested topic
+QUIZ_TOP_K = int(os.getenv("QUIZ_TOP_K", "5"))
+# Language pre-built into the scenario pool as soon as a document is ingested
+DEFAULT_LANGUAGE = os.getenv("DEFAULT_LANGUAGE", "English")
+
 if not AI_STUDIO_TOKEN or not HF_TOKEN:
     raise RuntimeError("Missing API Tokens in .env file")
 
 erniebot.api_type = "aistudio"
 erniebot.access_token = AI_STUDIO_TOKEN
+# Shared by every agent: pooled keep-alive connections + a cap on in-flight ERNIE calls
+llm = LLMClient(access_token=AI_STUDIO_TOKEN)
 
 # Initialize Hugging Face Client for Image Gen
 hf_client = InferenceClient(token=HF_TOKEN)
+SDXL_MODEL = "stabilityai/stable-diffusion-xl-base-1.0"
+image_flights = SingleFlight()
+STATIC_BASE_URL = "http://localhost:8000/static"
 
 # Initialize Embedding & OCR
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
+EMBED_MODEL = 'all-MiniLM-L6-v2'
+embedder = SentenceTransformer(EMBED_MODEL)
+# Shared across documents: a chunk seen in any earlier upload is never re-encoded
+embed_cache = EmbeddingCache(EMBED_MODEL, embedder.get_sentence_embedding_dimension())
 logging.getLogger("ppocr").setLevel(logging.ERROR)
-ocr = PaddleOCR(use_angle_cls=True, lang="ch") 
+# One PaddleOCR instance per OCR worker thread, created on first use
+ocr_pipeline = OcrPipeline(lambda: PaddleOCR(use_angle_cls=True, lang="ch"))
 
 app = FastAPI(title="SkillSync: Universal Training OS")
 
@@ -49,200 +87,552 @@ app = FastAPI(title="SkillSync: Universal Training OS")
 if not os.path.exists("static_images"):
     os.makedirs("static_images")
 
-# Clean static folder on startup to prevent stale images
-for f in os.listdir("static_images"):
-    os.remove(os.path.join("static_images", f))
+# Static folder is NOT cleaned on startup any more: document folders are named
+# by PDF hash, so images stay valid across restarts (see ingestion cache).
+# Its size is bounded instead: least recently used folders / diagrams are evicted
+# past STATIC_DISK_BUDGET_MB, except those of live documents.
+assets = AssetStore("static_images", pinned=lambda: corpus.document_ids() | jobs.active_documents())
+# Generated diagrams live under static_images/generated, keyed by model + query.
+generated_images = GeneratedImageCache("static_images", SDXL_MODEL, url_prefix=STATIC_BASE_URL, assets=assets)
+# Diagrams render in the background; scenarios carry a handle the client resolves later
+image_renders = ImageRenders(
+    generated_images, image_flights, fallback_url="https://placehold.co/600x400?text=No+Image+Available"
+)
 
-app.mount("/static", StaticFiles(directory="static_images"), name="static")
+# Nothing under /static changes once written: serve it with immutable cache headers
+app.mount("/static", ImmutableStaticFiles(directory="static_images", on_access=assets.touch_path), name="static")
 
 app.add_middleware(
     CORSMiddleware, allow_origins=["*"], allow_credentials=True, 
     allow_methods=["*"], allow_headers=["*"]
 )
 
+@app.on_event("startup")
+async def bind_scenario_pool():
+    # Ingestion threads schedule pool fills onto this loop
+    scenario_pool.bind_loop(asyncio.get_running_loop())
+
+@app.on_event("startup")
+async def enforce_asset_budget():
+    # The index was rebuilt at import; a lowered budget takes effect before the first upload
+    await run_in_threadpool(assets.enforce)
+
+@app.on_event("shutdown")
+async def close_llm_client():
+    await llm.close()
+
+@app.on_event("shutdown")
+async def flush_asset_index():
+    # Last-access times since the previous periodic save
+    assets.flush(force=True)
+
 # ==========================================
 # 2. RAG ENGINE (Robust Image Extraction)
 # ==========================================
 class RAGEngine:
-    def __init__(self):
+    def __init__(self, tenant_id=DEFAULT_TENANT, document_id="default", ocr_dpi=None):
+        self.tenant_id = tenant_id
+        self.document_id = document_id
+        self.ocr_dpi = ocr_dpi  # None -> OCR_DPI default
         self.chunks = []      
         self.index = None     
+        self.embeddings = None  # row i = chunk i; memory-mapped when loaded from the cache
         self.pdf_images = {}  # { page_num: [filename1, filename2] }
+        self.image_meta = {}  # { filename: original size + web variants }
+        self._boilerplate = None
+        # Document IDs are PDF content hashes, so identical uploads share one image folder
+        self.image_dir = os.path.join("static_images", document_id)
+
+    @property
+    def boilerplate(self):
+        # Running headers / footers, detected once per loaded document and stripped from prompts
+        if self._boilerplate is None and self.chunks:
+            self._boilerplate = detect_boilerplate(self.chunks)
+        return self._boilerplate or ()
+
+    def static_url(self, filename):
+        return f"{STATIC_BASE_URL}/{self.document_id}/{filename}"
+
+    def image_fields(self, filename, display_width=DEFAULT_DISPLAY_WIDTH):
+        # URL of the web variant that fits `display_width`, its size and a srcset
+        return image_fields(filename, self.image_meta.get(filename), display_width, self.static_url)
+
+    def load_cached(self):
+        # Restore a previous ingestion of the same bytes (chunks, images, embeddings, FAISS index)
+        manifest = ingest_cache.load(self.document_id, tenant_id=self.tenant_id)
+        if manifest is None or not os.path.isdir(self.image_dir):
+            return False
+        embeddings = manifest["arrays"].get("embeddings")
+        if embeddings is None or len(embeddings) != len(manifest["chunks"]):
+            return False
+        self.chunks = manifest["chunks"]
+        self.pdf_images = load_pdf_images(manifest)
+        self.image_meta = manifest.get("image_meta", {})
+        self.embeddings = embeddings
+        self.index = self.cached_index(embeddings)
+        return True
+
+    def cached_index(self, embeddings):
+        # Memory-mapped where possible: the index pages in lazily instead of being rebuilt.
+        # A missing or unreadable index file, or one out of step with the (memory-mapped)
+        # embeddings, is rebuilt from them instead of failing the load
+        index_path = ingest_cache.path(self.document_id, "index.faiss")
+        try:
+            index = read_index(index_path)
+            if index.ntotal == len(embeddings) and index.d == embeddings.shape[1]:
+                return index
+        except RuntimeError:
+            pass
+        print(f"⚠️ Rebuilding the vector index of {self.document_id} from its cached embeddings")
+        return build_index(embeddings)
+
+    def save_cached(self, embeddings):
+        ingest_cache.save(
+            self.document_id, self.chunks, self.pdf_images, tenant_id=self.tenant_id,
+            arrays={"embeddings": embeddings},
+            extra_files={"index.faiss": lambda path: faiss.write_index(self.index, path)},
+            image_meta=self.image_meta,
+        )
+
+    def memory_bytes(self):
+        # Rough footprint used by the corpus store's memory budget
+        size = sum(len(c["text"]) + 64 for c in self.chunks)
+        size += sum(len(f) + 16 for imgs in self.pdf_images.values() for f in imgs)
+        size += sum(256 + 128 * len(meta["variants"]) for meta in self.image_meta.values())
+        if self.index is not None:
+            size += self.index.ntotal * self.index.d * 4
+        # Memory-mapped embeddings live in the page cache, not the process
+        if self.embeddings is not None and not isinstance(self.embeddings, np.memmap):
+            size += self.embeddings.nbytes
+        return size
     
     def clear(self):
         self.chunks = []
         self.index = None
+        self.embeddings = None
         self.pdf_images = {}
+        self.image_meta = {}
         # We don't delete files here anymore to avoid 404s during user session
         # We only clean on startup or new upload
 
-    def ingest_pdf(self, pdf_path):
+    def ingest_pdf(self, pdf, workers=None, job=None):
+        # `pdf` is a path or an in-memory buffer (bytes / memoryview)
         self.clear()
-        doc = fitz.open(pdf_path)
         all_texts = []
+        pipeline = EmbeddingPipeline(lambda texts: embedder.encode(texts, batch_size=len(texts)), embed_cache)
         
-        print(f"📂 Processing PDF with {len(doc)} pages...")
+        print(f"📂 Processing PDF {self.document_id[:12]}...")
 
-        for page_num, page in enumerate(doc):
-            # --- TASK A: TEXT EXTRACTION ---
-            text = page.get_text()
-            
-            # OCR Fallback
-            if len(text) < 50:
-                print(f"⚠️ Page {page_num} seems scanned. Engaging OCR...")
-                pix = page.get_pixmap()
-                img_path = f"temp_ocr_{page_num}.png"
-                pix.save(img_path)
-                try:
-                    result = ocr.ocr(img_path, cls=True)
-                    if result and result[0]:
-                        text = " ".join([line[1][0] for line in result[0]])
-                except: pass
-                if os.path.exists(img_path): os.remove(img_path)
+        # Background jobs get page/image counts as slices finish, chunk counts after OCR.
+        # Pages with a text layer are chunked and embedded right away, overlapping
+        # with the slices still being extracted; scanned pages follow after OCR.
+        def report(batch, page_total):
+            if job is not None:
+                job.update(pages_total=page_total)
+                job.add_progress(pages_done=len(batch), images=sum(len(p["images"]) for p in batch))
+            pipeline.submit([
+                chunk["text"] for p in batch if not needs_ocr(p["text"])
+                for chunk in chunk_page(p["text"], p["page"])
+            ])
+
+        # --- TASK A + B: TEXT & IMAGE EXTRACTION (parallel across the ingestion pool) ---
+        # Filter: Ignore very small icons, but keep medium diagrams (3KB threshold)
+        pages = extract_pages(pdf, self.image_dir, min_image_bytes=3072, workers=workers, on_progress=report)
 
+        # OCR Fallback: only pages without a usable text layer, batched in memory
+        scanned = [p["page"] for p in pages if needs_ocr(p["text"])]
+        if scanned:
+            print(f"⚠️ {len(scanned)} pages seem scanned. Engaging OCR...")
+        ocr_texts = ocr_pipeline.ocr_pages(pdf, scanned, dpi=self.ocr_dpi)
+
+        for page in pages:
+            page_num = page["page"]
+            text = ocr_texts.get(page_num, page["text"])
+
+            # Sentence-aligned sub-page windows, each embedded on its own
             if len(text) > 20:
-                self.chunks.append({"text": text, "page": page_num})
-                all_texts.append(text)
-
-            # --- TASK B: IMAGE EXTRACTION (CRITICAL) ---
-            image_list = page.get_images(full=True)
-            if image_list:
-                self.pdf_images[page_num] = []
-                for img_index, img in enumerate(image_list):
-                    try:
-                        xref = img[0]
-                        base_image = doc.extract_image(xref)
-                        image_bytes = base_image["image"]
-                        ext = base_image["ext"]
-                        
-                        # Filter: Ignore very small icons, but keep medium diagrams
-                        # Lowered threshold to 3KB to catch smaller diagrams
-                        if len(image_bytes) < 3072: continue
-
-                        filename = f"p{page_num}_img{img_index}.{ext}"
-                        filepath = os.path.join("static_images", filename)
-                        
-                        with open(filepath, "wb") as f:
-                            f.write(image_bytes)
-                        
-                        self.pdf_images[page_num].append(filename)
-                    except Exception as e:
-                        print(f"❌ Image extract error on pg {page_num}: {e}")
+                for chunk in chunk_page(text, page_num):
+                    chunk["id"] = len(self.chunks)
+                    self.chunks.append(chunk)
+                    all_texts.append(chunk["text"])
+                    if job is not None: job.add_progress(chunks=1)
+
+            if page["images"]:
+                self.pdf_images[page_num] = page["images"]
+
+        # Width-bounded WebP / JPEG copies of every kept image (the originals can be multi-MB scans)
+        self.image_meta = derive_images(self.image_dir, [f for imgs in self.pdf_images.values() for f in imgs])
 
         # 3. BUILD VECTOR INDEX
         if all_texts:
-            embeddings = embedder.encode(all_texts)
-            self.index = faiss.IndexFlatL2(embeddings.shape[1])
-            self.index.add(np.array(embeddings).astype('float32'))
+            embeddings = pipeline.finish(all_texts)
+            # Exact for normal manuals, HNSW / IVF once the chunk count gets large
+            self.index = build_index(embeddings)
+            self.embeddings = embeddings
+            self.save_cached(embeddings)
             
-            msg = f"✅ RAG Ready: {len(all_texts)} chunks, Images found on {len(self.pdf_images)} pages."
+            msg = f"✅ RAG Ready: {len(all_texts)} chunks ({pipeline.encoded} embedded, {pipeline.reused} from cache), Images found on {len(self.pdf_images)} pages."
             print(msg)
             return msg
         return "⚠️ Error: No text extracted."
 
     def get_random_context(self):
         if not self.chunks: 
-            return {"text": "No content available.", "page": 0}
+            return {"text": "No content available.", "page": 0, "id": None, "start": 0, "end": 0}
         return random.choice(self.chunks)
 
-rag_engine = RAGEngine()
+    def get_topic_context(self, topic, k=QUIZ_TOP_K):
+        # The default "General" topic keeps the old behaviour: any chunk of the manual
+        if not topic or topic.strip().lower() == "general" or self.index is None:
+            return self.get_random_context()
+        hits = search(self.index, embedder.encode([topic])[0], k)
+        if not hits:
+            return self.get_random_context()
+        # A random pick among the top-k keeps repeated requests on one topic varied
+        return self.chunks[random.choice(hits)]
+
+# v3: manifests carry image variant metadata
+ingest_cache = IngestCache(profile="full-v3")
+
+def release_document(engine):
+    scenario_pool.drop_document_threadsafe(engine.tenant_id, engine.document_id)
+    # The tenant-wide index still holds the evicted vectors; it is rebuilt on next use
+    with tenant_index_lock:
+        tenant_indexes.pop(engine.tenant_id, None)
+
+# Evicted documents only leave memory; their cache entry and images stay on disk
+corpus = CorpusStore(
+    memory_budget_bytes=CORPUS_MEMORY_BUDGET_MB * 1024 * 1024,
+    on_evict=release_document,
+)
+# { tenant_id: CorpusIndex } over the tenant's loaded documents (scope="tenant" topic search)
+tenant_indexes = {}
+tenant_index_lock = threading.Lock()
+jobs = JobManager()
+
+# Bump a version whenever its prompt changes, so stale cached answers are never served
+QUIZ_PROMPT_VERSION = "quiz-v2"
+AUDIT_PROMPT_VERSION = "audit-v1"
+quiz_cache = ResponseCache("full-quiz")
+audit_cache = ResponseCache("full-audit")
+# Correct option + supporting span per generated scenario, never sent to the client
+answer_keys = AnswerKeyStore("full-answer-keys")
+
+def get_document(tenant_id, document_id):
+    # Cold (evicted / pre-restart) documents are reloaded from the ingestion cache.
+    # Unknown IDs are a 404; a missing ID means the tenant's latest upload
+    # (an empty engine only when the tenant never uploaded anything)
+    if document_id is None:
+        document_id = corpus.latest(tenant_id)
+        if document_id is None:
+            return RAGEngine(tenant_id)
+    engine = corpus.get(tenant_id, document_id)
+    if engine is None:
+        engine = RAGEngine(tenant_id, document_id)
+        # Also fails once the document's images were evicted from disk (re-upload restores them)
+        if not engine.load_cached():
+            raise HTTPException(status_code=404, detail=f"Unknown document '{document_id}'")
+        corpus.put(tenant_id, document_id, engine)
+        assets.touch(document_id)
+    return engine
+
+def tenant_topic_context(tenant_id, topic, k=QUIZ_TOP_K):
+    # Topic search across every loaded document of the tenant: (engine, chunk) of a
+    # random top-k hit, or None. The combined index is rebuilt when the set of
+    # loaded documents changes (upload, eviction, delete)
+    engines = {}
+    for document_id in sorted(corpus.list_documents(tenant_id)):
+        engine = corpus.peek(tenant_id, document_id)
+        if engine is not None and engine.embeddings is not None:
+            engines[document_id] = engine
+    if not engines:
+        return None
+    with tenant_index_lock:
+        index = tenant_indexes.get(tenant_id)
+        if index is None or index.document_ids != list(engines):
+            index = tenant_indexes[tenant_id] = CorpusIndex({d: e.embeddings for d, e in engines.items()})
+    hits = index.search(embedder.encode([topic])[0], k)
+    if not hits:
+        return None
+    document_id, row = random.choice(hits)
+    return engines[document_id], engines[document_id].chunks[row]
+
+async def topic_context(rag_engine, topic, scope="document"):
+    # (engine, chunk) for `topic`; with scope="tenant" the chunk may come from any of
+    # the tenant's loaded documents. Embedding the topic is CPU work; keep it off the event loop
+    if scope == "tenant" and topic and topic.strip().lower() != "general":
+        hit = await run_in_threadpool(tenant_topic_context, rag_engine.tenant_id, topic)
+        if hit is not None:
+            return hit
+    return rag_engine, await run_in_threadpool(rag_engine.get_topic_context, topic)
 
 # ==========================================
 # 3. HELPER FUNCTIONS
 # ==========================================
-def run_agent(role, prompt, context=""):
+AGENT_ROLES = {"instructor": "Expert Instructor", "auditor": "Compliance Auditor", "translator": "Technical Translator"}
+
+def agent_messages(agent, prompt):
+    # The prompt already carries its source text; it used to be sent a second time as "Context"
+    return [{"role": "user", "content": f"System: You are {AGENT_ROLES[agent]}. Task: {prompt}"}]
+
+def prompt_room(agent):
+    # Tokens left for the task prompt once the role framing is paid for
+    return PROMPT_TOKEN_BUDGETS[agent] - approx_tokens(agent_messages(agent, "")[0]["content"])
+
+async def run_agent(agent, prompt):
+    # Awaited on the shared async client: a slow ERNIE call no longer blocks the event loop
     try:
-        response = erniebot.ChatCompletion.create(
-            model="ernie-3.5",
-            messages=[
-                {"role": "user", "content": f"System: You are {role}. Context: {context}. Task: {prompt}"}
-            ]
-        )
-        return response.get_result()
-    except Exception as e: return str(e)
+        return await llm.chat(agent_messages(agent, prompt), tag=agent)
+    except LLMError as e: return str(e)
+
+async def run_agent_json(agent, prompt, schema):
+    # Reply checked against `schema` while it streams in; malformed output is cut off
+    # and retried. None once the retry budget is spent.
+    try:
+        return await llm.chat_json(agent_messages(agent, prompt), schema, tag=agent)
+    except LLMError: return None
+
+def stream_agent_json(agent, prompt, schema, fields, finalize):
+    # SSE events: `delta` per new text of `fields`, `retry`, then `result` of finalize(obj)
+    return json_event_stream(
+        lambda: llm.stream(agent_messages(agent, prompt), tag=agent), schema, fields, finalize, counters=llm.stats
+    )
 
 # Function to generate high-quality technical image via Hugging Face
 def generate_technical_image(query):
+    # Drawn once per (model, normalised query); later requests reuse the file on disk
+    cached_url = generated_images.lookup(query)
+    if cached_url:
+        return cached_url
     try:
         # Prompt engineering for schematic look
         enhanced_prompt = f"technical schematic drawing of {query}, blueprint style, white on blue background, high detail, engineering diagram, no text"
         
         image = hf_client.text_to_image(
             prompt=enhanced_prompt,
-            model="stabilityai/stable-diffusion-xl-base-1.0"
+            model=SDXL_MODEL
         )
         
-        # Convert to Base64 to send to frontend without saving to disk
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        return f"data:image/png;base64,{img_str}"
+        return generated_images.store(query, image)
     except Exception as e:
         print(f"HF Generation Failed: {e}")
         return None
 
 # --- DATA MODELS ---
+# Tenant and document IDs become folder names under /static, so keep them path-safe
+ID_PATTERN = r"^[A-Za-z0-9_-]{1,64}$"
+
 class QuizRequest(BaseModel):
     topic: str = "General"
     target_language: str = "English" 
+    tenant_id: str = Field(DEFAULT_TENANT, pattern=ID_PATTERN)
+    document_id: Optional[str] = Field(None, pattern=ID_PATTERN)
+    # CSS pixels x device pixel ratio of the image slot; picks the manual image variant
+    image_width: int = Field(DEFAULT_DISPLAY_WIDTH, ge=64, le=4096)
+    # "tenant": search the topic across all of the tenant's loaded documents
+    scope: Literal["document", "tenant"] = "document"
+
+class TranslateAllRequest(BaseModel):
+    topic: str = "General"
+    scope: Literal["document", "tenant"] = "document"
+    # Defaults to every configured language (TRANSLATION_LANGUAGES)
+    languages: list[str] = Field(default_factory=lambda: list(TRANSLATION_LANGUAGES), min_length=1, max_length=16)
+    tenant_id: str = Field(DEFAULT_TENANT, pattern=ID_PATTERN)
+    document_id: Optional[str] = Field(None, pattern=ID_PATTERN)
+    image_width: int = Field(DEFAULT_DISPLAY_WIDTH, ge=64, le=4096)
+
+class BatchQuizRequest(BaseModel):
+    count: int = Field(10, ge=1, le=BATCH_MAX_COUNT)
+    languages: list[str] = Field(default_factory=lambda: [DEFAULT_LANGUAGE], min_length=1, max_length=8)
+    # True -> one JSON object per line (application/x-ndjson) as each upstream call finishes
+    stream: bool = False
+    tenant_id: str = Field(DEFAULT_TENANT, pattern=ID_PATTERN)
+    document_id: Optional[str] = Field(None, pattern=ID_PATTERN)
 
 class AnswerRequest(BaseModel):
     question: str
     selected_option: str
-    context: str
+    # Either send the context back, or just the chunk_id returned by /generate_quiz
+    context: str = ""
+    chunk_id: Optional[int] = None
+    # quiz_id from /generate_quiz: multiple-choice answers are graded against the stored key
+    quiz_id: Optional[str] = None
+    # True -> always ask the Compliance Auditor for a written explanation
+    rich_feedback: bool = False
     target_language: str = "English"
+    tenant_id: str = Field(DEFAULT_TENANT, pattern=ID_PATTERN)
+    document_id: Optional[str] = Field(None, pattern=ID_PATTERN)
 
 # ==========================================
 # 4. API ENDPOINTS
 # ==========================================
 
+def load_upload(src):
+    # No temp copy: read (or memory-map) the spooled body; its hash is the document ID
+    pdf = read_upload(src)
+    return pdf, content_hash(pdf)
+
+def run_ingestion(job, pdf, ocr_dpi=None):
+    # Background job body: corpus hit -> cache hit -> full OCR + embedding ingestion.
+    # Note: the cache is keyed by PDF bytes only, so ocr_dpi applies to the first ingestion.
+    tenant_id, document_id = job.tenant_id, job.document_id
+    if corpus.get(tenant_id, document_id) is not None:
+        return "✅ Document already loaded."
+
+    rag_engine = RAGEngine(tenant_id, document_id, ocr_dpi=ocr_dpi)
+    if ingest_cache.contains(document_id):
+        ingest_cache.set_tenant_access(document_id, tenant_id)
+    if rag_engine.load_cached():
+        # Same bytes seen before: skip OCR + embedding entirely
+        job.update(chunks=len(rag_engine.chunks))
+        status_message = f"✅ RAG Restored from cache: {len(rag_engine.chunks)} chunks."
+    else:
+        status_message = rag_engine.ingest_pdf(pdf, job=job) 
+
+    corpus.put(tenant_id, document_id, rag_engine)
+    # The document is live (pinned) now; older image folders make room for it if needed
+    assets.record(document_id)
+    # Start pre-building scenarios so the first /generate_quiz doesn't wait on ERNIE + SDXL
+    scenario_pool.ensure_threadsafe(tenant_id, document_id, DEFAULT_LANGUAGE)
+    return status_message
+
 @app.post("/upload")
-async def upload(file: UploadFile = File(...)):
-    temp = f"temp_{file.filename}"
-    with open(temp, "wb") as b: shutil.copyfileobj(file.file, b)
-    
-    status_message = rag_engine.ingest_pdf(temp) 
-    
-    if os.path.exists(temp): os.remove(temp)
-    return {"status": "success", "info": status_message}
+async def upload(
+    file: UploadFile = File(...),
+    tenant_id: str = Form(DEFAULT_TENANT, pattern=ID_PATTERN),
+    ocr_dpi: Optional[int] = Form(None, ge=72, le=600),
+):
+    # Returns immediately; follow /jobs/{job_id}/events for progress
+    try:
+        pdf, document_id = await run_in_threadpool(load_upload, file.file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    job = jobs.submit(tenant_id, document_id, lambda job: run_ingestion(job, pdf, ocr_dpi))
+    return {"status": "queued", "info": "⏳ Ingestion queued.", "job_id": job.job_id, "document_id": document_id, "tenant_id": tenant_id}
 
-@app.post("/generate_quiz")
-async def generate_quiz(req: QuizRequest):
-    # 1. Agent A: Context & Text Generation
-    context_data = rag_engine.get_random_context()
-    text_context = context_data["text"]
-    page_num = context_data["page"]
-    
-    # Multilingual Prompt
-    prompt = f"""
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return job.snapshot()
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job(job_id: str):
+    # Server-Sent Events: `progress` while ingesting, then `done` or `error`
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return StreamingResponse(
+        job_event_stream(job), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/documents")
+async def list_documents(tenant_id: str = DEFAULT_TENANT):
+    return {"tenant_id": tenant_id, "documents": corpus.list_documents(tenant_id), "store": corpus.stats()}
+
+@app.delete("/documents/{document_id}")
+async def delete_document(document_id: str, tenant_id: str = DEFAULT_TENANT):
+    dropped = corpus.drop(tenant_id, document_id)
+    scenario_pool.drop_document(tenant_id, document_id)
+    if not dropped and not ingest_cache.contains(document_id):
+        raise HTTPException(status_code=404, detail=f"Unknown document '{document_id}'")
+    # Revoke the tenant's access so the document isn't lazily reloaded from cache
+    ingest_cache.set_tenant_access(document_id, tenant_id, allowed=False)
+    return {"status": "deleted", "document_id": document_id}
+
+def quiz_prompt(text_context, target_language, boilerplate=()):
+    # Multilingual Prompt, within the instructor's token budget
+    return build_prompt(lambda source: f"""
     Analyze the text below (Source Material).
     1. Create a relevant multiple-choice training scenario based on the text.
-    2. IMPORTANT: The output must be completely translated into {req.target_language}.
-    3. Even if the source text is different, your output JSON must be in {req.target_language}.
+    2. IMPORTANT: The output must be completely translated into {target_language}.
+    3. Even if the source text is different, your output JSON must be in {target_language}.
     
     Output strictly valid JSON (no markdown):
     {{
-        "scenario": "Description of the situation (in {req.target_language}).",
-        "question": "The specific question (in {req.target_language}).",
-        "options": ["Option A (in {req.target_language})", "Option B", "Option C", "Option D"],
+        "scenario": "Description of the situation (in {target_language}).",
+        "question": "The specific question (in {target_language}).",
+        "options": ["Option A (in {target_language})", "Option B", "Option C", "Option D"],
+        "correct_option": 0,
+        "source_span": "The sentence of the source text that proves the answer, copied verbatim (original language).",
+        "explanation": "Why that option is correct (in {target_language}).",
         "visual_query": "A precise English description of the object or equipment for a technical diagram."
     }}
+    Exactly one option is correct; "correct_option" is its index in "options".
     
-    Source Text Segment: {text_context[:1500]}...
-    """
-    
-    raw_response = run_agent("Expert Instructor", prompt, text_context)
-    clean_json = raw_response.replace("```json", "").replace("```", "").strip()
-    
-    try:
-        quiz_data = json.loads(clean_json)
-    except:
-        quiz_data = {
-            "scenario": f"System Analysis (Translation failed for {req.target_language}).",
-            "question": "Select protocol:",
-            "options": ["Proceed", "Hold", "Restart", "Abort"],
-            "visual_query": "schematic diagram"
-        }
+    Source Text Segment: {source}
+    """, text_context, prompt_room("instructor"), boilerplate)
+
+def fallback_quiz(target_language):
+    return {
+        "scenario": f"System Analysis (Translation failed for {target_language}).",
+        "question": "Select protocol:",
+        "options": ["Proceed", "Hold", "Restart", "Abort"],
+        "visual_query": "schematic diagram"
+    }
+
+# Scenarios are written once, in CANONICAL_LANGUAGE, and translated segment by segment
+translations = TranslationMemory(
+    "full-translations",
+    lambda prompt: run_agent_json("translator", prompt, TRANSLATION_SCHEMA),
+    prompt_room("translator"),
+)
+
+async def canonical_scenario(rag_engine, text_context):
+    # The chunk's scenario in CANONICAL_LANGUAGE, from cache or generated; None if the reply was unusable
+    quiz_key = cache_key(QUIZ_PROMPT_VERSION, text_context, CANONICAL_LANGUAGE)
+    quiz_data = quiz_cache.get(quiz_key)
+    if quiz_data is None:
+        prompt = quiz_prompt(text_context, CANONICAL_LANGUAGE, rag_engine.boilerplate)
+        quiz_data = await run_agent_json("instructor", prompt, QUIZ_SCHEMA)
+        if quiz_data is not None:
+            quiz_cache.put(quiz_key, quiz_data)
+    return quiz_data
+
+async def localized_scenario(rag_engine, text_context, target_language):
+    # The chunk's scenario in target_language (see localize_scenario); None if all fails
+    quiz_data = await canonical_scenario(rag_engine, text_context)
+    return await localize_scenario(rag_engine, quiz_data, text_context, target_language)
+
+async def localize_scenario(rag_engine, quiz_data, text_context, target_language):
+    # A canonical scenario through the translation memory. If the translator
+    # fails, the instructor writes it in the target language directly (as before)
+    if quiz_data is None or target_language == CANONICAL_LANGUAGE:
+        return quiz_data
+    translated = await translations.translate_quiz(quiz_data, target_language)
+    if translated is not None:
+        return translated
+    print(f"🌐 Translation to {target_language} failed; generating it directly.")
+    quiz_key = cache_key(QUIZ_PROMPT_VERSION, text_context, target_language)
+    quiz_data = quiz_cache.get(quiz_key)
+    if quiz_data is None:
+        prompt = quiz_prompt(text_context, target_language, rag_engine.boilerplate)
+        quiz_data = await run_agent_json("instructor", prompt, QUIZ_SCHEMA)
+        if quiz_data is not None:
+            quiz_cache.put(quiz_key, quiz_data)
+    return quiz_data
+
+async def build_scenario(rag_engine, target_language, topic="General", display_width=DEFAULT_DISPLAY_WIDTH,
+                         scope="document"):
+    # One complete scenario (quiz JSON, image, context). Returns (response, generated);
+    # generated is False when the agent reply was unusable and the placeholder was used.
+    # 1. Agent A: Context & Text Generation
+    rag_engine, context_data = await topic_context(rag_engine, topic, scope)
+    text_context = context_data["text"]
+
+    # One generation per chunk (canonical language); other languages are translations of it
+    quiz_data = await localized_scenario(rag_engine, text_context, target_language)
+    generated = quiz_data is not None
+    if not generated:
+        quiz_data = fallback_quiz(target_language)
+
+    return await finish_scenario(rag_engine, context_data, quiz_data, display_width), generated
+
+async def finish_scenario(rag_engine, context_data, quiz_data, display_width=DEFAULT_DISPLAY_WIDTH):
+    text_context = context_data["text"]
+    page_num = context_data["page"]
 
     # 2. Agent C (Visual Logic): STRICT PRIORITY -> PDF > HF > Placeholder
     
@@ -251,37 +641,255 @@ async def generate_quiz(req: QuizRequest):
     
     image_url = ""
     image_source = ""
+    image_status = "ready"
+    image_handle = None
+    image_size = {"image_width": None, "image_height": None, "image_srcset": None}
     
     if real_images:
         # ✅ FOUND REAL EVIDENCE
         selected_image = random.choice(real_images)
-        image_url = f"http://localhost:8000/static/{selected_image}"
+        # Web variant sized for the client, not the raw extracted file
+        image_size = rag_engine.image_fields(selected_image, display_width)
+        image_url = image_size.pop("image_url")
         image_source = f"MANUAL EVIDENCE (PG {page_num + 1})"
     else:
-        # ⚠️ NO PDF IMAGE -> GENERATE VIA HUGGING FACE
-        print(f"🎨 Generating AI Image for: {quiz_data['visual_query']}")
-        generated_b64 = generate_technical_image(quiz_data.get("visual_query", "structure"))
-        
-        if generated_b64:
-            image_url = generated_b64
-            image_source = "AI RECONSTRUCTION (Stable Diffusion)"
-        else:
-            # Last resort fallback if HF fails
-            image_url = "https://placehold.co/600x400?text=No+Image+Available"
-            image_source = "IMAGE DATA MISSING"
+        # ⚠️ NO PDF IMAGE -> GENERATE VIA HUGGING FACE (in the background)
+        visual_query = quiz_data.get("visual_query", "structure")
+        print(f"🎨 Requesting AI Image for: {visual_query}")
+        # The scenario goes out now; the image resolves later via /images/{handle}
+        # (the placeholder URL if HF fails)
+        image = image_renders.request(visual_query, lambda: run_in_threadpool(generate_technical_image, visual_query))
+        image_url, image_status, image_handle = image["url"], image["status"], image["handle"]
+        image_source = "AI RECONSTRUCTION (Stable Diffusion)"
+
+    # The answer key stays on the server; the client only gets its quiz_id
+    quiz_data, quiz_id = answer_keys.register(quiz_data, text_context)
 
     return {
         "data": quiz_data,
+        "quiz_id": quiz_id,
         "context": text_context,
         "image_url": image_url,
-        "image_source": image_source
+        **image_size,
+        "image_source": image_source,
+        # "pending" until the diagram is drawn; poll /images/{image_handle} for the URL
+        "image_status": image_status,
+        "image_handle": image_handle,
+        "document_id": rag_engine.document_id,
+        # Exact span the scenario was built from (page + character offsets)
+        "chunk": {k: context_data[k] for k in ("id", "page", "start", "end")}
     }
 
-@app.post("/evaluate_answer")
-async def evaluate_answer(req: AnswerRequest):
-    # 3. Agent B (Auditor)
-    prompt = f"""
-    Context: {req.context}
+async def produce_pooled_scenario(tenant_id, document_id, language):
+    # Pool filling never reloads or re-heats a document; placeholders are not pooled
+    rag_engine = corpus.peek(tenant_id, document_id)
+    if rag_engine is None or not rag_engine.chunks:
+        return None
+    scenario, generated = await build_scenario(rag_engine, language)
+    return scenario if generated else None
+
+# Buffers only for the languages the app offers; other languages are built on demand
+scenario_pool = ScenarioPool(produce_pooled_scenario, {DEFAULT_LANGUAGE, CANONICAL_LANGUAGE, *TRANSLATION_LANGUAGES})
+
+@app.post("/generate_quiz")
+async def generate_quiz(req: QuizRequest):
+    rag_engine = get_document(req.tenant_id, req.document_id)
+    # Pooled scenarios are drawn from random chunks, so only untargeted requests use them
+    if rag_engine.chunks and req.topic.strip().lower() == "general":
+        scenario = scenario_pool.pop(req.tenant_id, rag_engine.document_id, req.target_language)
+        if scenario is not None:
+            # Pooled scenarios are built at the default width; serve the variant this client asked for
+            scenario = refit_image_fields(scenario, req.image_width)
+            print("⚡ Served a pre-built scenario from the pool.")
+            return image_renders.refresh(scenario)
+    scenario, _ = await build_scenario(rag_engine, req.target_language, req.topic, req.image_width, req.scope)
+    return scenario
+
+@app.post("/generate_quiz/stream")
+async def generate_quiz_stream(req: QuizRequest):
+    # SSE variant of /generate_quiz: `delta` events carry the scenario and question
+    # text as ERNIE writes it; the final `result` event is the /generate_quiz payload
+    rag_engine = get_document(req.tenant_id, req.document_id)
+    if rag_engine.chunks and req.topic.strip().lower() == "general":
+        scenario = scenario_pool.pop(req.tenant_id, rag_engine.document_id, req.target_language)
+        if scenario is not None:
+            # Pooled scenarios are built at the default width; serve the variant this client asked for
+            scenario = refit_image_fields(scenario, req.image_width)
+            return StreamingResponse(
+                result_stream(image_renders.refresh(scenario)), media_type="text/event-stream", headers=SSE_HEADERS
+            )
+
+    rag_engine, context_data = await topic_context(rag_engine, req.topic, req.scope)
+    text_context = context_data["text"]
+    quiz_key = cache_key(QUIZ_PROMPT_VERSION, text_context, CANONICAL_LANGUAGE)
+    if quiz_cache.get(quiz_key) is not None:
+        # Only the (segment-cached) translation is left to do: one `result` event
+        async def localized():
+            quiz_data = await localized_scenario(rag_engine, text_context, req.target_language)
+            return await finish_scenario(
+                rag_engine, context_data, quiz_data or fallback_quiz(req.target_language), req.image_width
+            )
+
+        events = result_stream(localized())
+    else:
+        # Deltas carry the canonical text as it is written. Other languages only get
+        # `progress` events: the translated scenario arrives in the `result` event
+        fields = ("scenario", "question") if req.target_language == CANONICAL_LANGUAGE else ()
+
+        async def finalize(quiz_data):
+            if quiz_data is not None:
+                quiz_cache.put(quiz_key, quiz_data)
+            quiz_data = await localize_scenario(rag_engine, quiz_data, text_context, req.target_language)
+            return await finish_scenario(
+                rag_engine, context_data, quiz_data or fallback_quiz(req.target_language), req.image_width
+            )
+
+        prompt = quiz_prompt(text_context, CANONICAL_LANGUAGE, rag_engine.boilerplate)
+        events = stream_agent_json("instructor", prompt, QUIZ_SCHEMA, fields, finalize)
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/generate_quiz/all_languages")
+async def generate_quiz_all_languages(req: TranslateAllRequest):
+    # One scenario (same chunk, question and answer key index) in every requested
+    # language: a single generation, then one translation per language.
+    # Languages whose translation failed are listed under `failed`.
+    rag_engine = get_document(req.tenant_id, req.document_id)
+    rag_engine, context_data = await topic_context(rag_engine, req.topic, req.scope)
+    quiz_data = await canonical_scenario(rag_engine, context_data["text"])
+    if quiz_data is None:
+        raise HTTPException(status_code=502, detail="The instructor returned no usable scenario.")
+
+    translated = await asyncio.gather(*[translations.translate_quiz(quiz_data, lang) for lang in req.languages])
+    scenarios = {}
+    for language, localized in zip(req.languages, translated):
+        if localized is not None:
+            scenarios[language] = await finish_scenario(rag_engine, context_data, localized, req.image_width)
+    return {
+        "document_id": rag_engine.document_id,
+        "canonical_language": CANONICAL_LANGUAGE,
+        "scenarios": scenarios,
+        "failed": [lang for lang in req.languages if lang not in scenarios]
+    }
+
+@app.get("/scenario_pool/stats")
+async def scenario_pool_stats():
+    return scenario_pool.stats()
+
+@app.get("/images/{handle}")
+async def get_image(handle: str = Path(pattern=IMAGE_HANDLE_PATTERN), wait: float = 0):
+    # State of a deferred diagram; with `wait`, long-polls up to that many seconds for it to settle
+    state = await image_renders.wait(handle, min(max(wait, 0), IMAGE_LONG_POLL_SECONDS))
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Unknown image '{handle}'")
+    return state
+
+@app.get("/images/{handle}/events")
+async def stream_image(handle: str = Path(pattern=IMAGE_HANDLE_PATTERN)):
+    # SSE: a single `ready` (or `error`) event once the diagram is drawn
+    if image_renders.status(handle) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown image '{handle}'")
+    return StreamingResponse(image_event_stream(image_renders, handle), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def batch_item(rag_engine, context_data, quiz_data, language):
+    # Same shape as /generate_quiz. Only manual images are attached: one SDXL call
+    # per question would cost more than the batching saves
+    page_num = context_data["page"]
+    real_images = rag_engine.pdf_images.get(page_num, [])
+    quiz_data, quiz_id = answer_keys.register(quiz_data, context_data["text"])
+    return {
+        "data": quiz_data,
+        "quiz_id": quiz_id,
+        "context": context_data["text"],
+        "language": language,
+        "image_url": rag_engine.image_fields(random.choice(real_images))["image_url"] if real_images else None,
+        "image_source": f"MANUAL EVIDENCE (PG {page_num + 1})" if real_images else None,
+        "document_id": rag_engine.document_id,
+        "chunk": {k: context_data[k] for k in ("id", "page", "start", "end")}
+    }
+
+async def run_batch_group(rag_engine, chunks, languages):
+    # Canonical scenarios: cached chunks skip the upstream call, the rest share one prompt
+    canonical, missing = {}, []
+    for i, chunk in enumerate(chunks):
+        quiz_data = quiz_cache.get(cache_key(QUIZ_PROMPT_VERSION, chunk["text"], CANONICAL_LANGUAGE))
+        if quiz_data is not None:
+            canonical[i] = quiz_data
+        else:
+            missing.append(i)
+    if missing:
+        # The segments share whatever the instructor's budget leaves after the template
+        room = prompt_room("instructor") - approx_tokens(build_batch_prompt([{"text": ""}] * len(missing), CANONICAL_LANGUAGE))
+        texts = fit_segments([chunks[i]["text"] for i in missing], room, rag_engine.boilerplate)
+        prompt = build_batch_prompt([{**chunks[i], "text": t} for i, t in zip(missing, texts)], CANONICAL_LANGUAGE)
+        scenarios = parse_batch_response(await run_agent("instructor", prompt), len(missing))
+        for j, i in enumerate(missing):
+            if j in scenarios:
+                quiz_cache.put(cache_key(QUIZ_PROMPT_VERSION, chunks[i]["text"], CANONICAL_LANGUAGE), scenarios[j])
+                canonical[i] = scenarios[j]
+
+    # Then one translation pass per language for the whole group
+    ready = sorted(canonical)
+    per_language = await asyncio.gather(*[
+        translations.translate_quizzes([canonical[i] for i in ready], language) for language in languages
+    ])
+    items = []
+    for language, translated in zip(languages, per_language):
+        if translated is None:
+            print(f"🌐 Batch: dropped {len(ready)} {language} scenarios (translation failed)")
+            continue
+        items.extend(batch_item(rag_engine, chunks[i], quiz_data, language) for i, quiz_data in zip(ready, translated))
+    return items
+
+@app.post("/generate_quiz/batch")
+async def generate_quiz_batch(req: BatchQuizRequest):
+    # `count` scenarios per language, several chunks per ERNIE call.
+    # Each chunk is written once and translated into the other languages.
+    # Malformed entries are dropped, so fewer than requested may come back.
+    rag_engine = get_document(req.tenant_id, req.document_id)
+    if not rag_engine.chunks:
+        raise HTTPException(status_code=404, detail="No ingested document to build scenarios from.")
+
+    groups = group(sample_chunks(rag_engine.chunks, req.count))
+    # Each group is generated once (canonical language) and translated into every language
+    tasks = [asyncio.ensure_future(run_batch_group(rag_engine, chunks, req.languages)) for chunks in groups]
+    print(f"📚 Batch: {req.count} x {len(req.languages)} scenarios in {len(tasks)} groups")
+
+    if req.stream:
+        async def jsonl():
+            try:
+                for next_group in asyncio.as_completed(tasks):
+                    for item in await next_group:
+                        yield json.dumps(item, ensure_ascii=False) + "\n"
+            finally:
+                # Client went away: stop the groups that haven't finished
+                for task in tasks:
+                    task.cancel()
+        return StreamingResponse(jsonl(), media_type="application/x-ndjson")
+
+    items = [item for items in await asyncio.gather(*tasks) for item in items]
+    return {
+        "document_id": rag_engine.document_id,
+        "requested": req.count * len(req.languages),
+        "returned": len(items),
+        "scenarios": items
+    }
+
+def resolve_audit_context(req):
+    # (context, document boilerplate) for an audit.
+    # Touch the document so an active session keeps it hot in the corpus store,
+    # and resolve the chunk server-side when the client only sent its ID
+    rag_engine = get_document(req.tenant_id, req.document_id)
+    context = req.context
+    if req.chunk_id is not None and 0 <= req.chunk_id < len(rag_engine.chunks):
+        context = rag_engine.chunks[req.chunk_id]["text"]
+    if not context:
+        raise HTTPException(status_code=400, detail="Send either 'context' or a valid 'chunk_id'.")
+    return context, rag_engine.boilerplate
+
+def audit_prompt(context, req, boilerplate=()):
+    # 3. Agent B (Auditor), within the auditor's token budget
+    return build_prompt(lambda source: f"""
+    Context: {source}
     Question: {req.question}
     User Answer: {req.selected_option}
     
@@ -294,9 +902,70 @@ async def evaluate_answer(req: AnswerRequest):
         "feedback": "Explanation (in {req.target_language}).",
         "citation": "Relevant quote from text (keep original language)."
     }}
-    """
-    raw = run_agent("Compliance Auditor", prompt, req.context)
-    try:
-        return json.loads(raw.replace("```json", "").replace("```", "").strip())
-    except:
-        return {"is_correct": False, "feedback": raw, "citation": "Reference Manual"}
\ No newline at end of file
+    """, context, prompt_room("auditor"), boilerplate)
+
+AUDIT_FALLBACK = {"is_correct": False, "feedback": "The auditor could not verify this answer. Please retry.", "citation": "Reference Manual"}
+
+def grade_locally(req):
+    # Picking one of our own options is graded against the stored key in microseconds;
+    # the auditor only runs for rich feedback and free-text answers
+    if req.rich_feedback or not req.quiz_id:
+        return None
+    return answer_keys.grade(req.quiz_id, req.selected_option)
+
+@app.post("/evaluate_answer")
+async def evaluate_answer(req: AnswerRequest):
+    verdict = grade_locally(req)
+    if verdict is not None:
+        return verdict
+    context, boilerplate = resolve_audit_context(req)
+    audit_key = cache_key(AUDIT_PROMPT_VERSION, context, req.question, req.selected_option, req.target_language)
+    cached = audit_cache.get(audit_key)
+    if cached is not None:
+        return cached
+    result = await run_agent_json("auditor", audit_prompt(context, req, boilerplate), AUDIT_SCHEMA)
+    if result is None:
+        return dict(AUDIT_FALLBACK)
+    audit_cache.put(audit_key, result)
+    return result
+
+@app.post("/evaluate_answer/stream")
+async def evaluate_answer_stream(req: AnswerRequest):
+    # SSE: `delta` events carry the feedback text as ERNIE writes it, `result` the verdict
+    verdict = grade_locally(req)
+    if verdict is not None:
+        return StreamingResponse(result_stream(verdict), media_type="text/event-stream", headers=SSE_HEADERS)
+    context, boilerplate = resolve_audit_context(req)
+    audit_key = cache_key(AUDIT_PROMPT_VERSION, context, req.question, req.selected_option, req.target_language)
+    cached = audit_cache.get(audit_key)
+    if cached is not None:
+        events = result_stream(cached)
+    else:
+        async def finalize(result):
+            if result is None:
+                return dict(AUDIT_FALLBACK)
+            audit_cache.put(audit_key, result)
+            return result
+
+        events = stream_agent_json("auditor", audit_prompt(context, req, boilerplate), AUDIT_SCHEMA, ("feedback",), finalize)
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/llm/stats")
+async def llm_stats():
+    # Upstream calls and per-agent prompt / completion tokens
+    return {"client": llm.stats, "usage": llm.usage.stats()}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "quiz": quiz_cache.stats(),
+        "audit": audit_cache.stats(),
+        "answer_keys": answer_keys.stats(),
+        # Calls that joined an identical in-flight request instead of going upstream
+        "llm_flights": llm.flight_stats(),
+        "image_flights": image_flights.stats(),
+        "generated_images": generated_images.stats(),
+        "image_renders": image_renders.stats(),
+        "translations": translations.stats(),
+        "static_assets": assets.stats(),
+    }
\ No newline at end of file
@@ -0,0 +1,80 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ingestion import open_pdf, FITZ_LOCK
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# BATCHED IN-MEMORY OCR (SCANNED PAGES)
+# ==========================================
+# Role: Reads pages that have no usable text layer.
+# Logic: Pages are rendered straight into NumPy arrays (no PNG encode /
+# decode, no temp files) and recognised on a dedicated thread pool. Pages
+# are handed out in groups: each group opens the PDF and takes FITZ_LOCK
+# once to render all of its pages, then runs PaddleOCR page by page
+# (PaddleOCR.ocr() takes one image per call; text lines within a page are
+# already batched by its recogniser). Each OCR thread owns its own engine
+# instance, since Paddle predictors are not safe to share across threads.
+# ------------------------------------------------------------------
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "2"))
+OCR_PAGES_PER_TASK = int(os.getenv("OCR_PAGES_PER_TASK", "8"))
+OCR_DPI = int(os.getenv("OCR_DPI", "150"))
+# Pages whose text layer has at least this many characters skip OCR entirely
+MIN_TEXT_CHARS = 50
+
+def needs_ocr(text: str) -> bool:
+    return len(text) < MIN_TEXT_CHARS
+
+def render_page_array(page, dpi: int) -> np.ndarray:
+    """Rasterises a page into an HxWx3 BGR uint8 array (the layout PaddleOCR expects)."""
+    pix = page.get_pixmap(dpi=dpi, alpha=False)
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    if pix.n == 1:
+        img = np.repeat(img, 3, axis=2)
+    return np.ascontiguousarray(img[:, :, 2::-1])  # RGB -> BGR
+
+class OcrPipeline:
+    def __init__(self, engine_factory, workers: int = OCR_WORKERS, pages_per_task: int = OCR_PAGES_PER_TASK):
+        self.engine_factory = engine_factory
+        self.pages_per_task = pages_per_task
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr")
+
+    def _engine(self):
+        engine = getattr(self._local, "engine", None)
+        if engine is None:
+            engine = self._local.engine = self.engine_factory()
+        return engine
+
+    def _run_group(self, source, page_nums: list[int], dpi: int) -> dict:
+        engine = self._engine()
+        texts = {}
+        # Rendering holds the fitz lock; the (much slower) recognition runs in parallel
+        with FITZ_LOCK, open_pdf(source) as doc:
+            arrays = [render_page_array(doc[n], dpi) for n in page_nums]
+        for page_num, img in zip(page_nums, arrays):
+            try:
+                result = engine.ocr(img, cls=True)
+                if result and result[0]:
+                    texts[page_num] = " ".join([line[1][0] for line in result[0]])
+            except Exception as e:
+                logger.warning(f"OCR failed on pg {page_num}: {e}")
+        return texts
+
+    def ocr_pages(self, source, page_nums: list[int], dpi: int = None) -> dict:
+        """OCRs the given pages of a PDF (path or in-memory buffer). Returns { page_num: text }."""
+        if not page_nums:
+            return {}
+        dpi = dpi or OCR_DPI
+        step = self.pages_per_task
+        groups = [page_nums[i:i + step] for i in range(0, len(page_nums), step)]
+        logger.info(f"👁️ [OCR] {len(page_nums)} scanned pages in {len(groups)} tasks @ {dpi} DPI")
+        texts = {}
+        for future in [self._executor.submit(self._run_group, source, group, dpi) for group in groups]:
+            texts.update(future.result())
+        return texts
@@ -0,0 +1,163 @@
+import os
+import re
+import math
+import logging
+import threading
+from collections import Counter
+
+from chunking import sentence_spans
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# TOKEN-BUDGETED PROMPTS
+# ==========================================
+# Role: Keeps every agent prompt under a known token count.
+# Logic: Tokens are estimated the way the ERNIE SDK does it
+# (erniebot.utils.token_helper: 1 per Han character, 1.3 per word), with
+# compiled patterns because prompts are measured on every call. Source
+# text is compressed before it is measured: running headers / footers
+# detected per document, page numbers, table-of-contents leaders, legal
+# boilerplate and repeated sentences are dropped. What still doesn't fit
+# the agent's budget (minus the template around it) is cut at a sentence
+# boundary. UsageMeter records prompt / completion tokens per call, as
+# reported by ERNIE, or estimated for streams closed before the end.
+# ------------------------------------------------------------------
+PROMPT_TOKEN_BUDGETS = {
+    "instructor": int(os.getenv("INSTRUCTOR_PROMPT_TOKENS", "1800")),
+    "auditor": int(os.getenv("AUDITOR_PROMPT_TOKENS", "1200")),
+    "translator": int(os.getenv("TRANSLATOR_PROMPT_TOKENS", "1800")),
+}
+# A header / footer must open (close) at least this many pages, and this share of them
+BOILERPLATE_MIN_PAGES = 3
+BOILERPLATE_MIN_SHARE = 0.6
+BOILERPLATE_MAX_WORDS = 16
+
+_HAN = re.compile(r"[\u4e00-\u9fff]")
+_NOT_WORD = re.compile(r"[\u4e00-\u9fff]|[^\w\s]")
+_BOILERPLATE_PATTERNS = [
+    re.compile(r"\b(?:page|pg\.?)\s*\d+(?:\s*(?:of|/)\s*\d+)?\b", re.IGNORECASE),
+    re.compile(r"(?:\s?\.){4,}\s*\d*"),                      # TOC leaders: "Safety ........ 12"
+    re.compile(r"\btable of contents\b", re.IGNORECASE),
+    re.compile(r"(?:©|\(c\)|copyright)[^.]{0,80}?all rights reserved\.?", re.IGNORECASE),
+    re.compile(r"\ball rights reserved\.?", re.IGNORECASE),
+]
+_SPACES = re.compile(r"\s+")
+
+def _token_cost(text: str) -> float:
+    # Unrounded, so costs of sentences joined by spaces add up exactly
+    return len(_HAN.findall(text)) + len(_NOT_WORD.sub(" ", text).split()) * 1.3
+
+def approx_tokens(text: str) -> int:
+    """Same estimate as erniebot.utils.token_helper.approx_num_tokens."""
+    return math.floor(_token_cost(text)) if text else 0
+
+def messages_tokens(messages: list[dict]) -> int:
+    return sum(approx_tokens(m["content"]) for m in messages)
+
+def _strip_patterns(text: str) -> str:
+    for pattern in _BOILERPLATE_PATTERNS:
+        text = pattern.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+def _common_run(texts: list[str], from_end: bool) -> str:
+    # Longest word run shared by enough page openings (or endings)
+    need = max(BOILERPLATE_MIN_PAGES, math.ceil(BOILERPLATE_MIN_SHARE * len(texts)))
+    words = [t.split()[::-1] if from_end else t.split() for t in texts]
+    best = ()
+    for k in range(1, BOILERPLATE_MAX_WORDS + 1):
+        runs = Counter(tuple(w[:k]) for w in words if len(w) > k).most_common(1)
+        # Page furniture never spans a sentence end; stop before running into body text
+        if not runs or runs[0][1] < need or runs[0][0][-1][-1] in ".!?。！？":
+            break
+        best = runs[0][0]
+    # A single shared word is usually just a common opening ("The", "Warning")
+    if len(best) < 2:
+        return ""
+    return " ".join(best[::-1] if from_end else best)
+
+def detect_boilerplate(chunks: list[dict]) -> tuple:
+    """Running header / footer phrases of a document, from its page-opening and page-closing chunks."""
+    openings, closings = {}, {}
+    for chunk in chunks:
+        if chunk["start"] == 0:
+            openings[chunk["page"]] = chunk["text"]
+        if chunk["end"] >= closings.get(chunk["page"], (-1, ""))[0]:
+            closings[chunk["page"]] = (chunk["end"], chunk["text"])
+    if len(openings) < BOILERPLATE_MIN_PAGES:
+        return ()
+    phrases = (
+        _common_run([_strip_patterns(t) for t in openings.values()], from_end=False),
+        _common_run([_strip_patterns(t) for _, t in closings.values()], from_end=True),
+    )
+    return tuple(p for p in phrases if p)
+
+def compress_context(text: str, boilerplate: tuple = ()) -> str:
+    """Source text without page furniture, TOC leaders, legal boilerplate or repeated sentences."""
+    text = _strip_patterns(text)
+    for phrase in boilerplate:
+        text = text.replace(phrase, " ")
+    text = _SPACES.sub(" ", text).strip()
+    seen, sentences = set(), []
+    for start, end in sentence_spans(text):
+        sentence = text[start:end].strip()
+        key = sentence.casefold()
+        if key not in seen:
+            seen.add(key)
+            sentences.append(sentence)
+    return " ".join(sentences)
+
+def fit_to_budget(text: str, max_tokens: int) -> str:
+    """Leading sentences of `text` that fit in `max_tokens` (a lone long sentence is cut by words)."""
+    if approx_tokens(text) <= max_tokens:
+        return text
+    kept, used = [], 0
+    for start, end in sentence_spans(text):
+        sentence = text[start:end].strip()
+        cost = _token_cost(sentence)
+        if used + cost > max_tokens:
+            if not kept:
+                words = sentence.split()
+                while words and approx_tokens(" ".join(words)) > max_tokens:
+                    words = words[:max(1, len(words) * 3 // 4)] if len(words) > 1 else []
+                kept.append(" ".join(words))
+            break
+        kept.append(sentence)
+        used += cost
+    return " ".join(kept)
+
+def build_prompt(render, context: str, budget: int, boilerplate: tuple = ()) -> str:
+    """`render(context)` with the context compressed and trimmed so the whole prompt fits `budget` tokens."""
+    room = max(0, budget - approx_tokens(render("")) - 1)
+    return render(fit_to_budget(compress_context(context, boilerplate), room))
+
+def fit_segments(texts: list[str], room: int, boilerplate: tuple = ()) -> list[str]:
+    """Several source segments sharing `room` tokens evenly (batch prompts)."""
+    share = room // max(1, len(texts))
+    return [fit_to_budget(compress_context(t, boilerplate), share) for t in texts]
+
+class UsageMeter:
+    """Prompt / completion tokens per call, aggregated by tag (agent)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tags = {}
+
+    def record(self, tag: str, prompt_tokens: int, completion_tokens: int, estimated: bool = False):
+        logger.info(f"🧾 [{tag}] {prompt_tokens} prompt + {completion_tokens} completion tokens"
+                    f"{' (estimated)' if estimated else ''}")
+        with self._lock:
+            usage = self._tags.setdefault(tag, {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "max_prompt_tokens": 0, "estimated_calls": 0,
+            })
+            usage["calls"] += 1
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["max_prompt_tokens"] = max(usage["max_prompt_tokens"], prompt_tokens)
+            usage["estimated_calls"] += int(estimated)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                tag: {**usage, "avg_prompt_tokens": round(usage["prompt_tokens"] / usage["calls"], 1)}
+                for tag, usage in self._tags.items()
+            }
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# TWO-TIER AGENT RESPONSE CACHE
+# ==========================================
+# Role: Stops identical scenario / audit requests from paying for ERNIE twice.
+# Logic: Keys hash everything that shapes the answer (chunk text, language,
+# prompt template version, and for audits the question + chosen option).
+# Tier 1 is an in-process LRU with a TTL; tier 2 is one small JSON file per
+# key on disk, so answers survive restarts and are shared by workers.
+# A disk hit is promoted back into memory. The disk tier is kept under
+# RESPONSE_CACHE_DISK_BUDGET_MB per cache: an index of {key: size} in write
+# order, built by one scan at startup (which also deletes expired files), is
+# trimmed oldest-first after each write. Files written by other workers are
+# only counted from the next restart.
+# ------------------------------------------------------------------
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", "response_cache")
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+RESPONSE_CACHE_DISK_BUDGET_MB = int(os.getenv("RESPONSE_CACHE_DISK_BUDGET_MB", "256"))
+
+def cache_key(*parts) -> str:
+    """Stable key over any JSON-serialisable parts (order matters)."""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    def __init__(self, name: str, root: str = RESPONSE_CACHE_DIR,
+                 ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 disk_budget_bytes: int = RESPONSE_CACHE_DISK_BUDGET_MB * 1024 * 1024):
+        self.name = name
+        self.dir = os.path.join(root, name)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.disk_budget_bytes = disk_budget_bytes
+        self._memory = OrderedDict()  # { key: (expires_at, value) }, oldest first
+        self._files = OrderedDict()   # { key: size on disk }, oldest write first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "disk_evicted": 0}
+        os.makedirs(self.dir, exist_ok=True)
+        self._scan()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.dir, key[:2], f"{key}.json")
+
+    def _scan(self):
+        # Startup pass over the disk tier: drops expired files (every entry lives
+        # ttl_seconds from its write) and indexes the rest by write time
+        cutoff = time.time() - self.ttl_seconds
+        found = []
+        for shard in os.scandir(self.dir):
+            if not shard.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith(".json"):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                if st.st_mtime <= cutoff:
+                    self._remove_file(entry.path)
+                    continue
+                found.append((st.st_mtime, entry.name[:-len(".json")], st.st_size))
+        for _, key, size in sorted(found):
+            self._files[key] = size
+            self._disk_bytes += size
+        self._enforce_disk_budget()
+
+    def _remove_file(self, path: str):
+        try: os.remove(path)
+        except OSError: pass
+
+    def get(self, key: str):
+        """Cached value or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry is not None and entry["expires_at"] <= now:
+            self._remove_file(path)
+            with self._lock:
+                self._disk_bytes -= self._files.pop(key, 0)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["disk_hits"] += 1
+            self._remember(key, entry["expires_at"], entry["value"])
+        return entry["value"]
+
+    def put(self, key: str, value):
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self.counters["writes"] += 1
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Response cache write failed ({self.name}): {e}")
+            return
+        with self._lock:
+            self._disk_bytes += size - self._files.pop(key, 0)
+            self._files[key] = size
+        self._enforce_disk_budget()
+
+    def _enforce_disk_budget(self):
+        # Oldest writes go first; they are also the closest to expiring
+        victims = []
+        with self._lock:
+            while self._disk_bytes > self.disk_budget_bytes and len(self._files) > 1:
+                key, size = self._files.popitem(last=False)
+                self._disk_bytes -= size
+                victims.append(key)
+            self.counters["disk_evicted"] += len(victims)
+        for key in victims:
+            self._remove_file(self._path(key))
+
+    def _remember(self, key, expires_at, value):
+        # Caller holds the lock
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self._files),
+                "disk_bytes": self._disk_bytes,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,104 @@
+import os
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# PRE-GENERATED SCENARIO POOL
+# ==========================================
+# Role: Takes ERNIE + SDXL off the /generate_quiz critical path.
+# Logic: Each (tenant, document, language) gets a small buffer of fully
+# built scenarios (quiz JSON, image, context). When a buffer drops below
+# the low watermark a background task refills it up to the high watermark.
+# Filling starts as soon as ingestion finishes. /generate_quiz pops a ready
+# scenario and only builds one inline when the buffer is empty. Only the
+# configured languages get a buffer: any other target_language a client sends
+# is built inline and never triggers background upstream calls.
+# ------------------------------------------------------------------
+SCENARIO_POOL_LOW = int(os.getenv("SCENARIO_POOL_LOW", "2"))
+SCENARIO_POOL_HIGH = int(os.getenv("SCENARIO_POOL_HIGH", "5"))
+# Upstream calls the pool may have in flight across all buffers (live requests aren't counted)
+SCENARIO_POOL_CONCURRENCY = int(os.getenv("SCENARIO_POOL_CONCURRENCY", "2"))
+
+class ScenarioPool:
+    def __init__(self, produce, languages, low: int = SCENARIO_POOL_LOW, high: int = SCENARIO_POOL_HIGH,
+                 concurrency: int = SCENARIO_POOL_CONCURRENCY):
+        """
+        `produce(tenant_id, document_id, language)` is a coroutine returning a scenario, or None to stop filling.
+        `languages` are the only languages buffers are kept for.
+        """
+        self.produce = produce
+        self.languages = frozenset(languages)
+        self.low = low
+        self.high = max(high, low)
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._buffers = {}   # { (tenant_id, document_id, language): deque }
+        self._filling = {}   # { key: asyncio.Task }
+        self._loop = None
+        self.counters = {"hits": 0, "misses": 0, "produced": 0, "unpooled": 0}
+
+    def bind_loop(self, loop):
+        """Called at startup so ingestion threads can schedule fills on the server's loop."""
+        self._loop = loop
+
+    def pop(self, tenant_id: str, document_id: str, language: str):
+        """A ready scenario, or None. Either way the buffer is topped up in the background."""
+        if language not in self.languages:
+            self.counters["unpooled"] += 1
+            return None
+        key = (tenant_id, document_id, language)
+        buffer = self._buffers.get(key)
+        scenario = buffer.popleft() if buffer else None
+        self.counters["hits" if scenario is not None else "misses"] += 1
+        self.ensure(tenant_id, document_id, language)
+        return scenario
+
+    def ensure(self, tenant_id: str, document_id: str, language: str):
+        # Must run on the event loop; use ensure_threadsafe from worker threads
+        if self.high <= 0 or language not in self.languages:
+            return
+        key = (tenant_id, document_id, language)
+        if len(self._buffers.get(key, ())) < self.low and key not in self._filling:
+            self._filling[key] = asyncio.get_running_loop().create_task(self._fill(key))
+
+    def ensure_threadsafe(self, tenant_id: str, document_id: str, language: str):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.ensure, tenant_id, document_id, language)
+
+    async def _fill(self, key):
+        buffer = self._buffers.setdefault(key, deque())
+        try:
+            while len(buffer) < self.high:
+                async with self._semaphore:
+                    scenario = await self.produce(*key)
+                if scenario is None or self._buffers.get(key) is not buffer:
+                    # Producer gave up, or the document was dropped meanwhile
+                    break
+                buffer.append(scenario)
+                self.counters["produced"] += 1
+        except Exception as e:
+            logger.warning(f"Scenario pool fill failed for {key[1][:12]}/{key[2]}: {e}")
+        finally:
+            if self._filling.get(key) is asyncio.current_task():
+                del self._filling[key]
+
+    def drop_document(self, tenant_id: str, document_id: str):
+        for key in [k for k in self._buffers if k[:2] == (tenant_id, document_id)]:
+            del self._buffers[key]
+            task = self._filling.pop(key, None)
+            if task is not None:
+                task.cancel()
+
+    def drop_document_threadsafe(self, tenant_id: str, document_id: str):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.drop_document, tenant_id, document_id)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "buffers": len(self._buffers),
+            "ready": sum(len(b) for b in self._buffers.values()),
+            "filling": len(self._filling),
+        }
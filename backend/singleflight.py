@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import json
+
+# ==========================================
+# SINGLE-FLIGHT CALL COALESCING
+# ==========================================
+# Role: A classroom answering the same question costs one upstream call.
+# Logic: Calls are keyed by a hash of their whitespace-normalised prompt,
+# including the text inside message tuples. Case is kept: "mW" and "MW",
+# or a case-sensitive part code, are different questions.
+# The first caller starts the upstream call as a task; callers arriving
+# while it is in flight await the same task. Once it settles the key is
+# released, so later calls go upstream again (or hit the response cache).
+# Waiters are shielded: one client disconnecting doesn't cancel the call
+# the others are waiting on. Streamed calls are shared the same way
+# (StreamFlight): one upstream iterator is fanned out to every subscriber,
+# and a subscriber joining late first gets the text produced so far.
+# ------------------------------------------------------------------
+def normalize_prompt(text: str) -> str:
+    # Prompts are indented f-strings; indentation and line breaks don't change the answer
+    return " ".join(text.split())
+
+def _normalize(part):
+    if isinstance(part, str):
+        return normalize_prompt(part)
+    if isinstance(part, (list, tuple)):
+        return [_normalize(p) for p in part]
+    return part
+
+def flight_key(*parts) -> str:
+    """Hash of `parts`; strings are normalised wherever they appear (e.g. (role, content) tuples)."""
+    return hashlib.sha256(json.dumps(_normalize(parts), ensure_ascii=False).encode("utf-8")).hexdigest()
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}  # { key: asyncio.Task }
+        self.counters = {"leaders": 0, "coalesced": 0}
+
+    async def run(self, key: str, factory):
+        """Awaits `factory()` (a coroutine function), sharing it with concurrent callers of the same key."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._settle(key, t))
+            self.counters["leaders"] += 1
+        else:
+            self.counters["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _settle(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": len(self._inflight)}
+
+class _SharedStream:
+    """One upstream async iterator, pumped by a task and replayed to each subscriber."""
+    def __init__(self, factory, on_settle):
+        self.deltas = []
+        self.error = None
+        self.done = False
+        self.subscribers = 0
+        self.on_settle = on_settle
+        self._changed = asyncio.Event()
+        self._task = asyncio.ensure_future(self._pump(factory))
+
+    async def _pump(self, factory):
+        try:
+            async for delta in factory():
+                self.deltas.append(delta)
+                self._wake()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self.on_settle(self)
+            self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self):
+        self.subscribers += 1
+        seen = 0
+        try:
+            while True:
+                if seen < len(self.deltas):
+                    seen += 1
+                    yield self.deltas[seen - 1]
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if not self.done:
+                # Stopped early (reply complete, malformed, client gone): later identical
+                # calls start a fresh stream, and nobody left reading means nobody pays for the rest
+                self.on_settle(self)
+                if self.subscribers == 0:
+                    self._task.cancel()
+
+class StreamFlight:
+    def __init__(self):
+        self._inflight = {}  # { key: _SharedStream }
+        self.counters = {"leaders": 0, "coalesced": 0}
+
+    def subscribe(self, key: str, factory):
+        """Async iterator over `factory()` (an async generator function), shared with concurrent subscribers of `key`."""
+        shared = self._inflight.get(key)
+        if shared is None:
+            shared = _SharedStream(factory, lambda s: self._settle(key, s))
+            self._inflight[key] = shared
+            self.counters["leaders"] += 1
+        else:
+            self.counters["coalesced"] += 1
+        return shared.subscribe()
+
+    def _settle(self, key, shared):
+        if self._inflight.get(key) is shared:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": len(self._inflight)}
@@ -0,0 +1,87 @@
+import re
+import json
+import inspect
+import logging
+
+from structured_reply import ReplySchema, STRUCTURED_MAX_RETRIES, structured_events
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# TOKEN STREAMING OVER SSE
+# ==========================================
+# Role: Shows scenario / feedback text while ERNIE is still writing it.
+# Logic: Completion deltas are accumulated into the raw JSON reply. After
+# each delta, the partial value of every watched string field ("scenario",
+# "feedback", ...) is decoded, and only the newly arrived text is pushed
+# as an SSE `delta` event. The reply is schema-checked as it arrives (see
+# structured_reply.py); a malformed attempt is cut off and retried, and a
+# `retry` event tells the client to discard the text shown so far. At the
+# end `finalize(obj)` (obj is None once retries are spent) post-processes
+# the reply into the same payload the non-streaming endpoint returns, sent
+# as a final `result` event (or `error`). With no watched fields (the reply
+# is replaced before it is shown, e.g. translated) deltas are not forwarded;
+# `progress` events carry only how much of the reply has been written.
+# ------------------------------------------------------------------
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def partial_field(raw: str, field: str):
+    """Decoded (possibly still growing) value of a JSON string field in a partial document, or None."""
+    match = re.search(rf'"{re.escape(field)}"\s*:\s*"', raw)
+    if not match:
+        return None
+    i = start = match.end()
+    while i < len(raw):
+        if raw[i] == "\\":
+            i += 2
+            continue
+        if raw[i] == '"':
+            break
+        i += 1
+    body = raw[start:min(i, len(raw))]
+    # Trim a half-received escape (e.g. a trailing "\" or "\u00") until it decodes
+    for cut in range(0, min(6, len(body)) + 1):
+        try:
+            return json.loads(f'"{body[:len(body) - cut]}"')
+        except ValueError:
+            continue
+    return None
+
+async def json_event_stream(open_stream, schema: ReplySchema, fields: tuple, finalize,
+                            max_retries: int = STRUCTURED_MAX_RETRIES, counters: dict = None):
+    """
+    SSE generator over `open_stream()` (a fresh async iterator of text deltas per attempt).
+    Emits `delta` {"field", "text"} events (`progress` {"received"} when `fields`
+    is empty), `retry` {"reason"} when an attempt is abandoned, then `result`
+    with `await finalize(obj)`.
+    """
+    raw = ""
+    sent = {field: 0 for field in fields}
+    try:
+        async for kind, value in structured_events(open_stream, schema, max_retries, counters):
+            if kind == "retry":
+                raw, sent = "", {field: 0 for field in fields}
+                yield sse_event("retry", {"reason": value})
+            elif kind == "delta":
+                raw += value
+                if not fields:
+                    yield sse_event("progress", {"received": len(raw)})
+                for field in fields:
+                    text = partial_field(raw, field)
+                    if text is not None and len(text) > sent[field]:
+                        yield sse_event("delta", {"field": field, "text": text[sent[field]:]})
+                        sent[field] = len(text)
+            else:
+                yield sse_event("result", await finalize(value))
+    except Exception as e:
+        logger.error(f"Streaming reply failed: {e}")
+        yield sse_event("error", {"detail": str(e)})
+
+async def result_stream(payload):
+    """SSE generator for an answer that needs no LLM call (cache / pool hit): just the `result` event."""
+    if inspect.isawaitable(payload):
+        payload = await payload
+    yield sse_event("result", payload)
@@ -0,0 +1,243 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# INCREMENTAL, SCHEMA-CHECKED JSON REPLIES
+# ==========================================
+# Role: Stops paying for generations that are already known to be broken.
+# Logic: Agent replies are streamed and fed through a small JSON state
+# machine as the deltas arrive. The reply is rejected as soon as it can no
+# longer become a valid object of the expected schema: prose instead of
+# JSON, a syntax error, or a known field opening with the wrong type
+# ("options" as a string, "is_correct" as text...). Rejection closes the
+# stream, which drops the upstream connection, and the call is retried up
+# to STRUCTURED_MAX_RETRIES times. The stream is also closed as soon as the
+# top-level object is complete, so trailing chatter is never paid for.
+# ------------------------------------------------------------------
+STRUCTURED_MAX_RETRIES = int(os.getenv("STRUCTURED_MAX_RETRIES", "2"))
+# Text tolerated before the opening brace ("```json", "Here is the JSON:")
+MAX_PREAMBLE_CHARS = 64
+
+class MalformedReply(ValueError):
+    pass
+
+class ReplySchema:
+    """Top-level fields of an expected object: { name: JSON type(s) }. Unknown fields are allowed."""
+    def __init__(self, name: str, required: dict, optional: dict = None):
+        self.name = name
+        self.required = required
+        self.fields = {**(optional or {}), **required}
+
+    def check(self, value) -> dict:
+        if not isinstance(value, dict):
+            raise MalformedReply(f"{self.name}: expected an object")
+        missing = [k for k in self.required if k not in value]
+        if missing:
+            raise MalformedReply(f"{self.name}: missing {', '.join(missing)}")
+        return value
+
+QUIZ_SCHEMA = ReplySchema(
+    "quiz",
+    required={"scenario": "string", "question": "string", "options": "array", "visual_query": "string"},
+    optional={"correct_option": ("number", "string"), "source_span": "string", "explanation": "string"},
+)
+AUDIT_SCHEMA = ReplySchema(
+    "audit",
+    required={"is_correct": "boolean", "feedback": "string"},
+    optional={"citation": "string"},
+)
+
+# JSON type a value starts with, by its first character
+_VALUE_TYPES = {'"': "string", "[": "array", "{": "object", "t": "boolean", "f": "boolean", "n": "null"}
+_LITERALS = ("true", "false", "null")
+
+class IncrementalJSONParser:
+    """
+    Feed text as it arrives. Raises MalformedReply at the first character that
+    rules out a valid `schema` object; `done` turns True once it is complete.
+    """
+    def __init__(self, schema: ReplySchema):
+        self.schema = schema
+        self.text = ""
+        self.done = False
+        self._start = None     # index of the opening brace
+        self._stack = []       # "{" / "[" per open container
+        self._expect = "value" # value | key | colon | comma
+        self._in_string = False
+        self._escape = False
+        self._token = ""       # number / literal being read
+        self._string_is_key = False
+        self._key = ""         # last top-level key
+        self._key_chars = []
+
+    def feed(self, delta: str):
+        for ch in delta:
+            if self.done:
+                break
+            self.text += ch
+            self._step(ch)
+
+    def result(self) -> dict:
+        if not self.done:
+            raise MalformedReply(f"{self.schema.name}: reply ended mid-object")
+        try:
+            value = json.loads(self.text[self._start:], strict=False)
+        except ValueError as e:
+            raise MalformedReply(f"{self.schema.name}: {e}")
+        return self.schema.check(value)
+
+    def _fail(self, why: str):
+        raise MalformedReply(f"{self.schema.name}: {why} at char {len(self.text)}")
+
+    def _step(self, ch: str):
+        if self._start is None:
+            if ch == "{":
+                self._start = len(self.text) - 1
+                self._stack.append("{")
+                self._expect = "key"
+            elif len(self.text) > MAX_PREAMBLE_CHARS:
+                self._fail("no JSON object")
+            return
+
+        if self._in_string:
+            if self._string_is_key and len(self._stack) == 1:
+                self._key_chars.append(ch)
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._string_is_key:
+                    if len(self._stack) == 1:
+                        self._key = json.loads('"' + "".join(self._key_chars), strict=False)
+                    self._expect = "colon"
+                else:
+                    self._expect = "comma"
+            return
+
+        if self._token:
+            if ch.isalnum() or ch in "+-.":
+                self._token += ch
+                if self._token[0].isalpha() and not any(lit.startswith(self._token) for lit in _LITERALS):
+                    self._fail(f"bad literal '{self._token}'")
+                return
+            if self._token[0].isalpha() and self._token not in _LITERALS:
+                self._fail(f"bad literal '{self._token}'")
+            self._token = ""
+            self._expect = "comma"
+
+        if ch.isspace():
+            return
+        container = self._stack[-1]
+        if self._expect == "key":
+            if ch == '"':
+                self._in_string, self._string_is_key, self._key_chars = True, True, []
+            elif ch == "}" and self.text[self._last_significant()] == "{":
+                self._close()
+            else:
+                self._fail("expected a key")
+        elif self._expect == "colon":
+            if ch != ":":
+                self._fail("expected ':'")
+            self._expect = "value"
+        elif self._expect == "value":
+            if ch == "]" and container == "[" and self.text[self._last_significant()] == "[":
+                self._close()
+                return
+            kind = _VALUE_TYPES.get(ch, "number" if ch == "-" or ch.isdigit() else None)
+            if kind is None:
+                self._fail(f"unexpected '{ch}'")
+            if len(self._stack) == 1:
+                self._check_field(kind)
+            if ch in "{[":
+                self._stack.append(ch)
+                self._expect = "key" if ch == "{" else "value"
+            elif ch == '"':
+                self._in_string, self._string_is_key = True, False
+            else:
+                self._token = ch
+        else:  # comma
+            if ch == ",":
+                self._expect = "key" if container == "{" else "value"
+            elif ch == ("}" if container == "{" else "]"):
+                self._close()
+            else:
+                self._fail(f"unexpected '{ch}'")
+
+    def _check_field(self, kind: str):
+        allowed = self.schema.fields.get(self._key)
+        # Optional fields may be null ("citation": null is a usable reply, not a retry)
+        if kind == "null" and self._key not in self.schema.required:
+            return
+        if allowed is not None and kind not in ((allowed,) if isinstance(allowed, str) else allowed):
+            self._fail(f"'{self._key}' is {kind}, expected {allowed}")
+
+    def _last_significant(self) -> int:
+        # Index of the last non-space character before the current one
+        i = len(self.text) - 2
+        while self.text[i].isspace():
+            i -= 1
+        return i
+
+    def _close(self):
+        self._stack.pop()
+        self._expect = "comma"
+        if not self._stack:
+            self.done = True
+
+def parse_reply(raw_text: str, schema: ReplySchema):
+    """Parsed and schema-checked object from a complete reply, or None."""
+    parser = IncrementalJSONParser(schema)
+    try:
+        parser.feed(raw_text)
+        return parser.result()
+    except MalformedReply as e:
+        logger.warning(f"Rejected agent reply: {e}")
+        return None
+
+async def structured_events(open_stream, schema: ReplySchema, max_retries: int = STRUCTURED_MAX_RETRIES,
+                            counters: dict = None):
+    """
+    Async generator over `open_stream()` (a fresh async iterator of text deltas per
+    attempt). Yields ("delta", text) while the reply is valid so far, ("retry", reason)
+    when an attempt is abandoned, and finally ("result", object or None).
+    """
+    counters = counters if counters is not None else {}
+    for attempt in range(max_retries + 1):
+        parser = IncrementalJSONParser(schema)
+        deltas = open_stream()
+        result = None
+        try:
+            async for delta in deltas:
+                parser.feed(delta)
+                yield "delta", delta
+                if parser.done:
+                    break
+            result = parser.result()
+        except Exception as e:
+            # Malformed output and a failed stream (LLMError) both cost one attempt
+            if isinstance(e, MalformedReply):
+                counters["malformed"] = counters.get("malformed", 0) + 1
+            reason = str(e)
+        finally:
+            # Closing mid-reply drops the upstream connection: the rest is never generated
+            await deltas.aclose()
+        if result is not None:
+            yield "result", result
+            return
+        if attempt < max_retries:
+            logger.warning(f"Agent reply abandoned ({reason}), retry {attempt + 1}/{max_retries}")
+            yield "retry", reason
+    counters["exhausted"] = counters.get("exhausted", 0) + 1
+    yield "result", None
+
+async def generate_structured(open_stream, schema: ReplySchema, max_retries: int = STRUCTURED_MAX_RETRIES,
+                              counters: dict = None):
+    """Schema-checked object from a streamed reply (retried when malformed), or None."""
+    async for kind, value in structured_events(open_stream, schema, max_retries, counters):
+        if kind == "result":
+            return value
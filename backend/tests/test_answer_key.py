@@ -0,0 +1,48 @@
+from answer_key import AnswerKeyStore, correct_index, supported_span
+
+QUIZ = {
+    "scenario": "A pump fails.",
+    "question": "What first?",
+    "options": ["Isolate power", "Keep running", "Ignore it", "Call a friend"],
+    "correct_option": 0,
+    "source_span": "Always isolate energy sources.",
+    "explanation": "Isolation comes first.",
+}
+
+def test_correct_index_accepts_index_or_text():
+    assert correct_index(QUIZ) == 0
+    assert correct_index({**QUIZ, "correct_option": " isolate POWER "}) == 0
+    assert correct_index({**QUIZ, "correct_option": "2"}) == 2
+    assert correct_index({**QUIZ, "correct_option": 9}) is None
+    assert correct_index({**QUIZ, "correct_option": True}) is None
+
+def test_register_strips_the_key_and_grades_locally(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = AnswerKeyStore("keys")
+    public, quiz_id = store.register(QUIZ, "context")
+    assert quiz_id and "correct_option" not in public and "explanation" not in public
+    assert store.grade(quiz_id, "Isolate power")["is_correct"] is True
+    verdict = store.grade(quiz_id, "Keep running")
+    assert verdict["is_correct"] is False and verdict["correct_option"] == "Isolate power"
+    # Free text and unknown quizzes go to the auditor
+    assert store.grade(quiz_id, "something else") is None
+    assert store.grade("unknown", "Isolate power") is None
+
+def test_register_without_a_usable_key(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    public, quiz_id = AnswerKeyStore("keys").register({**QUIZ, "correct_option": None}, "context")
+    assert quiz_id is None and public["options"] == QUIZ["options"]
+
+def test_citation_must_occur_in_the_chunk(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = AnswerKeyStore("keys")
+    _, quiz_id = store.register(QUIZ, "Before work:\n  Always isolate   energy\nsources. Then test.")
+    assert store.grade(quiz_id, "Isolate power")["citation"] == "Always isolate energy sources."
+    _, quiz_id = store.register(QUIZ, "Never mentions isolation at all.")
+    assert store.grade(quiz_id, "Isolate power")["citation"] is None
+    assert store.stats()["unsupported_spans"] == 1
+
+def test_supported_span_ignores_whitespace_only():
+    assert supported_span("a  b", "x a\nb y") == "a b"
+    assert supported_span("A b", "x a b y") is None
+    assert supported_span("", "anything") is None
@@ -0,0 +1,26 @@
+import json
+
+from batch_quiz import group, parse_batch_response, sample_chunks
+
+def scenario(**extra):
+    return {"scenario": "S", "question": "Q", "options": ["A", "B"], "visual_query": "pump", **extra}
+
+def test_parse_maps_scenarios_to_their_source():
+    raw = "Here you go:\n" + json.dumps([scenario(source=1), scenario(source=0)]) + "\nDone."
+    parsed = parse_batch_response(raw, 2)
+    assert sorted(parsed) == [0, 1]
+    assert "source" not in parsed[0]
+
+def test_parse_drops_malformed_and_out_of_range_items():
+    items = [scenario(source=0), {"scenario": "missing keys"}, scenario(source=7), scenario(source=0), "text"]
+    assert list(parse_batch_response(json.dumps(items), 3)) == [0]
+
+def test_parse_without_array():
+    assert parse_batch_response("no json here", 2) == {}
+    assert parse_batch_response("[not json]", 2) == {}
+
+def test_sampling_and_grouping():
+    chunks = [{"id": i} for i in range(3)]
+    assert len({c["id"] for c in sample_chunks(chunks, 3)}) == 3
+    assert len(sample_chunks(chunks, 7)) == 7
+    assert [len(g) for g in group(list(range(7)), 3)] == [3, 3, 1]
@@ -0,0 +1,32 @@
+from corpus import CorpusStore
+
+class Engine:
+    def __init__(self, size):
+        self.size = size
+
+    def memory_bytes(self):
+        return self.size
+
+def test_latest_falls_back_per_tenant():
+    store = CorpusStore(memory_budget_bytes=100)
+    store.put("a", "doc1", Engine(10))
+    store.put("b", "doc2", Engine(10))
+    assert store.get("a").size == 10
+    assert store.latest("a") == "doc1"
+    assert store.latest("b") == "doc2"
+
+def test_evicted_latest_is_still_reported():
+    evicted = []
+    store = CorpusStore(memory_budget_bytes=15, on_evict=evicted.append)
+    store.put("a", "doc1", Engine(10))
+    store.put("b", "doc2", Engine(10))
+    assert len(evicted) == 1
+    # The caller sees that tenant a's upload is gone instead of silently getting nothing
+    assert store.latest("a") == "doc1"
+    assert store.get("a") is None
+
+def test_drop_forgets_latest():
+    store = CorpusStore(memory_budget_bytes=100)
+    store.put("a", "doc1", Engine(10))
+    assert store.drop("a", "doc1")
+    assert store.latest("a") is None
@@ -0,0 +1,66 @@
+import numpy as np
+
+from embeddings import EmbeddingCache, EmbeddingPipeline, text_key
+
+DIM = 4
+
+def vec(i):
+    return np.full(DIM, i, dtype=np.float32)
+
+def test_roundtrip_and_reload(tmp_path):
+    cache = EmbeddingCache("model", DIM, root=str(tmp_path))
+    cache.put(["a", "b"], np.stack([vec(1), vec(2)]))
+    reopened = EmbeddingCache("model", DIM, root=str(tmp_path))
+    found = reopened.get(["a", "b", "c"])
+    assert set(found) == {"a", "b"}
+    assert np.array_equal(found["b"], vec(2))
+
+def test_partial_write_is_truncated_and_appends_stay_aligned(tmp_path):
+    cache = EmbeddingCache("model", DIM, root=str(tmp_path))
+    cache.put(["a", "b"], np.stack([vec(1), vec(2)]))
+    # Crash mid-put: the vector landed (plus half a row), its key did not
+    with open(cache.vectors_path, "ab") as f:
+        f.write(vec(3).tobytes() + b"\x00\x00")
+    with open(cache.keys_path, "a", encoding="ascii") as f:
+        f.write("half-written-ke")
+
+    reopened = EmbeddingCache("model", DIM, root=str(tmp_path))
+    assert len(reopened) == 2
+    reopened.put(["c"], vec(4)[None])
+
+    again = EmbeddingCache("model", DIM, root=str(tmp_path))
+    found = again.get(["a", "b", "c"])
+    assert np.array_equal(found["a"], vec(1))
+    assert np.array_equal(found["b"], vec(2))
+    assert np.array_equal(found["c"], vec(4))
+
+def test_keys_file_longer_than_vectors(tmp_path):
+    cache = EmbeddingCache("model", DIM, root=str(tmp_path))
+    cache.put(["a"], vec(1)[None])
+    with open(cache.keys_path, "a", encoding="ascii") as f:
+        f.write("orphan\n")
+
+    reopened = EmbeddingCache("model", DIM, root=str(tmp_path))
+    reopened.put(["b"], vec(2)[None])
+    found = EmbeddingCache("model", DIM, root=str(tmp_path)).get(["a", "b", "orphan"])
+    assert set(found) == {"a", "b"}
+    assert np.array_equal(found["b"], vec(2))
+
+def test_pipeline_encodes_each_text_once(tmp_path):
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        return np.stack([vec(len(t)) for t in texts])
+
+    cache = EmbeddingCache("model", DIM, root=str(tmp_path))
+    first = EmbeddingPipeline(encode, cache, batch_size=2)
+    matrix = first.finish(["x", "yy", "x"])
+    assert matrix.shape == (3, DIM)
+    assert first.encoded == 2
+
+    second = EmbeddingPipeline(encode, cache, batch_size=2)
+    second.finish(["yy", "zzz"])
+    assert second.reused == 1 and second.encoded == 1
+    assert sum(len(c) for c in calls) == 3
+    assert text_key("x") != text_key("yy")
@@ -0,0 +1,27 @@
+from PIL import Image
+
+from image_variants import derive_image, image_fields, pick_variant, refit_image_fields
+
+def url_for(name):
+    return f"/static/doc/{name}"
+
+def test_variants_are_never_upscaled(tmp_path):
+    Image.new("RGB", (800, 400), "red").save(tmp_path / "img.png")
+    meta = derive_image(str(tmp_path), "img.png")
+    assert [v["width"] for v in meta["variants"]] == [320, 640, 800]
+    assert meta["variants"][0]["height"] == 160
+    assert pick_variant(meta, 500)["width"] == 640
+    assert pick_variant(meta, 4000)["width"] == 800
+
+def test_pooled_scenarios_are_refitted_from_their_srcset(tmp_path):
+    Image.new("RGB", (2000, 1000), "blue").save(tmp_path / "img.png")
+    meta = derive_image(str(tmp_path), "img.png")
+    pooled = image_fields("img.png", meta, 640, url_for)
+    assert pooled["image_width"] == 640
+
+    refitted = refit_image_fields(pooled, 1200)
+    assert refitted == {**image_fields("img.png", meta, 1200, url_for)}
+    assert refit_image_fields(pooled, 100)["image_url"] == image_fields("img.png", meta, 100, url_for)["image_url"]
+    # Generated diagrams have no srcset and are left alone
+    diagram = {"image_url": "/static/generated/ab/ab.png", "image_width": None, "image_height": None, "image_srcset": None}
+    assert refit_image_fields(diagram, 1200) == diagram
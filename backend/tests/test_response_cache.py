@@ -0,0 +1,45 @@
+from response_cache import ResponseCache, cache_key
+
+def test_cache_key_depends_on_every_part():
+    assert cache_key("quiz-v2", "text", "English") == cache_key("quiz-v2", "text", "English")
+    assert cache_key("quiz-v2", "text", "English") != cache_key("quiz-v2", "text", "Spanish")
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    ResponseCache("quiz", root=str(tmp_path)).put("k", {"question": "Q"})
+    cache = ResponseCache("quiz", root=str(tmp_path))
+    assert cache.get("k") == {"question": "Q"}
+    assert cache.get("k") == {"question": "Q"}
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["memory_hits"] == 1
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResponseCache("quiz", root=str(tmp_path), ttl_seconds=-1)
+    cache.put("k", "v")
+    assert cache.get("k") is None
+    assert ResponseCache("quiz", root=str(tmp_path)).get("k") is None
+
+def test_memory_tier_is_bounded(tmp_path):
+    cache = ResponseCache("quiz", root=str(tmp_path), max_entries=2)
+    for key in "abc":
+        cache.put(key, key)
+    assert cache.stats()["memory_entries"] == 2
+    # The oldest entry is still on disk
+    assert cache.get("a") == "a"
+
+def test_disk_tier_evicts_oldest_writes_over_budget(tmp_path):
+    cache = ResponseCache("quiz", root=str(tmp_path), max_entries=1)
+    cache.put("k1", "x" * 40)
+    entry_bytes = cache.stats()["disk_bytes"]
+    cache.disk_budget_bytes = 2 * entry_bytes
+    for key in ("k2", "k3"):
+        cache.put(key, "x" * 40)
+    assert cache.stats()["disk_entries"] == 2
+    assert cache.get("k1") is None
+    assert cache.get("k2") == "x" * 40
+    # The budget also holds for what a restart finds on disk
+    assert ResponseCache("quiz", root=str(tmp_path), disk_budget_bytes=entry_bytes).stats()["disk_entries"] == 1
+
+def test_startup_scan_drops_expired_files(tmp_path):
+    ResponseCache("quiz", root=str(tmp_path)).put("k", "v")
+    assert ResponseCache("quiz", root=str(tmp_path), ttl_seconds=-1).stats()["disk_entries"] == 0
+    assert ResponseCache("quiz", root=str(tmp_path)).get("k") is None
@@ -0,0 +1,22 @@
+import asyncio
+
+from scenario_pool import ScenarioPool
+
+def test_only_configured_languages_are_pooled():
+    produced = []
+
+    async def produce(tenant_id, document_id, language):
+        produced.append(language)
+        return {"language": language}
+
+    async def scenario():
+        pool = ScenarioPool(produce, {"English"}, low=1, high=2)
+        assert pool.pop("t", "doc", "English") is None
+        assert pool.pop("t", "doc", "Klingon-" + "x" * 40) is None
+        await asyncio.sleep(0.05)
+        assert pool.pop("t", "doc", "English") == {"language": "English"}
+        return pool.stats()
+
+    stats = asyncio.run(scenario())
+    assert set(produced) == {"English"}
+    assert stats["unpooled"] == 1 and stats["buffers"] == 1
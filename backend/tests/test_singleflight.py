@@ -0,0 +1,117 @@
+import asyncio
+
+from llm_client import LLMClient
+from singleflight import SingleFlight, StreamFlight, flight_key
+
+def test_flight_key_normalises_message_tuples():
+    a = flight_key("ernie-3.5", ("user", "Evaluate   this\n    answer"))
+    b = flight_key("ernie-3.5", ("user", "Evaluate this answer"))
+    assert a == b
+    assert a != flight_key("ernie-3.5", ("user", "Evaluate that answer"))
+
+def test_flight_key_keeps_case():
+    assert flight_key(("user", "Rated 5 mW")) != flight_key(("user", "Rated 5 MW"))
+
+def test_whitespace_variants_share_one_upstream_call():
+    client = LLMClient(access_token="x", base_url="http://127.0.0.1:1")
+    calls = []
+
+    async def upstream(messages, model, tag):
+        calls.append(messages)
+        await asyncio.sleep(0.05)
+        return "reply"
+
+    client._chat = upstream
+
+    async def burst():
+        return await asyncio.gather(
+            client.chat([{"role": "user", "content": "Question:  Isolate?\n   Answer: yes"}]),
+            client.chat([{"role": "user", "content": "Question: Isolate? Answer: yes"}]),
+        )
+
+    assert asyncio.run(burst()) == ["reply", "reply"]
+    assert len(calls) == 1
+    assert client.flight_stats()["coalesced"] == 1
+
+def test_waiters_survive_a_cancelled_caller():
+    flights = SingleFlight()
+
+    async def scenario():
+        async def slow():
+            await asyncio.sleep(0.05)
+            return 42
+
+        first = asyncio.ensure_future(flights.run("k", slow))
+        second = asyncio.ensure_future(flights.run("k", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == 42
+
+class Chunk(dict):
+    def get_result(self):
+        return self["result"]
+
+def fake_stream(client, parts, failures=0):
+    opened = []
+
+    async def create(model, messages, stream=False):
+        opened.append(messages)
+        if len(opened) <= failures:
+            raise asyncio.TimeoutError()
+
+        async def deltas():
+            for i, part in enumerate(parts):
+                await asyncio.sleep(0.01)
+                yield Chunk(result=part, is_end=i == len(parts) - 1)
+        return deltas()
+
+    client._create = create
+    return opened
+
+def test_identical_streams_share_one_upstream_call():
+    client = LLMClient(access_token="x", base_url="http://127.0.0.1:1")
+    opened = fake_stream(client, ["Isolate ", "the ", "breaker."])
+    messages = [{"role": "user", "content": "Explain   the step"}]
+
+    async def read(delay):
+        await asyncio.sleep(delay)
+        return "".join([d async for d in client.stream(messages)])
+
+    async def burst():
+        return await asyncio.gather(read(0), read(0.015))
+
+    assert asyncio.run(burst()) == ["Isolate the breaker."] * 2
+    assert len(opened) == 1
+    assert client.flight_stats()["streams"]["coalesced"] == 1
+
+def test_stream_retries_before_the_first_delta():
+    client = LLMClient(access_token="x", base_url="http://127.0.0.1:1")
+    opened = fake_stream(client, ["ok"], failures=1)
+
+    async def read():
+        return "".join([d async for d in client.stream([{"role": "user", "content": "hi"}])])
+
+    assert asyncio.run(read()) == "ok"
+    assert len(opened) == 2
+    assert client.stats["retries"] == 1
+
+def test_stream_stopped_early_is_not_joined_again():
+    streams = StreamFlight()
+    started = []
+
+    async def source():
+        started.append(1)
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield i
+
+    async def scenario():
+        first = streams.subscribe("k", source)
+        assert await first.__anext__() == 0
+        await first.aclose()
+        return [d async for d in streams.subscribe("k", source)]
+
+    assert asyncio.run(scenario()) == [0, 1, 2]
+    assert len(started) == 2
@@ -0,0 +1,53 @@
+import os
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from asset_store import AssetStore
+from generated_images import ImmutableStaticFiles
+
+def make_app(root, index_path):
+    assets = AssetStore(str(root), budget_bytes=10_000, index_path=str(index_path))
+    app = FastAPI()
+    app.mount("/static", ImmutableStaticFiles(directory=str(root), on_access=assets.touch_path), name="static")
+    return app, assets
+
+def test_index_lives_outside_the_served_root(tmp_path):
+    root = tmp_path / "static_images"
+    (root / "doc1").mkdir(parents=True)
+    (root / "doc1" / "img.png").write_bytes(b"x" * 100)
+    (root / ".asset_index.json").write_text("{}")
+    app, assets = make_app(root, tmp_path / "cache" / "asset_index.json")
+    assets.flush(force=True)
+
+    assert os.path.exists(tmp_path / "cache" / "asset_index.json")
+    assert not os.path.exists(root / ".asset_index.json")
+    client = TestClient(app)
+    response = client.get("/static/doc1/img.png")
+    assert response.status_code == 200
+    assert "immutable" in response.headers["cache-control"]
+
+def test_dotfiles_and_partial_writes_are_not_served(tmp_path):
+    root = tmp_path / "static_images"
+    (root / "doc1").mkdir(parents=True)
+    (root / "doc1" / "img.png.123.tmp").write_bytes(b"half")
+    (root / ".hidden").write_text("secret")
+    app, _ = make_app(root, tmp_path / "asset_index.json")
+    client = TestClient(app)
+    assert client.get("/static/doc1/img.png.123.tmp").status_code == 404
+    assert client.get("/static/.hidden").status_code == 404
+
+def test_lru_eviction_spares_pinned_documents(tmp_path):
+    root = tmp_path / "static_images"
+    for name in ("old", "pinned", "new"):
+        (root / name).mkdir(parents=True)
+        (root / name / "img.png").write_bytes(b"x" * 4000)
+    assets = AssetStore(str(root), budget_bytes=10_000, pinned=lambda: {"pinned"},
+                        index_path=str(tmp_path / "asset_index.json"))
+    assets.touch("old")
+    assets.touch("pinned")
+    (root / "newest").mkdir()
+    (root / "newest" / "img.png").write_bytes(b"x" * 4000)
+    assets.record("newest")
+    assert os.path.exists(root / "pinned") and os.path.exists(root / "newest")
+    assert assets.total_bytes() <= 10_000
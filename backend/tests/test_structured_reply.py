@@ -0,0 +1,61 @@
+import json
+import asyncio
+
+import pytest
+
+from sse_stream import json_event_stream
+from structured_reply import AUDIT_SCHEMA, QUIZ_SCHEMA, IncrementalJSONParser, MalformedReply, parse_reply
+
+QUIZ = {"scenario": "S", "question": "Q", "options": ["A", "B"], "visual_query": "pump", "correct_option": 1}
+
+def feed_in_pieces(schema, text, size=3):
+    parser = IncrementalJSONParser(schema)
+    for i in range(0, len(text), size):
+        parser.feed(text[i:i + size])
+    return parser
+
+def test_streamed_reply_with_preamble_and_trailing_chatter():
+    parser = feed_in_pieces(QUIZ_SCHEMA, "```json\n" + json.dumps(QUIZ) + "\n``` Hope this helps!")
+    assert parser.done
+    assert parser.result() == QUIZ
+
+def test_optional_fields_may_be_null():
+    reply = {"is_correct": True, "feedback": "Good", "citation": None}
+    assert parse_reply(json.dumps(reply), AUDIT_SCHEMA) == reply
+    assert parse_reply(json.dumps({**QUIZ, "explanation": None, "correct_option": None}), QUIZ_SCHEMA) is not None
+
+def test_required_fields_may_not_be_null():
+    assert parse_reply(json.dumps({"is_correct": None, "feedback": "Good"}), AUDIT_SCHEMA) is None
+
+@pytest.mark.parametrize("text", [
+    "Sure! Let me think about the best scenario for this manual section first...",
+    '{"scenario": "S", "options": "A, B"',
+    '{"is_correct": "yes"',
+    '{"scenario": truthy',
+])
+def test_broken_replies_are_rejected_early(text):
+    schema = AUDIT_SCHEMA if "is_correct" in text else QUIZ_SCHEMA
+    with pytest.raises(MalformedReply):
+        feed_in_pieces(schema, text)
+
+def test_missing_required_field():
+    assert parse_reply('{"scenario": "S"}', QUIZ_SCHEMA) is None
+
+def sse_events(fields):
+    async def deltas():
+        text = json.dumps(QUIZ)
+        for i in range(0, len(text), 8):
+            yield text[i:i + 8]
+
+    async def finalize(obj):
+        return {"translated": obj["scenario"]}
+
+    async def collect():
+        return [e async for e in json_event_stream(deltas, QUIZ_SCHEMA, fields, finalize)]
+    return [e.split("\n")[0].removeprefix("event: ") for e in asyncio.run(collect())]
+
+def test_stream_without_watched_fields_sends_progress_only():
+    assert "delta" in sse_events(("scenario",))
+    events = sse_events(())
+    assert "delta" not in events and "progress" in events
+    assert events[-1] == "result"
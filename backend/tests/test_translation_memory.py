@@ -0,0 +1,61 @@
+import asyncio
+import json
+import re
+
+from translation_memory import TRANSLATION_SCHEMA, TranslationMemory, build_translation_prompt
+
+QUIZ = {
+    "scenario": "A pump fails.",
+    "question": "What first?",
+    "options": ["Isolate power", "Keep running"],
+    "correct_option": "Isolate power",
+    "explanation": "Isolation comes first.",
+    "visual_query": "pump valve",
+}
+
+def make_memory(tmp_path, monkeypatch, reply=None, budget=1800):
+    monkeypatch.chdir(tmp_path)
+    prompts = []
+
+    async def translate(prompt):
+        prompts.append(prompt)
+        if reply is not None:
+            return reply
+        segments = json.loads(re.search(r"SEGMENTS:\s*(\[.*\])\s*OUTPUT JSON", prompt, re.DOTALL).group(1))
+        language = re.search(r"SEGMENTS from .+? to (.+?)\.", prompt).group(1)
+        return TRANSLATION_SCHEMA.check({"translations": [f"[{language}] {s}" for s in segments]})
+
+    return TranslationMemory("translations", translate, budget), prompts
+
+def test_quiz_is_translated_and_keeps_its_answer_index(tmp_path, monkeypatch):
+    memory, prompts = make_memory(tmp_path, monkeypatch)
+    spanish = asyncio.run(memory.translate_quiz(QUIZ, "Spanish"))
+    assert spanish["options"] == ["[Spanish] Isolate power", "[Spanish] Keep running"]
+    assert spanish["correct_option"] == 0
+    assert spanish["visual_query"] == "pump valve"
+    assert len(prompts) == 1
+
+def test_segments_are_cached_per_target_language(tmp_path, monkeypatch):
+    memory, prompts = make_memory(tmp_path, monkeypatch)
+    asyncio.run(memory.translate_quiz(QUIZ, "Spanish"))
+    asyncio.run(memory.translate_quiz({**QUIZ, "scenario": "A valve leaks."}, "Spanish"))
+    assert len(prompts) == 2
+    # Only the new scenario text went upstream the second time
+    assert "A valve leaks." in prompts[1] and "Isolate power" not in prompts[1]
+    asyncio.run(memory.translate_quiz(QUIZ, "Spanish"))
+    assert len(prompts) == 2
+    assert asyncio.run(memory.translate_quiz(QUIZ, "English")) == QUIZ
+    assert memory.stats()["segment_hits"] >= 5
+
+def test_missing_segments_are_packed_within_the_budget(tmp_path, monkeypatch):
+    overhead = len(build_translation_prompt([], "English", "German")) // 3
+    memory, prompts = make_memory(tmp_path, monkeypatch, budget=overhead + 40)
+    segments = [f"Step {i}: " + "check the guard " * 6 for i in range(6)]
+    translated = asyncio.run(memory.translate_segments(segments, "German"))
+    assert translated == [f"[German] {s}" for s in segments]
+    assert 1 < len(prompts) <= len(segments)
+
+def test_unusable_replies_fail_the_translation(tmp_path, monkeypatch):
+    memory, _ = make_memory(tmp_path, monkeypatch, reply={"translations": ["only one"]})
+    assert asyncio.run(memory.translate_quiz(QUIZ, "French")) is None
+    assert memory.stats()["failed_calls"] == 1
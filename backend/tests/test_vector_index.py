@@ -0,0 +1,14 @@
+import numpy as np
+
+from vector_index import CorpusIndex
+
+def test_corpus_index_maps_hits_back_to_documents():
+    rng = np.random.default_rng(0)
+    a, b = rng.normal(size=(5, 8)), rng.normal(size=(3, 8))
+    index = CorpusIndex({"doc-a": a, "doc-b": b})
+    assert index.search(b[2], 1) == [("doc-b", 2)]
+    assert index.search(a[0], 1) == [("doc-a", 0)]
+    assert len(index.search(a[0], 20)) == 8
+
+def test_empty_corpus_index_finds_nothing():
+    assert CorpusIndex({}).search(np.zeros(8), 3) == []
@@ -0,0 +1,167 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Optional
+
+from answer_key import correct_index
+from prompt_budget import approx_tokens
+from response_cache import ResponseCache, cache_key
+from structured_reply import ReplySchema
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# TRANSLATION MEMORY ("BABEL FISH")
+# ==========================================
+# Role: A chunk is turned into a scenario once, whatever the number of languages.
+# Logic: The Instructional Architect always writes in CANONICAL_LANGUAGE
+# and that scenario is what the quiz cache holds. Other languages are
+# translations of it, so every team gets the same question (and the same
+# answer key index and diagram). Each translatable string (scenario,
+# question, options, explanation) is a segment, cached on its own by
+# (source language, target language, text): repeated options, re-served
+# scenarios and overlapping batches only pay for segments never seen
+# before. Missing segments go to the translator in as few calls as the
+# translator's token budget allows. visual_query and source_span stay in
+# the canonical language: one drives the image model, the other is a
+# verbatim quote from the manual.
+# ------------------------------------------------------------------
+CANONICAL_LANGUAGE = os.getenv("CANONICAL_LANGUAGE", "English")
+TRANSLATION_LANGUAGES = tuple(
+    lang.strip() for lang in
+    os.getenv("TRANSLATION_LANGUAGES", "English,Chinese,Spanish,French,German,Japanese,Arabic").split(",")
+    if lang.strip()
+)
+# Bump whenever the translation prompt changes, so stale segments are never served
+TRANSLATION_PROMPT_VERSION = "translate-v1"
+
+TRANSLATION_SCHEMA = ReplySchema("translation", required={"translations": "array"})
+
+def _segments(quiz_data: dict) -> list[str]:
+    """Translatable strings of a scenario, in a fixed order (see _with_segments)."""
+    segments = [str(quiz_data.get("scenario", "")), str(quiz_data.get("question", ""))]
+    segments += [str(option) for option in quiz_data.get("options", [])]
+    if quiz_data.get("explanation"):
+        segments.append(str(quiz_data["explanation"]))
+    return segments
+
+def _with_segments(quiz_data: dict, translated: list[str]) -> dict:
+    n_options = len(quiz_data.get("options", []))
+    result = {
+        **quiz_data,
+        "scenario": translated[0],
+        "question": translated[1],
+        "options": translated[2:2 + n_options],
+    }
+    if quiz_data.get("explanation"):
+        result["explanation"] = translated[2 + n_options]
+    # Option text changes with the language; the answer key keeps working off the index
+    if "correct_option" in quiz_data:
+        result["correct_option"] = correct_index(quiz_data)
+    return result
+
+def build_translation_prompt(segments: list[str], source_language: str, target_language: str) -> str:
+    return f"""
+    Translate every string in SEGMENTS from {source_language} to {target_language}.
+    This is industrial safety training: keep part numbers, units, codes and
+    warning keywords exact, and keep the meaning of every option distinct.
+    Return exactly {len(segments)} strings, in the same order.
+
+    SEGMENTS:
+    {json.dumps(segments, ensure_ascii=False)}
+
+    OUTPUT JSON:
+    {{
+        "translations": ["...", "..."]
+    }}
+    """
+
+class TranslationMemory:
+    def __init__(self, name: str, translate, prompt_budget: int):
+        """`translate(prompt)` is a coroutine returning a TRANSLATION_SCHEMA object, or None."""
+        self._segments = ResponseCache(name)
+        self.translate = translate
+        self.prompt_budget = prompt_budget
+        self.counters = {"segment_hits": 0, "segment_misses": 0, "calls": 0, "failed_calls": 0}
+
+    def _key(self, text: str, source_language: str, target_language: str) -> str:
+        return cache_key(TRANSLATION_PROMPT_VERSION, source_language, target_language, text)
+
+    def _pack(self, segments: list[str], source_language: str, target_language: str) -> list[list[str]]:
+        # Greedy: as many segments per call as fit the translator's budget (a lone long one still gets a call)
+        room = self.prompt_budget - approx_tokens(build_translation_prompt([], source_language, target_language))
+        calls, current, used = [], [], 0
+        for segment in segments:
+            cost = approx_tokens(segment) + 2
+            if current and used + cost > room:
+                calls.append(current)
+                current, used = [], 0
+            current.append(segment)
+            used += cost
+        if current:
+            calls.append(current)
+        return calls
+
+    async def _translate_call(self, segments: list[str], source_language: str, target_language: str) -> Optional[dict]:
+        self.counters["calls"] += 1
+        reply = await self.translate(build_translation_prompt(segments, source_language, target_language))
+        translations = (reply or {}).get("translations")
+        if (not isinstance(translations, list) or len(translations) != len(segments)
+                or not all(isinstance(t, str) and t.strip() for t in translations)):
+            self.counters["failed_calls"] += 1
+            logger.warning(f"🌐 [TRANSLATOR] Unusable reply for {len(segments)} segments -> {target_language}")
+            return None
+        for segment, translation in zip(segments, translations):
+            self._segments.put(self._key(segment, source_language, target_language), translation)
+        return dict(zip(segments, translations))
+
+    async def translate_segments(self, segments: list[str], target_language: str,
+                                 source_language: str = CANONICAL_LANGUAGE) -> Optional[list[str]]:
+        """`segments` in `target_language` (cached ones are free), or None if a translator call failed."""
+        if target_language == source_language:
+            return list(segments)
+        found, missing = {}, []
+        for segment in dict.fromkeys(segments):
+            cached = segment if not segment.strip() else self._segments.get(self._key(segment, source_language, target_language))
+            if cached is None:
+                missing.append(segment)
+            else:
+                found[segment] = cached
+        self.counters["segment_hits"] += len(found)
+        self.counters["segment_misses"] += len(missing)
+        if missing:
+            replies = await asyncio.gather(*[
+                self._translate_call(batch, source_language, target_language)
+                for batch in self._pack(missing, source_language, target_language)
+            ])
+            if any(reply is None for reply in replies):
+                return None
+            for reply in replies:
+                found.update(reply)
+        return [found[segment] for segment in segments]
+
+    async def translate_quizzes(self, quizzes: list[dict], target_language: str,
+                                source_language: str = CANONICAL_LANGUAGE) -> Optional[list[dict]]:
+        """Canonical scenarios in `target_language`, all segments sent together; None on failure."""
+        if target_language == source_language:
+            return list(quizzes)
+        per_quiz = [_segments(quiz) for quiz in quizzes]
+        translated = await self.translate_segments(
+            [s for segments in per_quiz for s in segments], target_language, source_language
+        )
+        if translated is None:
+            return None
+        results, offset = [], 0
+        for quiz, segments in zip(quizzes, per_quiz):
+            results.append(_with_segments(quiz, translated[offset:offset + len(segments)]))
+            offset += len(segments)
+        return results
+
+    async def translate_quiz(self, quiz_data: dict, target_language: str,
+                             source_language: str = CANONICAL_LANGUAGE) -> Optional[dict]:
+        translated = await self.translate_quizzes([quiz_data], target_language, source_language)
+        return translated[0] if translated else None
+
+    def stats(self) -> dict:
+        return {**self.counters, "store": self._segments.stats()}
@@ -0,0 +1,95 @@
+import os
+import math
+import logging
+
+import numpy as np
+import faiss
+
+logger = logging.getLogger("SkillSync")
+
+# ==========================================
+# VECTOR INDEX (EXACT -> APPROXIMATE)
+# ==========================================
+# Role: Builds, loads and queries the per-document FAISS index, and the
+# tenant-wide index over every loaded document of a tenant (CorpusIndex).
+# Logic: Small documents keep an exact IndexFlatL2 (a brute-force scan of a
+# few thousand vectors is already sub-millisecond). From ANN_MIN_VECTORS up,
+# an approximate index is built instead: HNSW (no training, best recall per
+# millisecond) or IVF-Flat (cheaper to build, inverted lists can be memory
+# mapped). Either is persisted with faiss.write_index alongside the cache.
+# A CorpusIndex concatenates several documents' embeddings into one index
+# (same exact/ANN choice, on the combined size) and maps hits back to
+# (document_id, row); it lives in memory and is rebuilt when the set of
+# documents changes.
+# ------------------------------------------------------------------
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "20000"))
+ANN_INDEX_KIND = os.getenv("ANN_INDEX_KIND", "hnsw")  # hnsw | ivf
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+# Training sample cap for IVF k-means; nlist is also capped so each list gets >= 39 points
+IVF_MAX_TRAIN = 100_000
+
+def build_index(embeddings: np.ndarray):
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, dim = embeddings.shape
+    if n < ANN_MIN_VECTORS:
+        index = faiss.IndexFlatL2(dim)
+    elif ANN_INDEX_KIND == "ivf":
+        nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        sample = embeddings
+        if n > IVF_MAX_TRAIN:
+            sample = embeddings[np.random.default_rng(0).choice(n, IVF_MAX_TRAIN, replace=False)]
+        index.train(sample)
+        logger.info(f"🧭 [INDEX] IVF-Flat, {nlist} lists over {n} vectors")
+    else:
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        logger.info(f"🧭 [INDEX] HNSW (M={HNSW_M}) over {n} vectors")
+    index.add(embeddings)
+    configure_search(index)
+    return index
+
+def configure_search(index):
+    # Search-time knobs aren't reliably round-tripped through write_index, so set them on load too
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = IVF_NPROBE
+    return index
+
+def read_index(path: str):
+    # Memory-mapped where the index type supports it (flat, IVF); HNSW graphs are read into RAM
+    try:
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        index = faiss.read_index(path)
+    return configure_search(index)
+
+def search(index, query: np.ndarray, k: int) -> list[int]:
+    """Row IDs of the k nearest vectors to `query`, best first."""
+    if index is None or index.ntotal == 0:
+        return []
+    query = np.ascontiguousarray(query, dtype=np.float32).reshape(1, -1)
+    _, ids = index.search(query, min(k, index.ntotal))
+    return [int(i) for i in ids[0] if i >= 0]
+
+class CorpusIndex:
+    def __init__(self, parts: dict):
+        """`parts` maps document IDs to their embedding matrices (row i = chunk i)."""
+        self.document_ids = list(parts)
+        self.offsets = np.cumsum([0] + [len(parts[d]) for d in self.document_ids])
+        self.index = None
+        if self.offsets[-1]:
+            self.index = build_index(np.concatenate([np.asarray(parts[d], dtype=np.float32) for d in self.document_ids]))
+
+    def search(self, query: np.ndarray, k: int) -> list[tuple[str, int]]:
+        """(document_id, row) of the k nearest chunks across all documents, best first."""
+        hits = []
+        for i in search(self.index, query, k):
+            part = int(np.searchsorted(self.offsets, i, side="right")) - 1
+            hits.append((self.document_ids[part], i - int(self.offsets[part])))
+        return hits
+
+    def memory_bytes(self) -> int:
+        return 0 if self.index is None else self.index.ntotal * self.index.d * 4
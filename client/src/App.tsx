@@ -42,6 +42,8 @@ function App() {
   const [fileName, setFileName] = useState('');
   const [uploadError, setUploadError] = useState('');
   const [bootLogs, setBootLogs] = useState<string[]>([]);
+  // Every quiz / audit call names this upload, so other sessions' uploads never replace it
+  const [documentId, setDocumentId] = useState<string | null>(null);
   
   // Auto-scroll to bottom of logs
   const logsEndRef = useRef<HTMLDivElement>(null);
@@ -68,16 +70,35 @@ function App() {
       
       if (!response.ok) throw new Error('Uplink Interrupted');
       const data = await response.json();
+
+      // Ingestion runs in the background; wait for the job's final SSE event
+      const info = data.job_id ? await waitForIngestion(data.job_id) : data.info;
+      setDocumentId(data.document_id ?? null);
       
       setLoading(false);
       setPhase('training');
-      runBootSequence(data.info);
+      runBootSequence(info);
     } catch (err) {
       setLoading(false);
       setUploadError('CONNECTION REFUSED: Check Mainframe Status');
     }
   };
 
+  const waitForIngestion = (jobId: string) =>
+    new Promise<string>((resolve, reject) => {
+      const events = new EventSource(`${BACKEND_URL}/jobs/${jobId}/events`);
+      events.addEventListener('done', (e) => {
+        events.close();
+        resolve(JSON.parse((e as MessageEvent).data).info);
+      });
+      events.addEventListener('error', (e) => {
+        events.close();
+        // Server-sent 'error' events carry data; a bare connection error does not
+        const data = (e as MessageEvent).data;
+        reject(new Error(data ? JSON.parse(data).info : 'Uplink Interrupted'));
+      });
+    });
+
   const runBootSequence = (serverMessage?: string) => {
     const logs = [
       "> INITIALIZING NEURAL LINK...",
@@ -222,7 +243,7 @@ function App() {
         )}
 
         {/* PHASE: SIMULATION */}
-        {phase === 'simulation' && <SimulationInterface />}
+        {phase === 'simulation' && <SimulationInterface documentId={documentId} />}
       </main>
     </div>
   );
@@ -17,12 +17,16 @@ const API_BASE_URL =
     ? 'http://localhost:8000'
     : 'https://skillsync-kdzy.onrender.com');
 
-const SimulationInterface = () => {
+// document_id returned by /upload; null falls back to the tenant's latest upload
+const SimulationInterface = ({ documentId }: { documentId: string | null }) => {
   const [quiz, setQuiz] = useState<any>(null);
   const [loading, setLoading] = useState(false);
   const [selectedLanguage, setSelectedLanguage] = useState("English");
   const [feedback, setFeedback] = useState<any>(null);
   const [showRef, setShowRef] = useState(false);
+  // Text streamed in while ERNIE is still writing (scenario/question, then audit feedback)
+  const [draft, setDraft] = useState<Record<string, string> | null>(null);
+  const [feedbackDraft, setFeedbackDraft] = useState("");
 
   // --- VOICE STATE ---
   const [isSpeaking, setIsSpeaking] = useState(false);
@@ -118,22 +122,67 @@ const SimulationInterface = () => {
   // ==========================================
   // 3. DATA FETCHING
   // ==========================================
+  // POSTs to an SSE endpoint: `delta` events are passed to onDelta as they
+  // arrive, and the promise resolves with the final `result` payload.
+  // `retry` means the server dropped a malformed reply and started over.
+  const streamEvents = async (
+    path: string, body: object,
+    onDelta: (field: string, text: string) => void, onRetry: () => void,
+  ) => {
+    const res = await fetch(`${API_BASE_URL}${path}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body),
+    });
+    if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let end;
+      while ((end = buffer.indexOf("\n\n")) >= 0) {
+        const frame = buffer.slice(0, end);
+        buffer = buffer.slice(end + 2);
+        const event = frame.match(/^event: (.*)$/m)?.[1];
+        const data = frame.match(/^data: (.*)$/m)?.[1];
+        if (!event || data === undefined) continue;
+        const payload = JSON.parse(data);
+        if (event === "delta") onDelta(payload.field, payload.text);
+        else if (event === "retry") onRetry();
+        else if (event === "result") return payload;
+        else if (event === "error") throw new Error(payload.detail);
+      }
+    }
+    throw new Error("Stream closed before the result arrived");
+  };
+
   const fetchScenario = async () => {
     setLoading(true);
     setFeedback(null);
+    setFeedbackDraft("");
     setTranscript("");
+    setDraft({});
     window.speechSynthesis.cancel(); // Stop speaking on new load
     try {
-      const res = await fetch(`${API_BASE_URL}/generate_quiz`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ target_language: selectedLanguage }),
-      });
-      const data = await res.json();
+      const data = await streamEvents(
+        "/generate_quiz/stream",
+        // The server picks the manual image variant that fits the visual monitor
+        {
+          target_language: selectedLanguage,
+          image_width: Math.round(640 * (window.devicePixelRatio || 1)),
+          document_id: documentId ?? undefined,
+        },
+        (field, text) => setDraft(d => ({ ...d, [field]: (d?.[field] || "") + text })),
+        () => setDraft({}),
+      );
       setQuiz(data);
     } catch (err) {
       console.error("Link Failure");
     } finally {
+      setDraft(null);
       setLoading(false);
     }
   };
@@ -141,18 +190,22 @@ const SimulationInterface = () => {
   const submitAnswer = async (option: string) => {
     if (loading || feedback) return;
     setLoading(true);
+    setFeedbackDraft("");
     try {
-      const res = await fetch(`${API_BASE_URL}/evaluate_answer`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
+      const result = await streamEvents(
+        "/evaluate_answer/stream",
+        {
           question: quiz.data.question,
           selected_option: option,
+          // Lets the server grade against its stored answer key instead of calling the auditor
+          quiz_id: quiz.quiz_id,
           context: quiz.context,
-          target_language: selectedLanguage
-        }),
-      });
-      const result = await res.json();
+          target_language: selectedLanguage,
+          document_id: quiz.document_id ?? documentId ?? undefined
+        },
+        (_field, text) => setFeedbackDraft(d => d + text),
+        () => setFeedbackDraft(""),
+      );
       setFeedback(result);
       
       // Auto-read feedback
@@ -170,6 +223,21 @@ const SimulationInterface = () => {
 
   useEffect(() => { fetchScenario(); }, []);
 
+  // Generated diagrams arrive after the scenario: wait for the image handle to resolve
+  useEffect(() => {
+    const handle = quiz?.image_status === "pending" ? quiz.image_handle : null;
+    if (!handle) return;
+    const source = new EventSource(`${API_BASE_URL}/images/${handle}/events`);
+    const resolve = (e: MessageEvent) => {
+      const image = JSON.parse(e.data);
+      setQuiz((q: any) => q?.image_handle === handle ? { ...q, image_url: image.url, image_status: image.status } : q);
+      source.close();
+    };
+    source.addEventListener("ready", resolve);
+    source.addEventListener("error", (e) => (e as MessageEvent).data ? resolve(e as MessageEvent) : source.close());
+    return () => source.close();
+  }, [quiz?.image_handle, quiz?.image_status]);
+
   return (
     <div className="w-full max-w-7xl grid grid-cols-12 gap-6 animate-in fade-in zoom-in duration-700">
       
@@ -207,7 +275,20 @@ const SimulationInterface = () => {
         <div className="relative group">
           <div className="absolute -inset-0.5 bg-cyan-500/20 rounded-xl opacity-0 group-hover:opacity-100 transition duration-500"></div>
           <div className="relative bg-slate-900/80 border border-white/10 p-8 rounded-xl backdrop-blur-xl min-h-[400px] flex flex-col justify-between">
-            {quiz ? (
+            {draft && (draft.scenario || draft.question) ? (
+              <div className="space-y-6">
+                <div className="flex items-center gap-2">
+                  <Zap size={18} className="text-yellow-500 animate-pulse" />
+                  <span className="text-xs font-bold tracking-[0.4em] text-slate-500 uppercase">Receiving Objective...</span>
+                </div>
+                <p className="text-xl text-white leading-relaxed font-light">{draft.scenario}</p>
+                {draft.question && (
+                  <div className="p-4 bg-cyan-500/5 border-l-4 border-cyan-500">
+                    <p className="text-cyan-400 font-bold italic">{draft.question}</p>
+                  </div>
+                )}
+              </div>
+            ) : quiz ? (
               <>
                 <div className="space-y-6">
                   <div className="flex items-center justify-between">
@@ -284,7 +365,15 @@ const SimulationInterface = () => {
           <div className="absolute top-0 left-0 w-full h-1 bg-cyan-500/50 z-10 animate-scanline"></div>
           <div className="aspect-video relative flex items-center justify-center bg-[#050505]">
             {quiz?.image_url ? (
-              <img src={quiz.image_url} alt="Evidence" className="w-full h-full object-contain opacity-80 group-hover:opacity-100 transition-opacity" />
+              <img
+                src={quiz.image_url} srcSet={quiz.image_srcset || undefined} sizes="(min-width: 1024px) 40vw, 100vw"
+                width={quiz.image_width || undefined} height={quiz.image_height || undefined}
+                alt="Evidence" className="w-full h-full object-contain opacity-80 group-hover:opacity-100 transition-opacity" />
+            ) : quiz?.image_status === "pending" ? (
+              <div className="flex flex-col items-center gap-2 text-cyan-800 animate-pulse">
+                <Eye size={48} />
+                <span className="text-[10px] font-bold">RENDERING_VISUAL_FEED...</span>
+              </div>
             ) : (
               <div className="flex flex-col items-center gap-2 text-slate-800">
                 <Eye size={48} />
@@ -307,8 +396,12 @@ const SimulationInterface = () => {
         }`}>
           {!feedback ? (
             <div className="h-full flex flex-col items-center justify-center text-slate-600 gap-4">
-              <Shield size={40} className="opacity-20" />
-              <p className="text-[10px] font-bold tracking-[0.3em]">WAITING FOR INSTRUCTOR AUDIT...</p>
+              <Shield size={40} className={feedbackDraft ? "opacity-40 animate-pulse" : "opacity-20"} />
+              {feedbackDraft ? (
+                <p className="text-sm text-slate-400 leading-relaxed italic">"{feedbackDraft}"</p>
+              ) : (
+                <p className="text-[10px] font-bold tracking-[0.3em]">WAITING FOR INSTRUCTOR AUDIT...</p>
+              )}
             </div>
           ) : (
             <div className="space-y-4 animate-in slide-in-from-bottom-4 duration-500">
@@ -332,6 +425,9 @@ const SimulationInterface = () => {
               <p className="text-sm text-slate-300 leading-relaxed italic">
                 "{feedback.feedback}"
               </p>
+              {!feedback.is_correct && feedback.correct_option && (
+                <p className="text-xs text-green-500/80 font-bold">CORRECT ACTION: {feedback.correct_option}</p>
+              )}
 
               <div className="pt-4">
                 <button 